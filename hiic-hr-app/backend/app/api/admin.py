@@ -3,6 +3,11 @@ from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from supabase import create_client, Client
 from app.core.config import settings
+from app.services.sql_service import sql_service
+from app.services.data_reload_service import data_reload_service
+from app.services.openrouter_service import openrouter_service
+from app.services.question_classifier import question_classifier
+from app.services.local_classifier import local_classifier
 import logging
 import json
 
@@ -99,4 +104,63 @@ async def create_admin(request: AdminCreateRequest):
             
     except Exception as e:
         logger.error(f"创建管理员账号时发生错误: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"创建管理员账号失败: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"创建管理员账号失败: {str(e)}")
+
+
+@router.get("/sql/stats")
+async def get_sql_stats():
+    """获取SQL服务运行统计，包括索引顾问新增的索引"""
+    return sql_service.get_stats()
+
+
+@router.post("/data/reload")
+async def reload_data():
+    """重新加载HR数据，新数据构建完成后原子替换，无需重启服务"""
+    if data_reload_service.is_running:
+        raise HTTPException(status_code=409, detail="数据正在重新加载中，请稍后再试")
+    try:
+        return await data_reload_service.reload(trigger="manual")
+    except Exception as e:
+        logger.error(f"重新加载数据失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"重新加载数据失败: {str(e)}")
+
+
+@router.get("/data/reload/status")
+async def get_reload_status():
+    """获取数据重新加载状态和当前数据版本"""
+    return {**data_reload_service.status(), "data": sql_service.snapshot.info()}
+
+
+@router.get("/llm/stats")
+async def get_llm_stats():
+    """获取大模型调用统计，包括各模型的熔断器状态"""
+    return openrouter_service.get_stats()
+
+
+@router.get("/llm/metrics")
+async def get_llm_metrics():
+    """获取按模型类型统计的大模型调用指标（token用量、延迟、重试和错误）"""
+    return openrouter_service.get_metrics()
+
+
+@router.post("/llm/metrics/reset")
+async def reset_llm_metrics():
+    """清空大模型调用指标，便于调整配置后重新观察"""
+    openrouter_service.metrics.reset()
+    return {"success": True}
+
+
+@router.get("/classifier/cache")
+async def get_classifier_cache_stats():
+    """获取问题分类缓存的条目数、命中率和淘汰情况"""
+    return question_classifier.get_cache_stats()
+
+
+@router.get("/classifier/stats")
+async def get_classifier_stats():
+    """获取问题分类统计（按类型和来源）以及后台写入情况"""
+    return {
+        "classifications": question_classifier.get_stats(),
+        "local_model": local_classifier.stats() if local_classifier else None,
+        "writer": question_classifier.writer.stats()
+    }
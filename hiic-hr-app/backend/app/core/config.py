@@ -41,6 +41,17 @@ class Settings(BaseSettings):
     CLASSIFIER_MODEL: str = os.getenv("CLASSIFIER_MODEL", "google/gemma-3-7b-it:free")
     CLASSIFIER_TEMPERATURE: float = float(os.getenv("CLASSIFIER_TEMPERATURE", "0.1"))
     CLASSIFIER_MAX_TOKENS: int = int(os.getenv("CLASSIFIER_MAX_TOKENS", "10"))
+    # 问题分类结果缓存（有界LRU，默认7天过期）
+    CLASSIFIER_CACHE_MAX_ENTRIES: int = int(os.getenv("CLASSIFIER_CACHE_MAX_ENTRIES", "10000"))
+    CLASSIFIER_CACHE_TTL_SECONDS: float = float(os.getenv("CLASSIFIER_CACHE_TTL_SECONDS", "604800"))
+    # 分类缓存快照和监控数据的后台写入间隔（秒）
+    CLASSIFIER_PERSIST_INTERVAL_SECONDS: float = float(os.getenv("CLASSIFIER_PERSIST_INTERVAL_SECONDS", "5"))
+    # 本地分类模型（快速规则无法判断时使用，置信度低于阈值才调用大模型；路径留空则使用backend/cache/local_classifier.npz）
+    LOCAL_CLASSIFIER_ENABLED: bool = os.getenv("LOCAL_CLASSIFIER_ENABLED", "True").lower() == "true"
+    LOCAL_CLASSIFIER_THRESHOLD: float = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.8"))
+    LOCAL_CLASSIFIER_PATH: str = os.getenv("LOCAL_CLASSIFIER_PATH", "")
+    # 预测性SQL生成：快速分类无法判断、需要调用大模型分类时，同时开始生成SQL，分类结果不需要SQL时取消
+    SPECULATIVE_SQL_ENABLED: bool = os.getenv("SPECULATIVE_SQL_ENABLED", "True").lower() == "true"
     
     # 聊天服务模型（通用对话）
     CHAT_MODEL: str = os.getenv("CHAT_MODEL", "google/gemma-3-27b-it:free")
@@ -66,6 +77,69 @@ class Settings(BaseSettings):
     MODEL_RETRY_COUNT: int = int(os.getenv("MODEL_RETRY_COUNT", "3"))
     MODEL_TIMEOUT: int = int(os.getenv("MODEL_TIMEOUT", "20"))
     MODEL_RETRY_INTERVAL: int = int(os.getenv("MODEL_RETRY_INTERVAL", "2"))
+    MODEL_RETRY_MAX_WAIT: float = float(os.getenv("MODEL_RETRY_MAX_WAIT", "10"))
+    
+    # 模型熔断配置（连续失败达到阈值后打开熔断，经过恢复时间后放行一个探测请求）
+    MODEL_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("MODEL_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    MODEL_CIRCUIT_RECOVERY_SECONDS: float = float(os.getenv("MODEL_CIRCUIT_RECOVERY_SECONDS", "30"))
+    # 主模型熔断或重试耗尽时是否切换到备用模型
+    MODEL_FAILOVER_ENABLED: bool = os.getenv("MODEL_FAILOVER_ENABLED", "True").lower() == "true"
+    
+    # 请求对冲配置：主模型超过近期延迟的指定分位数仍未返回时，向备用模型发出同样的请求
+    MODEL_HEDGE_TYPES: str = os.getenv("MODEL_HEDGE_TYPES", "")
+    MODEL_HEDGE_PERCENTILE: float = float(os.getenv("MODEL_HEDGE_PERCENTILE", "0.9"))
+    MODEL_HEDGE_MIN_SAMPLES: int = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+    MODEL_HEDGE_WINDOW: int = int(os.getenv("MODEL_HEDGE_WINDOW", "200"))
+    
+    # 合并相同的并发请求（模型、温度、最大token数和消息完全相同时只发一次上游调用）
+    MODEL_COALESCE_ENABLED: bool = os.getenv("MODEL_COALESCE_ENABLED", "True").lower() == "true"
+    
+    # 大模型并发限制（按模型类型，覆盖格式如"classifier=16,sql=4"）
+    MODEL_MAX_CONCURRENCY: int = int(os.getenv("MODEL_MAX_CONCURRENCY", "8"))
+    MODEL_CONCURRENCY_OVERRIDES: str = os.getenv("MODEL_CONCURRENCY_OVERRIDES", "")
+    MODEL_MAX_QUEUE: int = int(os.getenv("MODEL_MAX_QUEUE", "32"))
+    MODEL_QUEUE_TIMEOUT: float = float(os.getenv("MODEL_QUEUE_TIMEOUT", "15"))
+    
+    # 大模型响应磁盘缓存（只缓存确定性的模型类型，路径留空则使用backend/cache/llm_response_cache.db）
+    MODEL_CACHE_TYPES: str = os.getenv("MODEL_CACHE_TYPES", "classifier,sql")
+    MODEL_CACHE_MAX_ENTRIES: int = int(os.getenv("MODEL_CACHE_MAX_ENTRIES", "5000"))
+    MODEL_CACHE_TTL_SECONDS: float = float(os.getenv("MODEL_CACHE_TTL_SECONDS", "86400"))
+    MODEL_CACHE_PATH: str = os.getenv("MODEL_CACHE_PATH", "")
+    
+    # OpenRouter HTTP连接池配置
+    OPENROUTER_MAX_CONNECTIONS: int = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "50"))
+    OPENROUTER_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("OPENROUTER_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    OPENROUTER_KEEPALIVE_EXPIRY: float = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "60"))
+    
+    # SQL只读连接池配置
+    SQL_POOL_SIZE: int = int(os.getenv("SQL_POOL_SIZE", "4"))
+    SQL_SNAPSHOT_DIR: str = os.getenv("SQL_SNAPSHOT_DIR", "")
+    
+    # SQL执行线程池配置
+    SQL_EXECUTOR_WORKERS: int = int(os.getenv("SQL_EXECUTOR_WORKERS", "4"))
+    SQL_EXECUTOR_MAX_QUEUE: int = int(os.getenv("SQL_EXECUTOR_MAX_QUEUE", "32"))
+    
+    # SQL生成提示的token预算
+    SQL_PROMPT_TOKEN_BUDGET: int = int(os.getenv("SQL_PROMPT_TOKEN_BUDGET", "800"))
+    
+    # 查询结果精简配置（超过该行数时只向大模型发送摘要）
+    RESULT_MAX_RAW_ROWS: int = int(os.getenv("RESULT_MAX_RAW_ROWS", "20"))
+    RESULT_SAMPLE_ROWS: int = int(os.getenv("RESULT_SAMPLE_ROWS", "15"))
+    
+    # 简单聚合结果直接按模板生成回答，不再调用大模型
+    ANSWER_RENDERER_ENABLED: bool = os.getenv("ANSWER_RENDERER_ENABLED", "True").lower() == "true"
+    
+    # 数据重新加载配置（间隔为0时只能由管理员手动触发；旧数据至少保留宽限期，等待进行中的请求结束）
+    DATA_RELOAD_INTERVAL_SECONDS: int = int(os.getenv("DATA_RELOAD_INTERVAL_SECONDS", "0"))
+    DATA_RELOAD_GRACE_SECONDS: int = int(os.getenv("DATA_RELOAD_GRACE_SECONDS", "120"))
+    
+    # SQL索引顾问配置（慢查询总是记录执行计划，其余按1/N抽样；索引由后台维护任务按间隔创建）
+    SQL_INDEX_ADVISOR_ENABLED: bool = os.getenv("SQL_INDEX_ADVISOR_ENABLED", "True").lower() == "true"
+    SQL_INDEX_ADVISOR_MIN_SCANS: int = int(os.getenv("SQL_INDEX_ADVISOR_MIN_SCANS", "3"))
+    SQL_INDEX_ADVISOR_MAX_INDEXES: int = int(os.getenv("SQL_INDEX_ADVISOR_MAX_INDEXES", "16"))
+    SQL_INDEX_ADVISOR_SAMPLE_RATE: int = int(os.getenv("SQL_INDEX_ADVISOR_SAMPLE_RATE", "10"))
+    SQL_INDEX_ADVISOR_SLOW_QUERY_MS: float = float(os.getenv("SQL_INDEX_ADVISOR_SLOW_QUERY_MS", "200"))
+    SQL_INDEX_ADVISOR_INTERVAL_SECONDS: int = int(os.getenv("SQL_INDEX_ADVISOR_INTERVAL_SECONDS", "60"))
     
     # 应用设置
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
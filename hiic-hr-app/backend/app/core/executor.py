@@ -0,0 +1,140 @@
+"""
+有界线程池模块，将阻塞操作从事件循环中卸载，并统计排队情况
+"""
+
+import asyncio
+import threading
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from app.core.config import settings
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturatedError(Exception):
+    """线程池排队已满，拒绝新的任务"""
+
+
+class BoundedExecutor:
+    """有界线程池
+
+    在固定数量的工作线程上执行阻塞函数；等待中的任务数超过上限时立即拒绝，
+    避免无限排队拖垮整个服务。同时记录队列深度、等待时间和执行时间。
+    """
+
+    def __init__(self, name: str, max_workers: int = 4, max_queue: int = 32):
+        """初始化线程池
+
+        Args:
+            name: 线程池名称，用于线程命名和日志
+            max_workers: 工作线程数
+            max_queue: 最多允许排队等待的任务数
+        """
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.queued = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        # 排队期间调用方被取消、任务未执行的次数
+        self.cancelled = 0
+        self.total_wait_ms = 0.0
+        self.total_run_ms = 0.0
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """在线程池中执行阻塞函数并等待结果
+
+        Raises:
+            ExecutorSaturatedError: 排队任务数已达上限
+        """
+        with self._lock:
+            if self.queued + self.running >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturatedError(f"{self.name}线程池繁忙，排队任务数已达上限{self.max_queue}")
+            self.queued += 1
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+
+        enqueue_time = time.time()
+
+        def task() -> Any:
+            start_time = time.time()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_wait_ms += (start_time - enqueue_time) * 1000
+            try:
+                result = func(*args, **kwargs)
+                with self._lock:
+                    self.completed += 1
+                return result
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.total_run_ms += (time.time() - start_time) * 1000
+
+        try:
+            future = self._executor.submit(task)
+        except RuntimeError:
+            with self._lock:
+                self.queued -= 1
+            raise
+        # 调用方在任务排队时被取消（如wait_for超时、SSE客户端断开）会连带取消future，
+        # 此时task不会执行，需要在这里归还排队名额，否则排队计数泄漏直至拒绝所有任务
+        future.add_done_callback(self._on_future_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_future_done(self, future: Future) -> None:
+        """future结束回调：排队中被取消的任务归还排队名额"""
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+                self.cancelled += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回线程池统计信息"""
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "avg_wait_ms": round(self.total_wait_ms / finished, 3) if finished else 0.0,
+                "avg_run_ms": round(self.total_run_ms / finished, 3) if finished else 0.0
+            }
+
+    def shutdown(self) -> None:
+        """关闭线程池"""
+        self._executor.shutdown(wait=False)
+        logger.info(f"{self.name}线程池已关闭")
+
+
+# SQL执行专用线程池（数据库查询、Supabase网络请求和pandas计算）
+sql_executor = BoundedExecutor(
+    "sql-executor",
+    max_workers=settings.SQL_EXECUTOR_WORKERS,
+    max_queue=settings.SQL_EXECUTOR_MAX_QUEUE
+)
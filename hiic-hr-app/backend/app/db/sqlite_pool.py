@@ -0,0 +1,156 @@
+"""
+SQLite快照连接池模块，为SQL服务提供可跨线程并发使用的只读连接
+"""
+
+import os
+import queue
+import atexit
+import sqlite3
+import tempfile
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """在等待时间内无法获取到空闲连接"""
+
+
+class SQLiteSnapshotPool:
+    """基于文件快照的SQLite只读连接池
+
+    将内存数据库完整备份到临时文件（WAL模式），然后打开多个只读连接。
+    每个连接都有独立的页缓存，多个线程可以真正并行地执行查询；
+    另保留一个可写连接，仅用于索引维护等后台操作。
+    """
+
+    def __init__(self, source_conn: sqlite3.Connection, size: int = 4,
+                 timeout: float = 5.0, directory: Optional[str] = None):
+        """从已有的数据库连接创建快照和连接池
+
+        Args:
+            source_conn: 数据来源连接（通常是刚构建完成的内存数据库）
+            size: 只读连接数量
+            timeout: 获取连接的最长等待时间（秒）
+            directory: 快照文件所在目录，默认使用系统临时目录
+        """
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._closed = False
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.in_use = 0
+        self.max_in_use = 0
+
+        # 创建快照文件
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix="hr_snapshot_", suffix=".db", dir=directory)
+        os.close(fd)
+
+        # 可写连接：复制数据，并用于后续的索引维护
+        self.writer = sqlite3.connect(self.path, timeout=timeout, check_same_thread=False)
+        source_conn.backup(self.writer)
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.commit()
+
+        # 只读连接
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(self.size):
+            self._idle.put(self._open_reader())
+
+        atexit.register(self.close)
+        logger.info(f"SQLite快照连接池已创建: {self.path}，只读连接数 {self.size}")
+
+    def _open_reader(self) -> sqlite3.Connection:
+        """打开一个只读连接"""
+        conn = sqlite3.connect(
+            f"file:{self.path}?mode=ro",
+            uri=True,
+            timeout=self.timeout,
+            check_same_thread=False
+        )
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """借出一个只读连接，使用完毕后自动归还"""
+        if self._closed:
+            raise RuntimeError("连接池已关闭")
+
+        start_time = time.time()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.waits += 1
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                with self._lock:
+                    self.timeouts += 1
+                raise PoolTimeoutError(f"{self.timeout}秒内没有可用的数据库连接")
+
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_ms += (time.time() - start_time) * 1000
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回连接池统计信息"""
+        with self._lock:
+            return {
+                "path": self.path,
+                "size": self.size,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0
+            }
+
+    def close(self) -> None:
+        """关闭所有连接并删除快照文件"""
+        if self._closed:
+            return
+        self._closed = True
+
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        try:
+            self.writer.close()
+        except sqlite3.Error:
+            pass
+
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
+        logger.info(f"SQLite快照连接池已关闭: {self.path}")
@@ -36,35 +36,59 @@ class SupabaseClient:
         self.sample_training = self._load_sample_data('training.json')
         
         # 缓存从真实数据库获取的数据
+        self.hr_data_cache = None
         self.employees_cache = None
         self.departments_cache = None
         self.attendance_cache = None
         self.performance_cache = None
         self.training_cache = None
+        # 最近一次获取员工数据的来源：supabase或sample（示例数据）
+        self.employees_source = None
         
         # 尝试从真实数据库加载数据
         self._init_cache()
     
-    def _init_cache(self):
-        """初始化数据缓存"""
+    def _init_cache(self) -> bool:
+        """初始化数据缓存
+        
+        先加载到局部变量，成功后才替换缓存；加载失败或出错时保留原有缓存。
+        
+        Returns:
+            是否成功加载
+        """
         try:
             if self.client:
                 print("尝试从Supabase加载真实数据...")
                 
                 # 获取hr_data表数据
-                self.hr_data_cache = self._fetch_hr_data()
+                hr_data = self._fetch_hr_data()
                 
-                if self.hr_data_cache:
-                    print(f"成功从Supabase加载{len(self.hr_data_cache)}条HR数据记录")
+                if hr_data:
+                    print(f"成功从Supabase加载{len(hr_data)}条HR数据记录")
                     
                     # 将hr_data数据映射到employees结构
-                    self.employees_cache = self._map_hr_data_to_employees()
-                    if self.employees_cache:
-                        print(f"成功将{len(self.employees_cache)}条HR数据映射为员工数据")
+                    employees = self._map_hr_data_to_employees(hr_data)
+                    if employees:
+                        print(f"成功将{len(employees)}条HR数据映射为员工数据")
+                    self.hr_data_cache = hr_data
+                    self.employees_cache = employees or self.employees_cache
+                    return True
+                
+                if self.hr_data_cache:
+                    print("从Supabase加载HR数据失败，保留原有缓存")
                 else:
                     print("从Supabase加载HR数据失败，将使用示例数据")
         except Exception as e:
             print(f"初始化数据缓存失败: {str(e)}")
+        return False
+    
+    def refresh_cache(self) -> bool:
+        """重新从Supabase加载缓存的数据，加载失败时保留原有缓存
+        
+        Returns:
+            是否成功加载
+        """
+        return self._init_cache()
     
     def _fetch_hr_data(self) -> List[Dict[str, Any]]:
         """从Supabase获取hr_data表数据"""
@@ -81,14 +105,15 @@ class SupabaseClient:
             print(f"获取hr_data数据失败: {str(e)}")
             return None
     
-    def _map_hr_data_to_employees(self) -> List[Dict[str, Any]]:
-        """将hr_data数据映射到employees结构"""
-        if not self.hr_data_cache:
+    def _map_hr_data_to_employees(self, hr_data: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """将hr_data数据映射到employees结构，默认映射缓存中的hr_data"""
+        hr_data = hr_data if hr_data is not None else self.hr_data_cache
+        if not hr_data:
             return None
         
         try:
             employees = []
-            for hr_record in self.hr_data_cache:
+            for hr_record in hr_data:
                 # 创建员工记录
                 employee = {
                     'id': str(hr_record.get('id')),
@@ -182,6 +207,7 @@ class SupabaseClient:
                             employee['name'] = employee['姓名']
                         elif '姓名' not in employee and 'name' in employee:
                             employee['姓名'] = employee['name']
+                    self.employees_source = "supabase"
                     return response.data
                 else:
                     print("从Supabase获取员工数据失败，使用示例数据")
@@ -200,6 +226,7 @@ class SupabaseClient:
                 employee['name'] = employee['姓名']
             elif '姓名' not in employee and 'name' in employee:
                 employee['姓名'] = employee['name']
+        self.employees_source = "sample"
         return self.sample_employees
     
     def get_all_education(self) -> List[Dict[str, Any]]:
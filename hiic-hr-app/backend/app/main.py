@@ -5,6 +5,9 @@ from app.routers.chat import router as chat_router
 from app.routers.visualizations import router as visualizations_router
 from app.core.config import settings
 from app.core.error_handler import error_handler_middleware
+from app.core.executor import sql_executor
+from app.services.data_reload_service import data_reload_service
+from app.services.openrouter_service import openrouter_service
 from app.api import admin
 import uvicorn
 
@@ -30,6 +33,18 @@ app.add_middleware(
     expose_headers=["*"],  # 暴露所有头部
 )
 
+# 启动定时数据重新加载
+@app.on_event("startup")
+async def start_data_reload():
+    data_reload_service.start()
+
+# 关闭时停止定时任务，释放线程池和HTTP连接池
+@app.on_event("shutdown")
+async def shutdown_executors():
+    await data_reload_service.stop()
+    sql_executor.shutdown()
+    await openrouter_service.close()
+
 # 健康检查端点
 @app.get("/health")
 async def health_check():
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict, Any, Optional
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Optional, AsyncIterator
+import json
+import time
 import logging
 from app.models.hr_models import ChatMessage, ChatRequest, ChatResponse
 from app.services.chat_service import hr_chat_service
 from app.services.enhanced_chat_service import enhanced_hr_chat_service
 from app.services.hybrid_chat_service import hybrid_chat_service
-from app.services.question_classifier import question_classifier
+from app.services.request_context import ChatRequestContext
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -22,16 +25,16 @@ async def send_message(request: ChatRequest) -> ChatResponse:
     from app.core.config import settings
     
     try:
-        # 获取最后一条用户消息
-        last_user_message = next((msg.content for msg in reversed(request.messages) 
-                                if msg.role == "user"), None)
+        # 以最后一条用户消息创建请求上下文
+        context = ChatRequestContext.from_messages(request.messages)
         
-        if not last_user_message:
+        if not context:
             return ChatResponse(response="无法识别用户消息")
         
-        # 使用新的问题分类器对问题进行分类
-        question_type = await question_classifier.classify(last_user_message)
-        logger.info(f"问题 '{last_user_message[:30]}...' 被分类为: {question_type}")
+        # 使用新的问题分类器对问题进行分类，结果保存在上下文中供后续服务复用
+        # （需要大模型分类时会同时预先生成SQL）
+        question_type = await hybrid_chat_service.classify(context)
+        logger.info(f"问题 '{context.question[:30]}...' 被分类为: {question_type}（来源: {context.classification_source}）")
         
         # 设置超时时间，比模型超时略长以确保能捕获模型的超时响应
         timeout_seconds = settings.MODEL_TIMEOUT + 10
@@ -46,16 +49,16 @@ async def send_message(request: ChatRequest) -> ChatResponse:
                 task = asyncio.create_task(enhanced_hr_chat_service.get_response(request.messages, preferred_tool=tool_name))
             elif question_type == "SQL_QUERY" or question_type == "sql" or question_type == "GENERAL_QUERY":
                 # SQL查询类问题和一般问题都使用混合聊天服务
-                task = asyncio.create_task(hybrid_chat_service.get_response(request.messages))
+                task = asyncio.create_task(hybrid_chat_service.get_response(request.messages, context=context))
             elif question_type == "VISUALIZATION":
                 # 可视化类问题使用混合聊天服务
-                task = asyncio.create_task(hybrid_chat_service.get_response(request.messages))
+                task = asyncio.create_task(hybrid_chat_service.get_response(request.messages, context=context))
             elif question_type == "DATA_ANALYSIS":
                 # 数据分析类问题使用混合聊天服务
-                task = asyncio.create_task(hybrid_chat_service.get_response(request.messages))
+                task = asyncio.create_task(hybrid_chat_service.get_response(request.messages, context=context))
             else:
                 # 其他问题类型使用混合聊天服务
-                task = asyncio.create_task(hybrid_chat_service.get_response(request.messages))
+                task = asyncio.create_task(hybrid_chat_service.get_response(request.messages, context=context))
                 
             # 等待任务完成或超时
             response = await asyncio.wait_for(task, timeout=timeout_seconds)
@@ -81,7 +84,7 @@ async def send_message(request: ChatRequest) -> ChatResponse:
             # 如果回答质量不佳，尝试使用混合查询服务
             logger.info(f"检测到低质量回答，尝试混合查询服务")
             try:
-                fallback_response = await hybrid_chat_service.get_response(request.messages)
+                fallback_response = await hybrid_chat_service.get_response(request.messages, context=context)
                 
                 # 如果混合查询服务提供了更好的回答，使用它
                 if not _is_low_quality_response(fallback_response):
@@ -90,11 +93,57 @@ async def send_message(request: ChatRequest) -> ChatResponse:
             except Exception as fallback_e:
                 logger.error(f"混合查询服务回退失败: {str(fallback_e)}")
         
+        logger.info(f"请求处理完成: {context.summary()}")
         return ChatResponse(response=response)
     except Exception as e:
         logger.error(f"处理消息时出错: {str(e)}", exc_info=True)
         return ChatResponse(response=f"处理您的请求时遇到了问题，请稍后再试。如果问题持续存在，请联系管理员。错误详情: {str(e)[:100]}...")
 
+@router.post("/stream")
+async def stream_message(request: ChatRequest) -> StreamingResponse:
+    """流式聊天消息，以server-sent events推送处理阶段和回复内容
+    
+    事件: started（已接收）、classified（问题分类）、sql_ready（SQL已生成）、
+    rows_fetched（查询已执行）、token（回复片段）、error（处理出错）、done（结束）
+    """
+    return StreamingResponse(
+        _stream_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _stream_events(request: ChatRequest) -> AsyncIterator[str]:
+    """按处理阶段产生SSE事件"""
+    start_time = time.time()
+    yield _sse("started", {})
+    
+    try:
+        context = ChatRequestContext.from_messages(request.messages)
+        if not context:
+            yield _sse("token", {"text": "无法识别用户消息"})
+        else:
+            question_type = await hybrid_chat_service.classify(context)
+            logger.info(f"问题 '{context.question[:30]}...' 被分类为: {question_type}（来源: {context.classification_source}）")
+            yield _sse("classified", {"question_type": question_type})
+            
+            if question_type.startswith("tool:"):
+                # 工具调用不支持流式输出，完成后一次性返回
+                tool_name = question_type.split(":")[1]
+                response = await enhanced_hr_chat_service.get_response(request.messages, preferred_tool=tool_name)
+                yield _sse("token", {"text": response})
+            else:
+                async for event, data in hybrid_chat_service.stream_response(request.messages, context):
+                    yield _sse(event, data)
+    except Exception as e:
+        logger.error(f"流式处理消息时出错: {str(e)}", exc_info=True)
+        yield _sse("error", {"message": f"处理您的请求时遇到了问题，请稍后再试。错误详情: {str(e)[:100]}"})
+    
+    yield _sse("done", {"elapsed_ms": round((time.time() - start_time) * 1000, 1)})
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 # 保留原来的专用端点，但将它们重定向到智能路由
 @router.post("/enhanced/send", response_model=ChatResponse)
 async def send_enhanced_message(request: ChatRequest) -> ChatResponse:
@@ -0,0 +1,291 @@
+"""
+答案模板渲染模块，将简单的聚合结果直接渲染为中文回答，省去一次大模型调用
+"""
+
+import re
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+# 列名 -> 中文名称
+COLUMN_LABELS = {
+    "department": "部门",
+    "gender": "性别",
+    "education": "学历",
+    "education_level": "学历",
+    "degree": "学位",
+    "university": "毕业院校",
+    "major": "专业",
+    "major_category": "专业类别",
+    "position": "职位",
+    "age": "年龄",
+    "age_group": "年龄段",
+    "ethnicity": "民族",
+    "team": "团队",
+    "section": "处室",
+    "sequence": "序列",
+}
+
+# 可以按模板渲染的指标表达式：不带DISTINCT的COUNT(*)/COUNT(列)，AVG(列)或ROUND(AVG(列), n)
+PLAIN_COUNT_PATTERN = re.compile(r"^COUNT\s*\(\s*(\*|[\w.]+)\s*\)$", re.IGNORECASE)
+PLAIN_AVERAGE_PATTERN = re.compile(
+    r"^(?:ROUND\s*\(\s*)?AVG\s*\(\s*(?:\w+\.)?(\w+)\s*\)(?:\s*,\s*\d+\s*\))?$", re.IGNORECASE
+)
+# 选择列的别名：expr AS alias 或 expr alias
+SELECT_ALIAS_PATTERN = re.compile(r"^(?P<expr>.*?[\w)\]\"`*])\s+(?:AS\s+)?[\"`\[]?(?P<alias>\w+)[\"`\]]?$",
+                                  re.IGNORECASE | re.DOTALL)
+
+# 常见指标的中文名称和单位
+METRIC_UNITS = {
+    "age": ("年龄", "岁"),
+    "total_work_years": ("工作年限", "年"),
+    "company_years": ("司龄", "年"),
+    "salary": ("薪资", "元"),
+}
+
+# 计数问题：<主语>(一共|总共|共)?有多少<名词>
+COUNT_QUESTION_PATTERN = re.compile(
+    r"^(?P<subject>.*?)(?:目前|现在)?(?:一共|总共|共)?(?:有|是)(?:多少|几)(?:个|名|位)?(?P<noun>.*?)(?:呢|吗|啊)?$"
+)
+# 人数问题：<主语>的人数是多少
+HEADCOUNT_QUESTION_PATTERN = re.compile(r"^(?P<subject>.*?)的?(?:人数|员工数|总人数|数量)(?:是|有)?(?:多少)?(?:呢|吗)?$")
+# 计数名词以"人/员工"开头并带有谓语，如"人是博士"、"人在研发部"、"员工毕业于清华大学"
+PERSON_CLAUSE_PATTERN = re.compile(r"^(?P<person>人员|员工|职工|人)(?P<clause>(?:是|在|毕业|来自|属于|拥有|具有).+)$")
+# 问题开头的客套语
+QUESTION_PREFIX_PATTERN = re.compile(r"^(请问|帮我|麻烦|查一下|查询一下|查询|统计一下|统计|告诉我|想知道|我想知道)+")
+
+
+class AnswerRenderer:
+    """答案模板渲染器
+
+    识别单值计数、单值平均以及小规模分组计数这几类常见结果形态，
+    直接生成自然流畅的中文回答；无法识别的结果返回None，由大模型生成回答。
+    """
+
+    def __init__(self, max_group_rows: int = 8):
+        """初始化渲染器
+
+        Args:
+            max_group_rows: 分组结果最多渲染的行数，超过则交给大模型概括
+        """
+        self.max_group_rows = max_group_rows
+
+    def render(self, question: str, sql_query: str, results: List[Dict[str, Any]]) -> Optional[str]:
+        """尝试直接渲染回答
+
+        Args:
+            question: 用户问题
+            sql_query: 执行的SQL查询
+            results: 查询结果
+
+        Returns:
+            渲染好的回答，结果形态较复杂时返回None
+        """
+        if results is None:
+            return None
+        if any(isinstance(row, dict) and "error" in row for row in results):
+            return None
+
+        if not results:
+            return "好的，我查了一下，目前没有找到符合条件的相关信息，您可以换个说法或放宽条件再试试。"
+
+        columns = list(results[0].keys())
+
+        if len(results) == 1 and len(columns) == 1:
+            return self._render_scalar(question, sql_query, columns[0], results[0][columns[0]])
+
+        if len(columns) == 2 and 2 <= len(results) <= self.max_group_rows:
+            return self._render_groups(sql_query, columns, results)
+
+        return None
+
+    def _render_scalar(self, question: str, sql_query: str, column: str, value: Any) -> Optional[str]:
+        """渲染单值结果"""
+        if not self._is_number(value):
+            return None
+
+        kind, source = self._metric_kind(column, sql_query)
+        if kind == "count":
+            if not self._is_integral(value):
+                return None
+            return self._render_count(question, int(value))
+        if kind == "average":
+            metric, unit = self._metric_label(source)
+            if not metric:
+                return None
+            subject, _ = self._split_question(question)
+            # 主语中可能带有指标本身，如"研发部的平均年龄"
+            subject = re.split(r"的?平均", subject)[0] if subject else subject
+            prefix = f"{subject}的" if subject else ""
+            return f"好的，{prefix}平均{metric}是{self._format_number(value)}{unit}。"
+        return None
+
+    def _render_count(self, question: str, count: int) -> Optional[str]:
+        """渲染计数结果"""
+        subject, noun = self._split_question(question)
+        if subject is None:
+            return None
+
+        subject_text = subject or "公司"
+        if not noun or noun in ("人", "人员"):
+            return f"好的，{subject_text}目前共有{count}人。"
+        if noun.startswith(("人", "员工", "职工")):
+            # "有多少人是博士"：名词后带谓语时保留原句式，否则交给大模型
+            match = PERSON_CLAUSE_PATTERN.match(noun)
+            if not match:
+                return None
+            person = "人" if match.group("person").startswith("人") else f"名{match.group('person')}"
+            return f"好的，{subject_text}目前共有{count}{person}{match.group('clause')}。"
+
+        measure = "个" if any(word in noun for word in ["部门", "项目", "团队", "专业", "学校", "院校", "岗位"]) else "名"
+        return f"好的，{subject_text}目前共有{count}{measure}{noun}。"
+
+    def _render_groups(self, sql_query: str, columns: List[str], results: List[Dict[str, Any]]) -> Optional[str]:
+        """渲染分组计数结果"""
+        label_column, value_column = columns
+        if not all(self._is_number(row.get(value_column)) for row in results):
+            return None
+        if any(self._is_number(row.get(label_column)) for row in results):
+            return None
+
+        kind, source = self._metric_kind(value_column, sql_query)
+        if kind is None:
+            return None
+        if kind == "count" and not all(self._is_integral(row.get(value_column)) for row in results):
+            return None
+        metric, unit = self._metric_label(source) if kind == "average" else (None, "")
+        if kind == "average" and not metric:
+            return None
+        dimension = COLUMN_LABELS.get(label_column.lower(), "")
+        opening = f"好的，按{dimension}来看，" if dimension else "好的，"
+
+        parts = []
+        for row in results:
+            label = row.get(label_column) or "未填写"
+            value = row.get(value_column)
+            if kind == "count":
+                parts.append(f"{label}有{int(value)}人")
+            else:
+                parts.append(f"{label}的平均{metric}是{self._format_number(value)}{unit}")
+
+        sentence = opening + "，".join(parts) + "。"
+
+        # 补充最大值说明
+        values = [row.get(value_column) for row in results]
+        top_value = max(values)
+        if values.count(top_value) == 1:
+            top_label = results[values.index(top_value)].get(label_column) or "未填写"
+            sentence += f"其中{top_label}{'人数最多' if kind == 'count' else '最高'}。"
+        return sentence
+
+    def _split_question(self, question: str) -> Tuple[Optional[str], str]:
+        """从计数问题中拆出主语和名词，无法识别时主语为None"""
+        text = re.sub(r"[？?。！!，,\s]+$", "", question.strip())
+        text = QUESTION_PREFIX_PATTERN.sub("", text)
+
+        match = COUNT_QUESTION_PATTERN.match(text)
+        if match:
+            return match.group("subject").rstrip("的"), match.group("noun").strip()
+
+        match = HEADCOUNT_QUESTION_PATTERN.match(text)
+        if match:
+            return match.group("subject"), ""
+
+        return None, ""
+
+    def _metric_kind(self, column: str, sql_query: str) -> Tuple[Optional[str], Optional[str]]:
+        """根据结果列对应的选择表达式判断指标类型
+
+        只有不带DISTINCT的COUNT(*)/COUNT(列)算计数，AVG(列)或ROUND(AVG(列), n)算平均值；
+        比例、去重计数等其他表达式以及无法对应到选择表达式的列都返回(None, None)，交给大模型回答。
+
+        Returns:
+            (指标类型count/average, 平均值的来源列)
+        """
+        expression = self._select_expression(column, sql_query)
+        if expression is None:
+            return None, None
+        if PLAIN_COUNT_PATTERN.match(expression):
+            return "count", None
+        match = PLAIN_AVERAGE_PATTERN.match(expression)
+        if match:
+            return "average", match.group(1).lower()
+        return None, None
+
+    def _select_expression(self, column: str, sql_query: str) -> Optional[str]:
+        """找出结果列对应的选择表达式，无法解析时返回None"""
+        select_list = self._select_list(sql_query or "")
+        if select_list is None:
+            return None
+        target = re.sub(r"\s+", "", column).lower()
+        for item in self._split_top_level(select_list):
+            item = item.strip()
+            match = SELECT_ALIAS_PATTERN.match(item)
+            if re.match(r"^[\w.]+$", item):
+                # 普通列以去掉表名前缀的列名作为结果列名
+                expression, alias = item, item.split(".")[-1]
+            elif match:
+                expression, alias = match.group("expr").strip(), match.group("alias")
+            else:
+                # 没有别名的表达式，SQLite以表达式原文作为结果列名
+                expression, alias = item, item
+            if re.sub(r"\s+", "", alias).lower() == target:
+                return expression
+        return None
+
+    def _select_list(self, sql_query: str) -> Optional[str]:
+        """提取最外层SELECT和FROM之间的选择列表，带WITH或无法解析时返回None"""
+        sql = sql_query.strip()
+        if not re.match(r"^SELECT\b", sql, re.IGNORECASE):
+            return None
+        depth = 0
+        start = len("SELECT")
+        for match in re.finditer(r"[()]|\bFROM\b", sql[start:], re.IGNORECASE):
+            token = match.group(0)
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif depth == 0:
+                select_list = sql[start:start + match.start()].strip()
+                return re.sub(r"^(DISTINCT|ALL)\s+", "", select_list, flags=re.IGNORECASE)
+        return None
+
+    def _split_top_level(self, text: str) -> List[str]:
+        """按最外层的逗号切分"""
+        parts, depth, current = [], 0, []
+        for char in text:
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            if char == "," and depth == 0:
+                parts.append("".join(current))
+                current = []
+            else:
+                current.append(char)
+        parts.append("".join(current))
+        return parts
+
+    def _metric_label(self, source: Optional[str]) -> Tuple[Optional[str], str]:
+        """获取平均值指标的中文名称和单位"""
+        for key, (label, unit) in METRIC_UNITS.items():
+            if source and key in source:
+                return label, unit
+        return None, ""
+
+    def _is_integral(self, value: Any) -> bool:
+        """判断是否为整数值（计数结果）"""
+        return isinstance(value, int) or (isinstance(value, float) and value.is_integer())
+
+    def _is_number(self, value: Any) -> bool:
+        """判断是否为数值"""
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def _format_number(self, value: Any) -> str:
+        """格式化数字，最多保留一位小数"""
+        if isinstance(value, float) and not value.is_integer():
+            return f"{value:.1f}"
+        return str(int(value))
@@ -25,6 +25,12 @@ class HRChatService:
         # 创建系统提示
         self.system_prompt = self._create_system_prompt()
     
+    def refresh_data(self) -> None:
+        """重新加载HR数据和系统提示，全部完成后一次性替换"""
+        hr_data = self._load_hr_data()
+        system_prompt = self._create_system_prompt(hr_data)
+        self.hr_data, self.system_prompt = hr_data, system_prompt
+    
     def _load_hr_data(self) -> pd.DataFrame:
         """加载HR数据"""
         try:
@@ -33,8 +39,9 @@ class HRChatService:
             print(f"加载HR数据失败: {str(e)}")
             return pd.DataFrame()
     
-    def _create_system_prompt(self) -> str:
+    def _create_system_prompt(self, hr_data: pd.DataFrame = None) -> str:
         """创建系统提示"""
+        hr_data = self.hr_data if hr_data is None else hr_data
         # 获取基本统计信息
         dept_stats = supabase_client.get_department_stats()
         gender_stats = supabase_client.get_gender_stats()
@@ -45,7 +52,7 @@ class HRChatService:
         system_prompt = f"""你是HIIC公司内部HR系统的AI助手，名叫"Cool"。你的性格友好、专业且有亲和力。你的回答必须基于我提供的员工数据库信息。
 
 公司员工数据概况:
-- 总员工数: {len(self.hr_data) if not self.hr_data.empty else '未知'}
+- 总员工数: {len(hr_data) if not hr_data.empty else '未知'}
 - 部门数量: {len(dept_stats) if dept_stats else '未知'}
 - 性别分布: {json.dumps(gender_stats, ensure_ascii=False) if gender_stats else '未知'}
 - 平均年龄: {age_stats.get('mean', '未知') if age_stats else '未知'}
@@ -12,13 +12,14 @@ class HRDataAnalysisService:
         self.load_data()
     
     def load_data(self) -> None:
-        """加载员工数据"""
+        """加载员工数据（加载完成后再替换，加载过程中仍使用旧数据）"""
         try:
-            self.df = supabase_client.get_employees_as_dataframe()
-            print(f"数据分析服务：成功加载{len(self.df)}条员工记录")
+            df = supabase_client.get_employees_as_dataframe()
+            print(f"数据分析服务：成功加载{len(df)}条员工记录")
         except Exception as e:
             print(f"数据分析服务：加载数据失败 - {str(e)}")
-            self.df = pd.DataFrame()
+            df = pd.DataFrame()
+        self.df = df
     
     def refresh_data(self) -> None:
         """刷新数据"""
@@ -0,0 +1,156 @@
+"""
+数据重新加载模块，在不重启服务的情况下刷新所有服务的HR数据
+"""
+
+import asyncio
+import time
+import logging
+from typing import Dict, List, Any, Optional
+from app.core.config import settings
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+
+class DataReloadService:
+    """数据重新加载服务
+
+    依次刷新Supabase缓存、SQL服务快照以及各个持有数据副本的服务。
+    每个服务都先在后台构建好新数据再一次性替换，正在处理的请求继续使用旧数据。
+    支持管理员手动触发和按固定间隔自动触发，同一时间只会有一次重新加载在进行。
+    """
+
+    def __init__(self, interval_seconds: int = 0):
+        """初始化数据重新加载服务
+
+        Args:
+            interval_seconds: 自动重新加载的间隔（秒），0表示不自动重新加载
+        """
+        self.interval_seconds = interval_seconds
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self.reload_count = 0
+        self.failure_count = 0
+        self.last_reload: Optional[Dict[str, Any]] = None
+
+    @property
+    def is_running(self) -> bool:
+        """是否正在重新加载"""
+        return self._lock.locked()
+
+    async def reload(self, trigger: str = "manual") -> Dict[str, Any]:
+        """重新加载所有服务的数据
+
+        Args:
+            trigger: 触发方式（manual/scheduled）
+
+        Returns:
+            本次重新加载的结果
+        """
+        async with self._lock:
+            start_time = time.time()
+            logger.info(f"开始重新加载数据（{trigger}）")
+            loop = asyncio.get_running_loop()
+            try:
+                # 构建新数据涉及网络请求和pandas计算，放到默认线程池中执行，不占用SQL执行线程池
+                result = await loop.run_in_executor(None, self._reload_all)
+            except Exception as e:
+                self.failure_count += 1
+                logger.error(f"重新加载数据失败: {str(e)}")
+                self.last_reload = {
+                    "trigger": trigger,
+                    "success": False,
+                    "error": str(e),
+                    "finished_at": time.time()
+                }
+                raise
+
+            self.reload_count += 1
+            self.last_reload = {
+                "trigger": trigger,
+                "success": not result["failed"],
+                **result,
+                "elapsed_ms": round((time.time() - start_time) * 1000, 1),
+                "finished_at": time.time()
+            }
+            logger.info(f"数据重新加载完成，版本{result['data']['version']}，"
+                        f"耗时{self.last_reload['elapsed_ms']}ms")
+            return self.last_reload
+
+    def _reload_all(self) -> Dict[str, Any]:
+        """依次刷新各服务的数据（在工作线程中执行）"""
+        from app.db.supabase import supabase_client
+        from app.services.sql_service import sql_service
+        from app.services.visualization_service import visualization_service
+        from app.services.data_analysis_service import hr_data_analysis
+        from app.services.chat_service import hr_chat_service
+        from app.services.hybrid_chat_service import hybrid_chat_service
+
+        if not supabase_client.refresh_cache():
+            logger.warning("刷新Supabase缓存失败，保留原有缓存")
+        # SQL服务失败时直接抛出，其他服务保持原有数据
+        data_info = sql_service.reload_data()
+
+        refreshed: List[str] = []
+        failed: Dict[str, str] = {}
+        for name, refresh in (
+            ("visualization", visualization_service.refresh_data),
+            ("data_analysis", hr_data_analysis.refresh_data),
+            ("chat", hr_chat_service.refresh_data),
+            ("hybrid_chat", hybrid_chat_service.refresh_data),
+        ):
+            try:
+                refresh()
+                refreshed.append(name)
+            except Exception as e:
+                logger.error(f"刷新{name}服务数据失败: {str(e)}")
+                failed[name] = str(e)
+
+        return {"data": data_info, "refreshed": refreshed, "failed": failed}
+
+    def start(self) -> None:
+        """启动定时重新加载任务"""
+        if self.interval_seconds <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run_schedule())
+        logger.info(f"已启动定时数据重新加载，间隔{self.interval_seconds}秒")
+
+    async def stop(self) -> None:
+        """停止定时重新加载任务"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run_schedule(self) -> None:
+        """按固定间隔重新加载数据"""
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            if self.is_running:
+                continue
+            try:
+                await self.reload(trigger="scheduled")
+            except Exception:
+                # 失败已记录，等待下一次定时重新加载
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        """返回重新加载状态"""
+        return {
+            "interval_seconds": self.interval_seconds,
+            "running": self.is_running,
+            "scheduled": self._task is not None,
+            "reload_count": self.reload_count,
+            "failure_count": self.failure_count,
+            "last_reload": self.last_reload
+        }
+
+
+# 创建数据重新加载服务实例
+data_reload_service = DataReloadService(interval_seconds=settings.DATA_RELOAD_INTERVAL_SECONDS)
@@ -0,0 +1,271 @@
+"""
+HR聚合立方体模块，在数据加载时按常用维度预先聚合，统计问题无需再扫描员工明细
+"""
+
+import re
+import time
+import logging
+import pandas as pd
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+# 维度缺失值
+MISSING_VALUE = "未知"
+
+# 年龄段（左闭右开，与可视化服务一致）
+AGE_BINS = [0, 25, 30, 35, 40, 45, 50, 100]
+AGE_LABELS = ["25岁以下", "26-30岁", "31-35岁", "36-40岁", "41-45岁", "46-50岁", "50岁以上"]
+
+# 司龄段（左闭右开）
+TENURE_BINS = [0, 1, 3, 5, 10, 15, 100]
+TENURE_LABELS = ["1年以下", "1-3年", "3-5年", "5-10年", "10-15年", "15年以上"]
+
+# 院校层次标记列 -> 维度名称
+UNIVERSITY_TIER_COLUMNS = {
+    "is_985": "985",
+    "is_211": "211",
+    "is_c9": "C9",
+    "is_qs50": "QS50",
+    "is_qs100": "QS100",
+}
+
+# 数值指标：立方体中保存其总和与非空个数，用于计算任意切片的平均值
+MEASURE_COLUMNS = ["age", "total_work_years", "company_years"]
+
+# 问题中性别的说法
+GENDER_WORDS = {
+    "男性": "男", "男员工": "男", "男生": "男", "男同事": "男", "男": "男",
+    "女性": "女", "女员工": "女", "女生": "女", "女同事": "女", "女": "女",
+}
+# 统计类问题中可忽略的词语
+FILLER_PATTERN = re.compile(
+    r"请问|帮我|麻烦|查一下|查询|统计|告诉我|我们|公司|目前|现在|一共|总共|总|共|"
+    r"有|是|多少|几|个|名|位|人数|人员|员工|职工|同事|人|学历|毕业|院校|的|呢|吗|啊|"
+    r"[？?。！!，,、\s]"
+)
+COUNT_INTENT_PATTERN = re.compile(r"多少|几个|几位|几名|人数")
+AVERAGE_AGE_PATTERN = re.compile(r"平均年龄(是|有)?多少|平均年龄|平均(是|有)?多少岁")
+
+
+def _is_truthy(value: Any) -> bool:
+    """把各种形式的标记值统一为布尔值"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("是", "true", "1", "yes", "y")
+    try:
+        return bool(value) and not pd.isna(value)
+    except (TypeError, ValueError):
+        return bool(value)
+
+
+class HRAggregateCube:
+    """HR聚合立方体
+
+    以（部门, 性别, 学历, 年龄段, 司龄段, 院校层次标记...）为维度，
+    每个单元格保存人数以及年龄、工作年限、司龄的总和与非空个数。
+    任意维度组合的上卷（roll-up）和切片（slice）都只需遍历单元格，与员工人数无关。
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """从员工数据构建立方体
+
+        Args:
+            df: 员工数据
+        """
+        start_time = time.time()
+        self.row_count = len(df) if df is not None else 0
+        # 维度名称 -> 来源列名
+        self.dimension_columns: Dict[str, str] = {}
+        self.measures: List[str] = []
+        # 维度取值元组 -> 指标
+        self.cells: Dict[Tuple[Any, ...], Dict[str, float]] = {}
+
+        if df is not None and not df.empty:
+            self._build(df)
+
+        self.dimensions: List[str] = list(self.dimension_columns)
+        self._dimension_index = {name: i for i, name in enumerate(self.dimensions)}
+        self.build_ms = round((time.time() - start_time) * 1000, 3)
+        logger.info(f"HR聚合立方体构建完成: {self.row_count}行 -> {len(self.cells)}个单元格，"
+                    f"维度 {self.dimensions}，耗时{self.build_ms}ms")
+
+    def _build(self, df: pd.DataFrame) -> None:
+        """按维度分组聚合"""
+        frame = pd.DataFrame(index=df.index)
+
+        for name, candidates in (("department", ["department"]), ("gender", ["gender"]),
+                                 ("education", ["education_level", "education"])):
+            column = next((col for col in candidates if col in df.columns), None)
+            if column:
+                self.dimension_columns[name] = column
+                frame[name] = df[column].where(df[column].notna() & (df[column] != ""), MISSING_VALUE).astype(str)
+
+        if "age" in df.columns:
+            self.dimension_columns["age_band"] = "age"
+            frame["age_band"] = self._band(df["age"], AGE_BINS, AGE_LABELS)
+
+        tenure_column = next((col for col in ("company_years", "total_work_years") if col in df.columns), None)
+        if tenure_column:
+            self.dimension_columns["tenure_band"] = tenure_column
+            frame["tenure_band"] = self._band(df[tenure_column], TENURE_BINS, TENURE_LABELS)
+
+        for column, label in UNIVERSITY_TIER_COLUMNS.items():
+            if column in df.columns:
+                self.dimension_columns[column] = column
+                frame[column] = df[column].map(_is_truthy)
+
+        # 数值指标的总和与非空个数
+        aggregations = {"count": ("_one", "size")}
+        frame["_one"] = 1
+        for measure in MEASURE_COLUMNS:
+            if measure in df.columns:
+                values = pd.to_numeric(df[measure], errors="coerce")
+                frame[f"_{measure}"] = values
+                aggregations[f"{measure}_sum"] = (f"_{measure}", "sum")
+                aggregations[f"{measure}_n"] = (f"_{measure}", "count")
+                self.measures.append(measure)
+
+        dimensions = list(self.dimension_columns)
+        if not dimensions:
+            self.cells[()] = {key: float(frame[source].agg(func)) for key, (source, func) in aggregations.items()}
+            return
+
+        grouped = frame.groupby(dimensions, sort=False, observed=True).agg(**aggregations)
+        for key, row in grouped.iterrows():
+            key = key if isinstance(key, tuple) else (key,)
+            self.cells[key] = {name: float(value) for name, value in row.items()}
+
+    def _band(self, series: pd.Series, bins: List[int], labels: List[str]) -> pd.Series:
+        """把数值列切分为区间标签"""
+        values = pd.to_numeric(series, errors="coerce")
+        banded = pd.cut(values, bins=bins, labels=labels, right=False)
+        return banded.astype(object).where(banded.notna(), MISSING_VALUE).astype(str)
+
+    def has_dimension(self, dimension: str) -> bool:
+        """是否包含指定维度"""
+        return dimension in self._dimension_index
+
+    def values(self, dimension: str) -> List[Any]:
+        """返回某个维度的全部取值（按人数降序）"""
+        return list(self.rollup([dimension]).keys())
+
+    def rollup(self, by: Iterable[str], measure: str = "count",
+               **filters: Any) -> Dict[Any, float]:
+        """按指定维度上卷
+
+        Args:
+            by: 分组维度，单个维度时结果的键为取值本身，多个维度时为取值元组
+            measure: count，或数值指标名（返回平均值）
+            **filters: 切片条件，维度名=取值（或取值列表）
+
+        Returns:
+            分组键 -> 人数或平均值，按人数降序
+        """
+        by = list(by)
+        positions = [self._position(dimension) for dimension in by]
+        totals: Dict[Any, List[float]] = {}
+        for key, cell in self._slice(filters):
+            group = tuple(key[position] for position in positions)
+            group = group[0] if len(group) == 1 else group
+            bucket = totals.setdefault(group, [0.0, 0.0, 0.0])
+            bucket[0] += cell["count"]
+            if measure != "count":
+                bucket[1] += cell.get(f"{measure}_sum", 0.0)
+                bucket[2] += cell.get(f"{measure}_n", 0.0)
+
+        ordered = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+        if measure == "count":
+            return {group: int(bucket[0]) for group, bucket in ordered}
+        return {group: bucket[1] / bucket[2] for group, bucket in ordered if bucket[2]}
+
+    def count(self, **filters: Any) -> int:
+        """切片内的人数"""
+        return int(sum(cell["count"] for _, cell in self._slice(filters)))
+
+    def average(self, measure: str, **filters: Any) -> Optional[float]:
+        """切片内某个数值指标的平均值，没有数据时返回None"""
+        if measure not in self.measures:
+            return None
+        total = 0.0
+        n = 0.0
+        for _, cell in self._slice(filters):
+            total += cell.get(f"{measure}_sum", 0.0)
+            n += cell.get(f"{measure}_n", 0.0)
+        return total / n if n else None
+
+    def match_question(self, question: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """识别可以直接由立方体回答的简单统计问题
+
+        只接受"<条件>有多少人"和"<条件>的平均年龄"两类问题，条件只能是部门、性别、
+        学历和院校层次标记的取值；去掉已识别的取值和虚词后若还有剩余文字，说明问题
+        包含立方体无法表达的条件，返回None交给SQL生成处理。
+
+        Returns:
+            (指标, 切片条件)，指标为count或age
+        """
+        text = question.strip()
+        if AVERAGE_AGE_PATTERN.search(text) and "age" in self.measures:
+            metric = "age"
+            text = AVERAGE_AGE_PATTERN.sub("", text)
+        elif COUNT_INTENT_PATTERN.search(text):
+            metric = "count"
+        else:
+            return None
+
+        filters: Dict[str, Any] = {}
+
+        # 部门、学历按完整取值匹配，长的优先
+        for dimension in ("department", "education"):
+            if not self.has_dimension(dimension):
+                continue
+            for value in sorted(self.values(dimension), key=len, reverse=True):
+                if value != MISSING_VALUE and len(value) >= 2 and value in text:
+                    if dimension in filters:
+                        return None
+                    filters[dimension] = value
+                    text = text.replace(value, "")
+
+        if self.has_dimension("gender"):
+            for word in sorted(GENDER_WORDS, key=len, reverse=True):
+                if word in text:
+                    if filters.get("gender", GENDER_WORDS[word]) != GENDER_WORDS[word]:
+                        return None
+                    filters["gender"] = GENDER_WORDS[word]
+                    text = text.replace(word, "")
+
+        for column, label in UNIVERSITY_TIER_COLUMNS.items():
+            if self.has_dimension(column) and re.search(rf"(?<![A-Za-z0-9]){label}(?![A-Za-z0-9])", text, re.IGNORECASE):
+                filters[column] = True
+                text = re.sub(rf"{label}(院校|高校|大学)?", "", text, flags=re.IGNORECASE)
+
+        if FILLER_PATTERN.sub("", text):
+            return None
+        return metric, filters
+
+    def stats(self) -> Dict[str, Any]:
+        """返回立方体的统计信息"""
+        return {
+            "rows": self.row_count,
+            "cells": len(self.cells),
+            "dimensions": self.dimensions,
+            "measures": self.measures,
+            "build_ms": self.build_ms
+        }
+
+    def _position(self, dimension: str) -> int:
+        """维度在单元格键中的位置"""
+        if dimension not in self._dimension_index:
+            raise KeyError(f"立方体中没有维度: {dimension}")
+        return self._dimension_index[dimension]
+
+    def _slice(self, filters: Dict[str, Any]) -> Iterable[Tuple[Tuple[Any, ...], Dict[str, float]]]:
+        """按切片条件筛选单元格"""
+        conditions = []
+        for dimension, value in filters.items():
+            allowed = set(value) if isinstance(value, (list, tuple, set)) else {value}
+            conditions.append((self._position(dimension), allowed))
+
+        for key, cell in self.cells.items():
+            if all(key[position] in allowed for position, allowed in conditions):
+                yield key, cell
@@ -1,13 +1,15 @@
 import json
 import re
 import asyncio
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Tuple, AsyncIterator
 from app.services.tool_service import tool_service
 from app.services.sql_service import sql_service
 from app.services.openrouter_service import openrouter_service
+from app.services.response_filter import StreamingResponseFilter
 from app.services.question_classifier import question_classifier
 from app.db.supabase import supabase_client
 from app.models.hr_models import ChatMessage
+from app.services.request_context import ChatRequestContext
 import logging
 from app.core.config import settings
 
@@ -28,6 +30,10 @@ class HybridChatService:
         # 最大缓存大小
         self.max_cache_size = 100
     
+    def refresh_data(self) -> None:
+        """数据重新加载后清空基于旧数据生成的回复缓存"""
+        self.response_cache = {}
+    
     def _create_system_prompt(self) -> str:
         """创建系统提示"""
         system_prompt = """你是HIIC公司内部HR系统的AI助手，名叫"Cool"。你的性格友好、专业且有亲和力。你现在具有直接查询HR数据库的能力。
@@ -149,11 +155,13 @@ tool: analyze_age_distribution
         cache_key = self._generate_cache_key(question)
         return self.response_cache.get(cache_key)
     
-    async def get_response(self, messages: List[ChatMessage]) -> str:
+    async def get_response(self, messages: List[ChatMessage],
+                           context: Optional[ChatRequestContext] = None) -> str:
         """获取回复
         
         Args:
             messages: 消息列表
+            context: 请求上下文，路由已分类时直接复用其分类结果，为空时在这里分类
             
         Returns:
             回复内容
@@ -161,13 +169,14 @@ tool: analyze_age_distribution
         if not messages:
             return "请输入您的问题"
         
-        # 获取最后一条用户消息
-        user_message = messages[-1].content
+        if context is None:
+            context = ChatRequestContext(messages, messages[-1].content)
+        user_message = context.question
         
-        # 使用快速分类器进行分类
+        # 使用快速分类器进行分类（上下文已分类时不会重复分类）
         try:
-            question_type = await question_classifier.classify(user_message)
-            logger.info(f"问题 '{user_message[:20]}...' 被分类为: {question_type}")
+            question_type = await self.classify(context)
+            logger.info(f"问题 '{user_message[:20]}...' 被分类为: {question_type}（来源: {context.classification_source}）")
         except Exception as e:
             logger.error(f"问题分类失败: {str(e)}")
             question_type = "HYBRID_QUERY"  # 默认为混合查询
@@ -185,7 +194,7 @@ tool: analyze_age_distribution
                     # 使用超时机制执行SQL查询
                     try:
                         # 创建一个任务
-                        sql_task = asyncio.create_task(sql_service.get_sql_response(user_message))
+                        sql_task = asyncio.create_task(sql_service.get_sql_response(user_message, context=context))
                         # 等待任务完成，带超时
                         sql_response = await asyncio.wait_for(sql_task, timeout=timeout_seconds)
                         
@@ -237,35 +246,12 @@ tool: analyze_age_distribution
                 # 一般问题直接使用OpenRouter
                 logger.info("一般问题，直接使用OpenRouter回应")
                 
-                # 对于可能是部门负责人查询但被错误分类的问题进行特殊处理
-                dept_head_pattern = r'(谁是|谁担任|谁负责|谁主管|谁分管)(.*?)(负责人|部长|所长|主任|主管|的)'
-                if re.search(dept_head_pattern, user_message):
-                    logger.info("检测到可能是部门负责人查询的问题，尝试使用SQL服务处理")
-                    try:
-                        # 尝试用SQL服务处理
-                        sql_response = await sql_service.get_sql_response(user_message)
-                        return sql_response
-                    except Exception as e:
-                        logger.error(f"SQL服务处理部门负责人查询失败: {str(e)}")
-                        # 失败时回退到OpenRouter
-                
-                # 尝试检测是否包含部门名称
-                dept_patterns = [
-                    r'(大数据平台与信息部|数字经济研究所|生物经济研究所|海洋经济研究所|城市轨道与城市发展研究所|创新中心|党委办公室|合规管理部|综合协同部|战略发展与项目管理部)',
-                    r'(\w+部|\w+所|\w+中心)'
-                ]
-                
-                contains_dept = False
-                for pattern in dept_patterns:
-                    if re.search(pattern, user_message):
-                        contains_dept = True
-                        break
-                
-                if contains_dept:
-                    logger.info("检测到问题中包含部门名称，尝试使用SQL服务处理")
+                # 可能是部门负责人查询或包含部门名称但被错误分类的问题，尝试使用SQL服务处理
+                if self._looks_like_department_query(context):
+                    logger.info("检测到部门相关的问题，尝试使用SQL服务处理")
                     try:
                         # 尝试用SQL服务处理
-                        sql_response = await sql_service.get_sql_response(user_message)
+                        sql_response = await sql_service.get_sql_response(user_message, context=context)
                         return sql_response
                     except Exception as e:
                         logger.error(f"SQL服务处理部门相关查询失败: {str(e)}")
@@ -282,16 +268,81 @@ tool: analyze_age_distribution
                 logger.error(f"OpenRouter回退也失败: {str(nested_e)}")
                 return "抱歉，处理您的请求时出现了问题。请稍后再试。"
     
-    async def _send_to_openrouter(self, messages: List[ChatMessage]) -> str:
-        """发送消息到OpenRouter
+    async def stream_response(self, messages: List[ChatMessage],
+                              context: ChatRequestContext) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """流式获取回复，处理方式与get_response相同，分类结果取自调用方给出的上下文
         
         Args:
             messages: 消息列表
+            context: 已分类的请求上下文
+            
+        Yields:
+            (事件名, 事件数据)，SQL查询会产生sql_ready、rows_fetched等阶段事件，回复内容为token事件
+        """
+        if not messages:
+            yield "token", {"text": "请输入您的问题"}
+            return
+        
+        user_message = context.question
+        question_type = await self.classify(context)
+        
+        # 与get_response一致：SQL查询和疑似部门查询的一般问题走SQL服务，混合查询优先使用工具
+        if question_type == "HYBRID_QUERY":
+            tool_result = await tool_service.process_tool_call(user_message)
+            if tool_result:
+                logger.info(f"使用工具服务处理: {tool_result[:30]}...")
+                yield "token", {"text": tool_result}
+                return
+        elif question_type == "SQL_QUERY" or (
+            question_type not in ("VISUALIZATION", "DATA_ANALYSIS") and self._looks_like_department_query(context)
+        ):
+            async for event in sql_service.stream_sql_response(user_message, context=context):
+                yield event
+            return
+        
+        # 其他问题转发OpenRouter的token流，去掉代码块和SQL查询说明语句
+        response_filter = StreamingResponseFilter()
+        async for text in openrouter_service.stream_chat_response(self._format_messages(messages), model_type="hybrid"):
+            text = response_filter.feed(text)
+            if text:
+                yield "token", {"text": text}
+        text = response_filter.finish()
+        if text:
+            yield "token", {"text": text}
+    
+    async def classify(self, context: ChatRequestContext) -> str:
+        """对请求上下文分类；需要调用大模型分类时同时预先生成SQL，分类结果不需要SQL时取消
+        
+        Args:
+            context: 请求上下文
             
         Returns:
-            OpenRouter回复
+            问题类型
         """
-        # 转换消息格式
+        question_type = await question_classifier.classify_context(
+            context, on_model_path=sql_service.start_speculative_sql
+        )
+        if context.speculative_sql is not None and not self._needs_sql(context):
+            logger.info(f"问题被分类为{question_type}，不需要SQL")
+            sql_service.cancel_speculative_sql(context)
+        return question_type
+    
+    def _needs_sql(self, context: ChatRequestContext) -> bool:
+        """按分类结果判断是否会使用SQL服务（与get_response的分发规则一致）"""
+        if context.question_type == "SQL_QUERY":
+            return True
+        if context.question_type in ("VISUALIZATION", "DATA_ANALYSIS", "HYBRID_QUERY"):
+            return False
+        return self._looks_like_department_query(context)
+    
+    def _looks_like_department_query(self, context: ChatRequestContext) -> bool:
+        """判断一般问题是否可能是部门负责人查询或包含部门名称（需要查询数据），复用分类时的判断结果"""
+        if context.mentions_department is None:
+            context.mentions_department = question_classifier.mentions_department(context.question)
+        return context.mentions_department
+    
+    def _format_messages(self, messages: List[ChatMessage]) -> List[Dict[str, str]]:
+        """转换为OpenRouter消息格式：系统提示加最近的10条消息"""
         formatted_messages = [
             {"role": "system", "content": self.system_prompt}
         ]
@@ -302,10 +353,20 @@ tool: analyze_age_distribution
                 "role": "user" if msg.role == "user" else "assistant", 
                 "content": msg.content
             })
+        return formatted_messages
+    
+    async def _send_to_openrouter(self, messages: List[ChatMessage]) -> str:
+        """发送消息到OpenRouter
         
+        Args:
+            messages: 消息列表
+            
+        Returns:
+            OpenRouter回复
+        """
         # 发送到OpenRouter，使用hybrid模型
         logger.info("发送消息到OpenRouter...")
-        response = await openrouter_service.get_chat_response(formatted_messages, model_type="hybrid")
+        response = await openrouter_service.get_chat_response(self._format_messages(messages), model_type="hybrid")
         logger.info(f"收到OpenRouter回复: {response[:50]}...")
         
         return response
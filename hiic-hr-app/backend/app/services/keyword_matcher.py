@@ -0,0 +1,83 @@
+"""
+多关键词匹配模块，把所有关键词编译成一个Aho-Corasick自动机，一次扫描找出文本中出现的全部关键词
+"""
+
+from collections import deque
+from typing import Dict, List, Set, Tuple, Iterable
+
+
+class KeywordMatcher:
+    """Aho-Corasick多模式匹配器
+
+    每个关键词关联一个或多个标签，匹配耗时只与文本长度有关，与关键词数量无关。
+    """
+
+    def __init__(self, rules: Dict[str, Iterable[str]], ignore_case: bool = True):
+        """编译关键词
+
+        Args:
+            rules: 标签 -> 关键词列表
+            ignore_case: 是否忽略大小写
+        """
+        self.ignore_case = ignore_case
+        # 状态转移表，下标为状态编号，0为根节点
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 状态 -> 在该状态结束的(关键词, 标签)
+        self._output: List[List[Tuple[str, str]]] = [[]]
+        self.keyword_count = 0
+
+        for label, keywords in rules.items():
+            for keyword in keywords:
+                if keyword:
+                    self._add(self._normalize(keyword), label)
+                    self.keyword_count += 1
+        self._build_failure_links()
+
+    def find(self, text: str) -> List[Tuple[str, str]]:
+        """返回文本中出现的全部(关键词, 标签)，按出现位置排序"""
+        hits = []
+        state = 0
+        for char in self._normalize(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                hits.extend(self._output[state])
+        return hits
+
+    def match_labels(self, text: str) -> Set[str]:
+        """返回文本命中的全部标签"""
+        return {label for _, label in self.find(text)}
+
+    def _normalize(self, text: str) -> str:
+        """统一大小写"""
+        return text.lower() if self.ignore_case else text
+
+    def _add(self, keyword: str, label: str) -> None:
+        """把关键词加入字典树"""
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        if (keyword, label) not in self._output[state]:
+            self._output[state].append((keyword, label))
+
+    def _build_failure_links(self) -> None:
+        """按广度优先计算失败指针，并合并后缀关键词的输出"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
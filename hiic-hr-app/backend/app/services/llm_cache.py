@@ -0,0 +1,169 @@
+"""
+大模型响应缓存模块，把确定性（低温度）模型调用的响应保存在本地SQLite文件中，服务重启后仍然有效
+"""
+
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+# 命中时的访问时间先记在内存中，累计到该数量时批量写入
+ACCESS_FLUSH_BATCH = 200
+
+
+class LLMResponseCache:
+    """磁盘LRU缓存
+
+    以请求哈希为键保存完整的API响应，条目数超过上限时按最近访问时间淘汰最旧的条目，
+    超过有效期的条目在读取时删除。命中只读取不写入，访问时间在内存中累计，
+    在写入新条目（淘汰之前）、累计过多或关闭时批量写入。
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl_seconds: float = 0):
+        """初始化缓存
+
+        Args:
+            path: SQLite文件路径
+            max_entries: 最多保存的条目数
+            ttl_seconds: 条目有效期（秒），0表示不过期
+        """
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = max(0.0, ttl_seconds)
+        self._lock = threading.Lock()
+        # 键 -> 尚未写入的最近访问时间
+        self._pending_access: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model_type TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                expires_at REAL
+            )
+        """)
+        # 旧版本创建的缓存文件没有expires_at列，补上后旧条目视为不过期
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if "expires_at" not in columns:
+            self._conn.execute("ALTER TABLE responses ADD COLUMN expires_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.deletions = 0
+        logger.info(f"大模型响应缓存已打开: {path}，现有{self._count()}条，上限{self.max_entries}条")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，命中时刷新访问时间，过期的条目删除后按未命中处理"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expirations += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._pending_access[key] = now
+            if len(self._pending_access) >= ACCESS_FLUSH_BATCH:
+                self._flush_access()
+                self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, model_type: str, response: Dict[str, Any]) -> None:
+        """写入缓存，超过上限时淘汰最久未访问的条目"""
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        payload = json.dumps(response, ensure_ascii=False)
+        with self._lock:
+            # 先写入累计的访问时间，淘汰时才能按真实的访问顺序
+            self._flush_access()
+            self._pending_access.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model_type, response, created_at, last_access, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_type, payload, now, now, expires_at)
+            )
+            overflow = self._count() - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def delete(self, key: str) -> bool:
+        """删除一个条目（如生成的SQL执行失败），返回是否存在"""
+        with self._lock:
+            self._pending_access.pop(key, None)
+            deleted = self._conn.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+            self._conn.commit()
+            self.deletions += deleted
+        return bool(deleted)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._pending_access.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        with self._lock:
+            entries = self._count()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "deletions": self.deletions,
+            "pending_access_updates": len(self._pending_access)
+        }
+
+    def _flush_access(self) -> None:
+        """写入累计的访问时间（调用方持有锁并负责提交）"""
+        if not self._pending_access:
+            return
+        self._conn.executemany(
+            "UPDATE responses SET last_access = ? WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in self._pending_access.items()]
+        )
+        self._pending_access.clear()
+
+    def _count(self) -> int:
+        """当前条目数（调用方持有锁）"""
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
@@ -0,0 +1,194 @@
+"""
+大模型调用指标模块，按模型类型统计请求数、token用量、延迟、重试和错误
+"""
+
+import time
+import bisect
+import threading
+from typing import Dict, List, Any, Optional, Iterable
+
+# 延迟分桶上界（毫秒）
+LATENCY_BUCKETS_MS = [100, 250, 500, 1000, 2000, 5000, 10000, 20000, 30000, 60000]
+# token数分桶上界
+TOKEN_BUCKETS = [16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384]
+
+
+class Histogram:
+    """固定分桶直方图，分位数按所在分桶的上界估计"""
+
+    def __init__(self, buckets: Iterable[float]):
+        """初始化直方图
+
+        Args:
+            buckets: 递增的分桶上界，超过最后一个上界的值计入+Inf分桶
+        """
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """记录一个观测值"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """估计第p分位数（p取0~1），返回所在分桶的上界，落在+Inf分桶时返回最大值"""
+        if not self.count:
+            return None
+        target = p * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target and bucket_count:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回直方图数据"""
+        labels = [f"<={bucket:g}" for bucket in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "avg": round(self.sum / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+
+class ModelTypeMetrics:
+    """单个模型类型的指标"""
+
+    def __init__(self):
+        """初始化指标"""
+        self.requests = 0
+        self.successes = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.streamed = 0
+        # 因达到max_tokens被截断的回复数
+        self.truncated = 0
+        self.prompt_tokens_total = 0
+        self.completion_tokens_total = 0
+        # 错误类型 -> 次数
+        self.errors: Dict[str, int] = {}
+        # 实际使用的模型 -> 成功次数（切换到备用模型或对冲胜出时不同于配置的主模型）
+        self.models: Dict[str, int] = {}
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.prompt_tokens = Histogram(TOKEN_BUCKETS)
+        self.completion_tokens = Histogram(TOKEN_BUCKETS)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回指标数据"""
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "errors": dict(self.errors),
+            "error_count": sum(self.errors.values()),
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "streamed": self.streamed,
+            "truncated": self.truncated,
+            "models": dict(self.models),
+            "prompt_tokens_total": self.prompt_tokens_total,
+            "completion_tokens_total": self.completion_tokens_total,
+            "latency_ms": self.latency_ms.snapshot(),
+            "prompt_tokens": self.prompt_tokens.snapshot(),
+            "completion_tokens": self.completion_tokens.snapshot()
+        }
+
+
+class LLMMetrics:
+    """大模型调用指标，按模型类型分别统计"""
+
+    def __init__(self):
+        """初始化指标"""
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, ModelTypeMetrics] = {}
+        self.started_at = time.time()
+
+    def record_success(self, model_type: str, model: str, latency: float,
+                       usage: Optional[Dict[str, Any]] = None, finish_reason: Optional[str] = None,
+                       streamed: bool = False) -> None:
+        """记录一次成功的上游请求
+
+        Args:
+            model_type: 模型类型
+            model: 实际使用的模型
+            latency: 耗时（秒，不含排队时间）
+            usage: API响应中的usage字段
+            finish_reason: 结束原因，length表示被max_tokens截断
+            streamed: 是否为流式请求
+        """
+        with self._lock:
+            metrics = self._get(model_type)
+            metrics.requests += 1
+            metrics.successes += 1
+            metrics.streamed += 1 if streamed else 0
+            metrics.truncated += 1 if finish_reason == "length" else 0
+            metrics.models[model] = metrics.models.get(model, 0) + 1
+            metrics.latency_ms.observe(latency * 1000)
+            if usage:
+                prompt_tokens = int(usage.get("prompt_tokens") or 0)
+                completion_tokens = int(usage.get("completion_tokens") or 0)
+                metrics.prompt_tokens_total += prompt_tokens
+                metrics.completion_tokens_total += completion_tokens
+                metrics.prompt_tokens.observe(prompt_tokens)
+                metrics.completion_tokens.observe(completion_tokens)
+
+    def record_error(self, model_type: str, kind: str) -> None:
+        """记录一次失败的请求
+
+        Args:
+            model_type: 模型类型
+            kind: 错误类型，如timeout、http_429、circuit_open、overloaded
+        """
+        with self._lock:
+            metrics = self._get(model_type)
+            metrics.requests += 1
+            metrics.errors[kind] = metrics.errors.get(kind, 0) + 1
+
+    def record_retry(self, model_type: str) -> None:
+        """记录一次重试"""
+        with self._lock:
+            self._get(model_type).retries += 1
+
+    def record_cache_hit(self, model_type: str) -> None:
+        """记录一次响应缓存命中"""
+        with self._lock:
+            self._get(model_type).cache_hits += 1
+
+    def record_coalesced(self, model_type: str) -> None:
+        """记录一次被合并的请求"""
+        with self._lock:
+            self._get(model_type).coalesced += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回所有模型类型的指标"""
+        with self._lock:
+            return {
+                "since": self.started_at,
+                "model_types": {model_type: metrics.snapshot() for model_type, metrics in self._metrics.items()}
+            }
+
+    def reset(self) -> None:
+        """清空指标"""
+        with self._lock:
+            self._metrics = {}
+            self.started_at = time.time()
+
+    def _get(self, model_type: str) -> ModelTypeMetrics:
+        """获取模型类型的指标，不存在时创建（调用方持有锁）"""
+        metrics = self._metrics.get(model_type)
+        if metrics is None:
+            metrics = ModelTypeMetrics()
+            self._metrics[model_type] = metrics
+        return metrics
@@ -0,0 +1,338 @@
+"""
+大模型调用容错模块，提供带抖动的退避、Retry-After解析、按模型的熔断器、延迟统计和并发限制
+"""
+
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Deque, Dict, Any, Optional, Tuple
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"模型{model}暂时不可用（熔断中），{retry_after:.0f}秒后重试")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """计算第attempt次重试前的等待时间（指数退避 + 全抖动）
+
+    Args:
+        attempt: 已失败的次数（从0开始）
+        base: 基础间隔（秒）
+        cap: 最长等待时间（秒）
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头，支持秒数和HTTP日期两种格式，无法解析时返回None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败达到阈值后打开，打开期间所有请求立即失败；
+    经过恢复时间后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        """初始化熔断器
+
+        Args:
+            name: 名称（通常为模型名）
+            failure_threshold: 连续失败多少次后打开
+            recovery_timeout: 打开后多久允许探测（秒）
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.open_count = 0
+        self.avg_latency_ms = 0.0
+        self.last_success_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+        self.last_error = ""
+
+    def allow_request(self) -> Tuple[bool, bool]:
+        """判断是否放行请求
+
+        Returns:
+            (是否放行, 是否为半开状态的探测请求)；只有探测请求在结束时需要调用release_probe
+        """
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True, False
+            if self.state == STATE_OPEN and time.time() - self.opened_at >= self.recovery_timeout:
+                self.state = STATE_HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"熔断器[{self.name}]进入半开状态，放行一个探测请求")
+            if self.state == STATE_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True, True
+            self.rejected += 1
+            return False, False
+
+    def retry_after(self) -> float:
+        """距离允许探测还需等待的秒数"""
+        with self._lock:
+            if self.state != STATE_OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.time() - self.opened_at))
+
+    def is_open(self) -> bool:
+        """是否处于打开或半开（探测中）状态"""
+        with self._lock:
+            return self.state != STATE_CLOSED
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        """记录一次成功
+
+        Args:
+            latency: 本次请求耗时（秒），用于计算平均延迟
+        """
+        with self._lock:
+            self.successes += 1
+            self.last_success_at = time.time()
+            if latency is not None:
+                latency_ms = latency * 1000
+                # 指数移动平均，近期请求权重更高
+                self.avg_latency_ms = latency_ms if self.successes == 1 else 0.8 * self.avg_latency_ms + 0.2 * latency_ms
+            self.consecutive_failures = 0
+            if self.state != STATE_CLOSED:
+                logger.info(f"熔断器[{self.name}]探测成功，恢复正常")
+            self.state = STATE_CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self, error: str = "") -> None:
+        """记录一次失败
+
+        Args:
+            error: 失败原因
+        """
+        with self._lock:
+            self.failures += 1
+            self.last_failure_at = time.time()
+            self.last_error = error[:200]
+            self.consecutive_failures += 1
+            if self.state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != STATE_OPEN:
+                    self.open_count += 1
+                    logger.warning(f"熔断器[{self.name}]打开，连续失败{self.consecutive_failures}次，"
+                                   f"{self.recovery_timeout}秒内直接拒绝请求")
+                self.state = STATE_OPEN
+                self.opened_at = time.time()
+                self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """探测请求没有得出结论（如被取消）时释放探测名额，只能由allow_request放行的探测请求调用"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        """返回熔断器统计信息"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "successes": self.successes,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "open_count": self.open_count,
+                "avg_latency_ms": round(self.avg_latency_ms, 1),
+                "last_success_at": self.last_success_at,
+                "last_failure_at": self.last_failure_at,
+                "last_error": self.last_error
+            }
+
+
+class LatencyTracker:
+    """滑动窗口延迟统计，保存最近若干次请求的耗时，用于计算分位数"""
+
+    def __init__(self, window: int = 200):
+        """初始化延迟统计
+
+        Args:
+            window: 保存的样本数
+        """
+        self._samples: Deque[float] = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        """记录一次耗时（秒）"""
+        with self._lock:
+            self._samples.append(latency)
+
+    def count(self) -> int:
+        """当前样本数"""
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """返回第p分位数（p取0~1），没有样本时返回None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(p * (len(samples) - 1)))))
+        return samples[index]
+
+
+class OverloadedError(Exception):
+    """并发已满且等待队列已满（或等待超时），请求被直接拒绝"""
+
+
+class ConcurrencyLimiter:
+    """异步并发限制器
+
+    同时进行的请求数不超过max_concurrency，其余请求按先来先到排队；
+    排队数达到max_queue时新请求立即被拒绝，排队超过queue_timeout秒也被拒绝，
+    避免突发流量全部涌向上游触发限流和重试风暴。只能在事件循环线程中使用。
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 8, max_queue: int = 32, queue_timeout: float = 15.0):
+        """初始化并发限制器
+
+        Args:
+            name: 名称（通常为模型类型）
+            max_concurrency: 最大并发数
+            max_queue: 最多允许排队等待的请求数
+            queue_timeout: 最长排队时间（秒）
+        """
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        # 统计信息
+        self.admitted = 0
+        self.queued = 0
+        self.waited = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queue_depth = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        """获取一个并发名额，退出时释放
+
+        Yields:
+            排队等待的时间（秒）
+
+        Raises:
+            OverloadedError: 排队已满或等待超时
+        """
+        waited = await self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    async def acquire(self) -> float:
+        """获取一个并发名额，返回排队等待的时间（秒）"""
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise OverloadedError(f"{self.name}请求过多，排队数已达上限{self.max_queue}")
+
+        start_time = time.time()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # 放弃等待的同时恰好拿到了名额，转交给下一个请求
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise OverloadedError(f"{self.name}请求排队超过{self.queue_timeout}秒") from None
+            raise
+
+        waited = time.time() - start_time
+        self.admitted += 1
+        self.waited += 1
+        self.total_wait_ms += waited * 1000
+        self.max_wait_ms = max(self.max_wait_ms, waited * 1000)
+        return waited
+
+    def try_acquire(self) -> bool:
+        """有空闲名额且无人排队时立即获取一个名额并返回True，否则不等待直接返回False"""
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        """释放名额，有排队的请求时直接转交给最早的一个"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回并发限制器统计信息"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_queue_ms": round(self.total_wait_ms / self.waited, 3) if self.waited else 0.0,
+            "max_queue_ms": round(self.max_wait_ms, 3)
+        }
@@ -0,0 +1,266 @@
+"""
+本地问题分类模型，使用字符n-gram哈希特征和NumPy实现的softmax线性分类器，
+在快速规则无法判断时代替大模型完成大部分分类
+"""
+
+import os
+import re
+import json
+import zlib
+import time
+import logging
+import threading
+import numpy as np
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+
+from app.core.config import settings
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+# 标注好的种子数据
+SEED_FILE = os.path.join(BACKEND_DIR, "app", "db", "sample_data", "classification_seed.json")
+# 线上分类记录（由问题分类器写入）
+CLASSIFICATION_LOG_FILE = os.path.join(BACKEND_DIR, "monitoring", "classifications.jsonl")
+# 默认模型文件
+DEFAULT_MODEL_FILE = os.path.join(BACKEND_DIR, "cache", "local_classifier.npz")
+
+# 可以作为训练标签的分类记录来源：只用大模型分类，快速规则与标注数据分歧较大，不作为标签
+TRAINABLE_SOURCES = {"model"}
+# 旧记录只有问题预览，超过50字的问题被截断为50字加"..."
+PREVIEW_LENGTH = 50
+
+
+class LocalQuestionClassifier:
+    """字符n-gram哈希特征 + softmax线性分类器"""
+
+    def __init__(self, n_features: int = 8192, ngram_range: Tuple[int, int] = (1, 3)):
+        """初始化模型
+
+        Args:
+            n_features: 哈希特征维数
+            ngram_range: 字符n-gram的最小和最大长度
+        """
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.labels: List[str] = []
+        self.weights: Optional[np.ndarray] = None
+        self.bias: Optional[np.ndarray] = None
+        self.trained_at: Optional[float] = None
+        self.train_size = 0
+
+        # 统计信息
+        self._lock = threading.Lock()
+        self.predictions = 0
+        self.accepted = 0
+
+    @property
+    def ready(self) -> bool:
+        """模型是否已训练"""
+        return self.weights is not None
+
+    def featurize(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """提取特征，返回(特征下标, L2归一化后的特征值)"""
+        text = re.sub(r"[^\w]", "", text.lower())
+        text = f"^{text}$"
+        counts: Dict[int, float] = {}
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for start in range(len(text) - n + 1):
+                index = zlib.crc32(text[start:start + n].encode("utf-8")) % self.n_features
+                counts[index] = counts.get(index, 0.0) + 1.0
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        norm = np.linalg.norm(values)
+        return indices, values / norm if norm else values
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """预测分类，返回(分类, 置信度)"""
+        if not self.ready:
+            raise RuntimeError("本地分类模型尚未训练")
+        indices, values = self.featurize(text)
+        logits = values @ self.weights[indices] + self.bias
+        probs = self._softmax(logits[None, :])[0]
+        best = int(np.argmax(probs))
+        return self.labels[best], float(probs[best])
+
+    def classify(self, text: str, threshold: float) -> Optional[Tuple[str, float]]:
+        """置信度达到阈值时返回(分类, 置信度)，否则返回None"""
+        label, confidence = self.predict(text)
+        with self._lock:
+            self.predictions += 1
+            if confidence >= threshold:
+                self.accepted += 1
+        return (label, confidence) if confidence >= threshold else None
+
+    def train(self, questions: List[str], labels: List[str], epochs: int = 100,
+              learning_rate: float = 10.0, l2: float = 1e-5, batch_size: int = 256, seed: int = 42) -> None:
+        """用小批量梯度下降训练模型，按类别频率加权，避免大类淹没小类
+
+        Args:
+            questions: 问题列表
+            labels: 对应的分类
+            epochs: 训练轮数
+            learning_rate: 学习率
+            l2: L2正则系数
+            batch_size: 批大小
+            seed: 随机种子
+        """
+        self.labels = sorted(set(labels))
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        y = np.array([label_index[label] for label in labels])
+        features = [self.featurize(question) for question in questions]
+        class_counts = np.bincount(y, minlength=len(self.labels))
+        sample_weights = (len(y) / (len(self.labels) * class_counts[y])).astype(np.float32)
+
+        rng = np.random.default_rng(seed)
+        weights = np.zeros((self.n_features, len(self.labels)), dtype=np.float32)
+        bias = np.zeros(len(self.labels), dtype=np.float32)
+        for _ in range(epochs):
+            order = rng.permutation(len(y))
+            for start in range(0, len(y), batch_size):
+                batch = order[start:start + batch_size]
+                x = self._densify([features[i] for i in batch])
+                probs = self._softmax(x @ weights + bias)
+                grad = probs
+                grad[np.arange(len(batch)), y[batch]] -= 1
+                grad *= sample_weights[batch, None] / len(batch)
+                weights -= learning_rate * (x.T @ grad + l2 * weights)
+                bias -= learning_rate * grad.sum(axis=0)
+
+        self.weights = weights
+        self.bias = bias
+        self.trained_at = time.time()
+        self.train_size = len(y)
+
+    def evaluate(self, questions: List[str], labels: List[str], threshold: float) -> Dict[str, Any]:
+        """评估准确率以及在置信度阈值下的覆盖率和准确率"""
+        predictions = [self.predict(question) for question in questions]
+        correct = [label == predicted for label, (predicted, _) in zip(labels, predictions)]
+        confident = [ok for ok, (_, confidence) in zip(correct, predictions) if confidence >= threshold]
+        return {
+            "samples": len(labels),
+            "accuracy": round(sum(correct) / len(correct), 3) if correct else 0.0,
+            "threshold": threshold,
+            "coverage": round(len(confident) / len(correct), 3) if correct else 0.0,
+            "confident_accuracy": round(sum(confident) / len(confident), 3) if confident else 0.0
+        }
+
+    def save(self, path: str) -> None:
+        """保存模型（写入临时文件后原子替换）"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            weights=self.weights,
+            bias=self.bias,
+            labels=np.array(self.labels),
+            meta=np.array(json.dumps({
+                "n_features": self.n_features,
+                "ngram_range": list(self.ngram_range),
+                "trained_at": self.trained_at,
+                "train_size": self.train_size
+            }))
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalQuestionClassifier":
+        """从文件加载模型"""
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            model = cls(meta["n_features"], tuple(meta["ngram_range"]))
+            model.weights = data["weights"]
+            model.bias = data["bias"]
+            model.labels = [str(label) for label in data["labels"]]
+        model.trained_at = meta.get("trained_at")
+        model.train_size = meta.get("train_size", 0)
+        return model
+
+    def stats(self) -> Dict[str, Any]:
+        """返回模型信息和预测统计"""
+        return {
+            "ready": self.ready,
+            "labels": self.labels,
+            "train_size": self.train_size,
+            "trained_at": self.trained_at,
+            "predictions": self.predictions,
+            "accepted": self.accepted,
+            "accept_rate": round(self.accepted / self.predictions, 3) if self.predictions else 0.0
+        }
+
+    def _densify(self, rows: List[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+        """把稀疏特征转为稠密矩阵"""
+        x = np.zeros((len(rows), self.n_features), dtype=np.float32)
+        for i, (indices, values) in enumerate(rows):
+            x[i, indices] = values
+        return x
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        """按行计算softmax"""
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+def load_training_data(seed_file: str = SEED_FILE, log_file: Optional[str] = CLASSIFICATION_LOG_FILE,
+                       valid_labels: Optional[Iterable[str]] = None) -> Tuple[List[str], List[str]]:
+    """加载训练数据：种子数据加上线上分类记录中大模型给出的分类
+
+    同一问题出现多次时以最后一次记录为准，种子数据优先于线上记录。
+    优先使用记录中的完整问题，旧记录只有问题预览，被截断的预览不参与训练。
+    """
+    samples: Dict[str, str] = {}
+    if log_file and os.path.exists(log_file):
+        with open(log_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                # 旧记录没有source字段，默认视为模型分类
+                if record.get("source", "model") not in TRAINABLE_SOURCES:
+                    continue
+                question = record.get("question")
+                if question is None:
+                    question = record.get("question_preview", "")
+                    if len(question) == PREVIEW_LENGTH + 3 and question.endswith("..."):
+                        continue
+                if question and record.get("classification"):
+                    samples[question] = record["classification"]
+
+    with open(seed_file, "r", encoding="utf-8") as f:
+        for row in json.load(f):
+            samples[row["question"]] = row["label"]
+
+    if valid_labels is not None:
+        valid = set(valid_labels)
+        samples = {question: label for question, label in samples.items() if label in valid}
+    return list(samples.keys()), list(samples.values())
+
+
+def load_local_classifier() -> Optional[LocalQuestionClassifier]:
+    """加载本地分类模型，模型文件不存在时用种子数据现场训练"""
+    if not settings.LOCAL_CLASSIFIER_ENABLED:
+        return None
+    path = settings.LOCAL_CLASSIFIER_PATH or DEFAULT_MODEL_FILE
+    try:
+        if os.path.exists(path):
+            model = LocalQuestionClassifier.load(path)
+            logger.info(f"已加载本地分类模型: {path}，训练样本{model.train_size}条")
+            return model
+        start_time = time.time()
+        questions, labels = load_training_data(log_file=None)
+        model = LocalQuestionClassifier()
+        model.train(questions, labels)
+        logger.info(f"未找到本地分类模型，已用{len(labels)}条种子数据训练，耗时{time.time() - start_time:.2f}秒")
+        return model
+    except Exception as e:
+        logger.warning(f"加载本地分类模型失败，将直接使用大模型分类: {str(e)}")
+        return None
+
+
+# 创建全局本地分类模型实例
+local_classifier = load_local_classifier()
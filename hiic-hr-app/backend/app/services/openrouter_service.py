@@ -2,17 +2,33 @@
 OpenRouter服务模块，提供与OpenRouter API的集成
 """
 
+import os
+import re
 import json
-import requests
+import hashlib
+import asyncio
+import httpx
 import logging
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
 from app.core.model_config import model_manager
 from app.core.config import settings
+from app.services.llm_cache import LLMResponseCache
+from app.services.llm_metrics import LLMMetrics
+from app.services.llm_resilience import (
+    CircuitBreaker, CircuitOpenError, ConcurrencyLimiter, LatencyTracker, OverloadedError,
+    backoff_delay, parse_retry_after
+)
 
 # 设置日志记录器
 logger = logging.getLogger(__name__)
 
+# 需要重试的客户端错误状态码（超时、限流），5xx均重试
+RETRYABLE_STATUS_CODES = {408, 429}
+
+# 请求过多被拒绝时返回给用户的提示
+OVERLOADED_MESSAGE = "抱歉，当前咨询的人比较多，请稍等片刻再试一次。"
+
 class OpenRouterService:
     """OpenRouter服务类，提供与OpenRouter API的交互"""
     
@@ -42,48 +58,193 @@ class OpenRouterService:
                 if len(token) > 10:
                     debug_headers["Authorization"] = f"{auth_parts[0]} {token[:10]}..."
         logger.debug(f"OpenRouter API请求头: {debug_headers}")
+        
+        # 异步HTTP客户端，连接池和keep-alive连接在所有请求之间复用（首次使用时创建）
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.limits = httpx.Limits(
+            max_connections=settings.OPENROUTER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENROUTER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENROUTER_KEEPALIVE_EXPIRY
+        )
+        
+        # 模型名 -> 熔断器（同时记录各模型的健康状况）
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # 模型类型 -> 切换到备用模型的次数
+        self.failover_counts: Dict[str, int] = {}
+        # 模型类型 -> 主模型的近期延迟，以及发出对冲请求和对冲请求胜出的次数
+        self.latency_trackers: Dict[str, LatencyTracker] = {}
+        self.hedge_counts: Dict[str, int] = {}
+        self.hedge_win_counts: Dict[str, int] = {}
+        # 没有空闲并发名额而放弃对冲的次数
+        self.hedge_skipped_counts: Dict[str, int] = {}
+        self.hedge_types = {t.strip() for t in settings.MODEL_HEDGE_TYPES.split(",") if t.strip()}
+        # 请求合并键 -> 进行中的上游调用；模型类型 -> 被合并的请求数
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # 进行中的上游调用 -> 等待结果的调用方数量
+        self._inflight_waiters: Dict[asyncio.Task, int] = {}
+        self.coalesced_counts: Dict[str, int] = {}
+        
+        # 按模型类型统计的调用指标
+        self.metrics = LLMMetrics()
+        
+        # 模型类型 -> 并发限制器
+        self.limiters: Dict[str, ConcurrencyLimiter] = {}
+        self.concurrency_overrides = self._parse_concurrency_overrides(settings.MODEL_CONCURRENCY_OVERRIDES)
+        
+        # 确定性模型类型的磁盘响应缓存
+        self.cache_types = {t.strip() for t in settings.MODEL_CACHE_TYPES.split(",") if t.strip()}
+        self.response_cache = self._create_response_cache() if self.cache_types else None
     
-    def chat_completion(self, messages: List[Dict[str, str]], model_type: str = "chat") -> Dict[str, Any]:
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取当前事件循环上的HTTP客户端，不存在时创建"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            # 客户端绑定创建它的事件循环，事件循环变化时（如测试脚本多次asyncio.run）重新创建
+            self._client = httpx.AsyncClient(headers=self.headers, limits=self.limits)
+            self._client_loop = loop
+            logger.info(
+                f"已创建OpenRouter HTTP客户端，最大连接数 {self.limits.max_connections}，"
+                f"keep-alive连接数 {self.limits.max_keepalive_connections}"
+            )
+        return self._client
+    
+    def _create_response_cache(self) -> Optional[LLMResponseCache]:
+        """打开磁盘响应缓存，失败时不使用缓存"""
+        path = settings.MODEL_CACHE_PATH
+        if not path:
+            cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "cache")
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, "llm_response_cache.db")
+        try:
+            return LLMResponseCache(path, settings.MODEL_CACHE_MAX_ENTRIES, settings.MODEL_CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"打开大模型响应缓存失败，不使用缓存: {str(e)}")
+            return None
+    
+    async def close(self) -> None:
+        """关闭HTTP客户端，释放连接池"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("OpenRouter HTTP客户端已关闭")
+        self._client = None
+        self._client_loop = None
+    
+    async def chat_completion(self, messages: List[Dict[str, str]], model_type: str = "chat",
+                              cache_scope: Optional[str] = None) -> Dict[str, Any]:
         """发送聊天请求到OpenRouter
         
         Args:
             messages: 消息列表
             model_type: 模型类型
+            cache_scope: 响应缓存的作用范围，不同范围的相同请求分别缓存
+                （如SQL生成传入数据指纹，数据变化后旧的SQL不再命中）
             
         Returns:
             OpenRouter API响应
         """
-        # 根据模型类型获取配置
-        if model_type == "classifier":
-            config = model_manager.get_classifier_config()
-        elif model_type == "sql":
-            config = model_manager.get_sql_config()
-        elif model_type == "hybrid":
-            config = model_manager.get_hybrid_config()
-        else:
-            config = model_manager.get_chat_config()
+        config = self._get_model_config(model_type)
+        key = self._request_key(messages, config, model_type, cache_scope)
+        
+        # 确定性的模型类型先查磁盘缓存
+        cache_key = key if self.response_cache is not None and model_type in self.cache_types else None
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"{model_type}请求命中响应缓存")
+                self.metrics.record_cache_hit(model_type)
+                return cached
+        
+        if not settings.MODEL_COALESCE_ENABLED:
+            return await self._complete(messages, config, model_type, cache_key)
         
+        # 相同模型、参数和消息的并发请求合并为一次上游调用，结果分发给所有调用方
+        task = self._inflight.get(key)
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            self.coalesced_counts[model_type] = self.coalesced_counts.get(model_type, 0) + 1
+            self.metrics.record_coalesced(model_type)
+            logger.info(f"合并相同的{model_type}请求，等待进行中的上游调用")
+        else:
+            task = asyncio.create_task(self._complete(messages, config, model_type, cache_key))
+            self._inflight[key] = task
+            self._inflight_waiters[task] = 0
+            task.add_done_callback(lambda t: self._forget_inflight(key, t))
+        # shield：某个调用方被取消时不影响其他等待同一结果的调用方；
+        # 所有调用方都取消时（如被放弃的预测性请求）取消上游调用，释放并发名额
+        self._inflight_waiters[task] = self._inflight_waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._inflight_waiters.get(task) == 1 and not task.done():
+                logger.info(f"{model_type}请求的所有调用方都已取消，取消上游调用")
+                task.cancel()
+            raise
+        finally:
+            if task in self._inflight_waiters:
+                self._inflight_waiters[task] -= 1
+    
+    def cache_key_for(self, messages: List[Dict[str, str]], model_type: str = "chat",
+                      cache_scope: Optional[str] = None) -> Optional[str]:
+        """返回请求对应的响应缓存键，该模型类型不缓存时返回None"""
+        if self.response_cache is None or model_type not in self.cache_types:
+            return None
+        return self._request_key(messages, self._get_model_config(model_type), model_type, cache_scope)
+    
+    def evict_cached_response(self, cache_key: Optional[str]) -> None:
+        """删除缓存的响应，用于回复内容事后验证失败（如生成的SQL无法执行）的情况"""
+        if not cache_key or self.response_cache is None:
+            return
+        try:
+            if self.response_cache.delete(cache_key):
+                logger.info("已删除验证失败的缓存响应")
+        except Exception as e:
+            logger.warning(f"删除大模型响应缓存失败: {str(e)}")
+    
+    def _forget_inflight(self, key: str, task: asyncio.Task) -> None:
+        """上游调用结束后从进行中列表移除"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        self._inflight_waiters.pop(task, None)
+        # 所有调用方都已取消时异常无人读取，在此读取以免asyncio报告未处理的异常
+        if not task.cancelled():
+            task.exception()
+    
+    def _request_key(self, messages: List[Dict[str, str]], config: Dict[str, Any], model_type: str,
+                     scope: Optional[str] = None) -> str:
+        """计算请求的合并键和缓存键（模型类型、模型、温度、最大token数、作用范围和消息内容的哈希）"""
+        payload = json.dumps({
+            "model_type": model_type,
+            "scope": scope,
+            "model": config["model"],
+            "temperature": config["temperature"],
+            "max_tokens": config.get("max_tokens"),
+            "messages": messages
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    async def _complete(self, messages: List[Dict[str, str]], config: Dict[str, Any], model_type: str,
+                        cache_key: Optional[str] = None) -> Dict[str, Any]:
+        """发送一次上游请求并解析响应，指定cache_key时把成功的响应写入缓存"""
         # 记录模型和消息信息（调试用）
         logger.info(f"使用模型: {config['model']}")
         logger.info(f"消息数量: {len(messages)}")
         
-        # 构建请求数据
-        data = {
-            "model": config["model"],
-            "messages": messages,
-            "temperature": config["temperature"]
-        }
-        
-        # 如果设置了最大token数，添加到请求中
-        if "max_tokens" in config and config["max_tokens"] > 0:
-            data["max_tokens"] = config["max_tokens"]
-        
-        # 发送请求
-        response = self._send_api_request(
-            data, 
-            retry_count=config["retry_count"],
-            timeout=config["timeout"]
-        )
+        try:
+            # 按模型类型限制并发，排队已满或超时时抛出OverloadedError
+            async with self._get_limiter(model_type).slot() as waited:
+                if waited:
+                    logger.info(f"{model_type}请求排队{waited:.2f}秒后开始")
+                start_time = time.time()
+                # 主模型在前，备用模型在后；主模型熔断或重试耗尽时切换到备用模型
+                candidates = self._get_candidate_models(config["model"])
+                hedge_delay = self._get_hedge_delay(model_type) if len(candidates) > 1 else None
+                if hedge_delay is not None:
+                    response = await self._send_hedged(messages, config, model_type, candidates, hedge_delay)
+                else:
+                    response = await self._send_with_failover(messages, config, model_type, candidates)
+        except Exception as e:
+            self.metrics.record_error(model_type, self._error_kind(e))
+            raise
             
         # 检查响应状态
         if response.status_code == 200:
@@ -91,85 +252,340 @@ class OpenRouterService:
             response_data = response.json()
             
             # 记录回复内容（调试用）
-            content = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+            choice = response_data.get("choices", [{}])[0]
+            content = choice.get("message", {}).get("content", "")
             logger.info(f"收到OpenRouter回复: \n{content[:100]}...")
             
+            self.metrics.record_success(
+                model_type,
+                json.loads(response.request.content).get("model", config["model"]),
+                time.time() - start_time,
+                usage=response_data.get("usage"),
+                finish_reason=choice.get("finish_reason")
+            )
+            
+            if cache_key and content:
+                try:
+                    self.response_cache.put(cache_key, model_type, response_data)
+                except Exception as e:
+                    logger.warning(f"写入大模型响应缓存失败: {str(e)}")
+            
             return response_data
         else:
             error_message = f"OpenRouter API返回错误: 状态码 {response.status_code}, 响应: {response.text}"
             logger.error(error_message)
+            self.metrics.record_error(model_type, f"http_{response.status_code}")
             raise Exception(error_message)
     
-    def _send_api_request(self, data: Dict[str, Any], retry_count: int = 3, timeout: int = 30):
-        """发送API请求，支持重试
+    async def _send_with_failover(self, messages: List[Dict[str, str]], config: Dict[str, Any],
+                                  model_type: str, candidates: List[str]) -> httpx.Response:
+        """依次尝试各个模型，前一个模型不可用时切换到下一个"""
+        for index, model in enumerate(candidates):
+            # 备用模型沿用当前模型类型的温度和最大token数
+            data = self._build_request_data(messages, config, model)
+            start_time = time.time()
+            try:
+                response = await self._send_api_request(
+                    data, 
+                    retry_count=config["retry_count"],
+                    timeout=config["timeout"],
+                    model_type=model_type
+                )
+            except Exception as e:
+                if index == len(candidates) - 1:
+                    raise
+                self.failover_counts[model_type] = self.failover_counts.get(model_type, 0) + 1
+                logger.warning(f"模型{model}不可用（{str(e)}），切换到备用模型{candidates[index + 1]}")
+                continue
+            if index == 0 and response.status_code == 200:
+                self._get_latency_tracker(model_type).record(time.time() - start_time)
+            return response
+    
+    async def _send_hedged(self, messages: List[Dict[str, str]], config: Dict[str, Any],
+                           model_type: str, candidates: List[str], hedge_delay: float) -> httpx.Response:
+        """对冲请求：主模型超过延迟阈值仍未返回时，向备用模型发送同样的请求，取先成功的结果
+        
+        Args:
+            messages: 消息列表
+            config: 模型配置
+            model_type: 模型类型
+            candidates: [主模型, 备用模型]
+            hedge_delay: 发出对冲请求前等待主模型的时间（秒）
+        """
+        primary, backup = candidates[0], candidates[1]
+        tracker = self._get_latency_tracker(model_type)
+        start_time = time.time()
+        primary_task = asyncio.create_task(self._send_api_request(
+            self._build_request_data(messages, config, primary),
+            retry_count=config["retry_count"],
+            timeout=config["timeout"],
+            model_type=model_type
+        ))
+        tasks = {primary_task}
+        limiter = self._get_limiter(model_type)
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done and not limiter.try_acquire():
+                # 对冲请求要另外占用一个并发名额，没有空闲名额时不对冲，继续等待主模型
+                self.hedge_skipped_counts[model_type] = self.hedge_skipped_counts.get(model_type, 0) + 1
+                logger.info(f"{model_type}没有空闲的并发名额，不发出对冲请求，继续等待模型{primary}")
+                done, _ = await asyncio.wait(tasks)
+            if done:
+                # 主模型在阈值内返回；失败时按普通流程切换到备用模型
+                if primary_task.exception() is None:
+                    if primary_task.result().status_code == 200:
+                        tracker.record(time.time() - start_time)
+                    return primary_task.result()
+                self.failover_counts[model_type] = self.failover_counts.get(model_type, 0) + 1
+                logger.warning(f"模型{primary}不可用（{str(primary_task.exception())}），切换到备用模型{backup}")
+                return await self._send_with_failover(messages, config, model_type, candidates[1:])
+            
+            logger.info(f"模型{primary}超过{hedge_delay:.2f}秒未返回，向备用模型{backup}发出对冲请求")
+            self.hedge_counts[model_type] = self.hedge_counts.get(model_type, 0) + 1
+            hedge_task = asyncio.create_task(self._send_api_request(
+                self._build_request_data(messages, config, backup),
+                retry_count=config["retry_count"],
+                timeout=config["timeout"],
+                model_type=model_type
+            ))
+            # 对冲请求结束（完成或被取消）时释放它占用的并发名额
+            hedge_task.add_done_callback(lambda _: limiter.release())
+            tasks.add(hedge_task)
+            
+            pending = set(tasks)
+            last_task = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    last_task = task
+                    if task.exception() is None and task.result().status_code == 200:
+                        if task is hedge_task:
+                            self.hedge_win_counts[model_type] = self.hedge_win_counts.get(model_type, 0) + 1
+                        # 备用模型胜出时主模型被取消，其真实延迟不小于已等待的时间，
+                        # 按已等待时间记录，避免阈值只由快的请求决定而被低估
+                        tracker.record(time.time() - start_time)
+                        return task.result()
+            
+            # 两个请求都失败，返回（或抛出）最后完成的结果
+            return last_task.result()
+        finally:
+            # 取消落后的请求
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def _error_kind(self, error: Exception) -> str:
+        """把异常归类为指标中的错误类型"""
+        if isinstance(error, CircuitOpenError):
+            return "circuit_open"
+        if isinstance(error, OverloadedError):
+            return "overloaded"
+        if isinstance(error, httpx.TimeoutException):
+            return "timeout"
+        if isinstance(error, httpx.TransportError):
+            return "connection"
+        match = re.search(r"状态码:?\s*(\d{3})", str(error))
+        return f"http_{match.group(1)}" if match else "other"
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """返回按模型类型统计的调用指标，附带当前的max_tokens配置便于对照调整"""
+        metrics = self.metrics.snapshot()
+        for model_type, values in metrics["model_types"].items():
+            values["max_tokens"] = self._get_model_config(model_type).get("max_tokens")
+        return metrics
+    
+    def _get_limiter(self, model_type: str) -> ConcurrencyLimiter:
+        """获取模型类型对应的并发限制器，不存在时创建"""
+        limiter = self.limiters.get(model_type)
+        if limiter is None:
+            limiter = ConcurrencyLimiter(
+                model_type,
+                max_concurrency=self.concurrency_overrides.get(model_type, settings.MODEL_MAX_CONCURRENCY),
+                max_queue=settings.MODEL_MAX_QUEUE,
+                queue_timeout=settings.MODEL_QUEUE_TIMEOUT
+            )
+            self.limiters[model_type] = limiter
+        return limiter
+    
+    def _parse_concurrency_overrides(self, value: str) -> Dict[str, int]:
+        """解析按模型类型覆盖的并发数，格式如 classifier=16,sql=4"""
+        overrides = {}
+        for item in value.split(","):
+            model_type, _, limit = item.partition("=")
+            try:
+                overrides[model_type.strip()] = int(limit)
+            except ValueError:
+                if item.strip():
+                    logger.warning(f"忽略无效的并发数配置: {item}")
+        return overrides
+    
+    def _get_latency_tracker(self, model_type: str) -> LatencyTracker:
+        """获取模型类型对应的延迟统计，不存在时创建"""
+        tracker = self.latency_trackers.get(model_type)
+        if tracker is None:
+            tracker = LatencyTracker(settings.MODEL_HEDGE_WINDOW)
+            self.latency_trackers[model_type] = tracker
+        return tracker
+    
+    def _get_hedge_delay(self, model_type: str) -> Optional[float]:
+        """返回对冲请求的延迟阈值，该模型类型未开启对冲或样本不足时返回None"""
+        if model_type not in self.hedge_types:
+            return None
+        tracker = self._get_latency_tracker(model_type)
+        if tracker.count() < settings.MODEL_HEDGE_MIN_SAMPLES:
+            return None
+        return tracker.percentile(settings.MODEL_HEDGE_PERCENTILE)
+    
+    def _get_model_config(self, model_type: str) -> Dict[str, Any]:
+        """根据模型类型获取配置"""
+        if model_type == "classifier":
+            return model_manager.get_classifier_config()
+        elif model_type == "sql":
+            return model_manager.get_sql_config()
+        elif model_type == "hybrid":
+            return model_manager.get_hybrid_config()
+        else:
+            return model_manager.get_chat_config()
+    
+    def _get_candidate_models(self, primary_model: str) -> List[str]:
+        """返回依次尝试的模型列表"""
+        backup_model = model_manager.get_backup_config()["model"]
+        if settings.MODEL_FAILOVER_ENABLED and backup_model and backup_model != primary_model:
+            return [primary_model, backup_model]
+        return [primary_model]
+    
+    def _build_request_data(self, messages: List[Dict[str, str]], config: Dict[str, Any],
+                            model: Optional[str] = None) -> Dict[str, Any]:
+        """构建请求数据
+        
+        Args:
+            messages: 消息列表
+            config: 模型配置
+            model: 实际使用的模型，默认为配置中的模型
+        """
+        data = {
+            "model": model or config["model"],
+            "messages": messages,
+            "temperature": config["temperature"]
+        }
+        
+        # 如果设置了最大token数，添加到请求中
+        if "max_tokens" in config and config["max_tokens"] > 0:
+            data["max_tokens"] = config["max_tokens"]
+        return data
+    
+    def _get_breaker(self, model: str) -> CircuitBreaker:
+        """获取模型对应的熔断器，不存在时创建"""
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                model,
+                failure_threshold=settings.MODEL_CIRCUIT_FAILURE_THRESHOLD,
+                recovery_timeout=settings.MODEL_CIRCUIT_RECOVERY_SECONDS
+            )
+            self.breakers[model] = breaker
+        return breaker
+    
+    async def _send_api_request(self, data: Dict[str, Any], retry_count: int = 3, timeout: int = 30,
+                                model_type: Optional[str] = None) -> httpx.Response:
+        """发送API请求，支持重试和熔断
+        
+        失败后按指数退避加全抖动等待重试；429/503响应带有Retry-After时按其等待，
+        等待时间超过MODEL_RETRY_MAX_WAIT则不再重试。超时、连接错误、429和5xx计为模型失败，
+        连续失败达到阈值后熔断器打开，打开期间该模型的请求直接抛出CircuitOpenError。
         
         Args:
             data: 请求数据
             retry_count: 重试次数
             timeout: 超时时间（秒）
+            model_type: 模型类型，用于统计重试次数
             
         Returns:
             API响应
         """
         # 获取配置的重试间隔，默认为2秒
         retry_interval = int(settings.MODEL_RETRY_INTERVAL) if hasattr(settings, 'MODEL_RETRY_INTERVAL') else 2
+        max_wait = settings.MODEL_RETRY_MAX_WAIT
+        
+        model = data.get("model", "")
+        breaker = self._get_breaker(model)
+        allowed, is_probe = breaker.allow_request()
+        if not allowed:
+            retry_after = breaker.retry_after()
+            logger.warning(f"模型{model}熔断中，直接失败（{retry_after:.1f}秒后允许探测）")
+            raise CircuitOpenError(model, retry_after)
         
+        client = self._get_client()
         last_exception = None
-        for attempt in range(retry_count):
-            try:
-                # 记录请求开始时间
-                start_time = time.time()
-                logger.info(f"发送API请求，尝试 {attempt+1}/{retry_count}，超时设置: {timeout}秒")
-                
-                response = requests.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json=data,
-                    timeout=timeout
-                )
-                
-                # 记录请求耗时
-                elapsed_time = time.time() - start_time
-                logger.info(f"API请求耗时: {elapsed_time:.2f}秒")
-                
-                # 请求成功
-                if response.status_code == 200:
-                    logger.info(f"API请求成功，状态码: {response.status_code}")
-                    return response
-                
-                # 请求失败但收到了响应
-                error_message = f"API请求返回非200状态码: {response.status_code}, 响应: {response.text}"
-                logger.error(error_message)
-                
-                # 对于特定的错误码，我们可能不需要重试
-                if response.status_code == 400:  # 请求参数错误，重试也没用
-                    logger.error("请求参数错误，不再重试")
-                    return response
-                
-                # 服务器错误可能需要重试
-                if attempt < retry_count - 1:
-                    # 指数退避重试
-                    sleep_time = retry_interval * (2 ** attempt)
-                    logger.info(f"等待 {sleep_time} 秒后重试...")
-                    time.sleep(sleep_time)
+        try:
+            for attempt in range(retry_count):
+                retry_after = None
+                try:
+                    # 记录请求开始时间
+                    start_time = time.time()
+                    logger.info(f"发送API请求，尝试 {attempt+1}/{retry_count}，超时设置: {timeout}秒")
+                    
+                    response = await client.post(
+                        self.api_url,
+                        json=data,
+                        timeout=timeout
+                    )
+                    
+                    # 记录请求耗时
+                    elapsed_time = time.time() - start_time
+                    logger.info(f"API请求耗时: {elapsed_time:.2f}秒")
+                    
+                    # 请求成功
+                    if response.status_code == 200:
+                        logger.info(f"API请求成功，状态码: {response.status_code}")
+                        breaker.record_success(elapsed_time)
+                        return response
+                    
+                    # 请求失败但收到了响应
+                    error_message = f"API请求返回非200状态码: {response.status_code}, 响应: {response.text}"
+                    logger.error(error_message)
+                    
+                    # 请求本身有问题（参数、鉴权等），重试也没用，也不计为模型失败
+                    if response.status_code not in RETRYABLE_STATUS_CODES and response.status_code < 500:
+                        logger.error("请求参数错误，不再重试")
+                        return response
+                    
+                    # 限流或服务端错误
+                    breaker.record_failure(f"HTTP {response.status_code}")
+                    if response.status_code in (429, 503):
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    last_exception = Exception(error_message)
+                except httpx.TimeoutException as e:
+                    logger.error(f"API请求超时(尝试 {attempt+1}/{retry_count}): {str(e)}")
+                    breaker.record_failure("timeout")
+                    last_exception = e
+                except Exception as e:
+                    logger.error(f"API请求失败(尝试 {attempt+1}/{retry_count}): {str(e)}")
+                    breaker.record_failure(str(e))
+                    last_exception = e
                 
-                last_exception = Exception(error_message)
-            except requests.exceptions.Timeout as e:
-                logger.error(f"API请求超时(尝试 {attempt+1}/{retry_count}): {str(e)}")
-                last_exception = e
-                if attempt < retry_count - 1:
-                    # 超时情况下，可能需要更长的重试间隔
-                    sleep_time = retry_interval * (2 ** attempt)
-                    logger.info(f"请求超时，等待 {sleep_time} 秒后重试...")
-                    time.sleep(sleep_time)
-            except Exception as e:
-                logger.error(f"API请求失败(尝试 {attempt+1}/{retry_count}): {str(e)}")
-                last_exception = e
-                if attempt < retry_count - 1:
-                    # 指数退避重试
-                    sleep_time = retry_interval * (2 ** attempt)
-                    logger.info(f"等待 {sleep_time} 秒后重试...")
-                    time.sleep(sleep_time)
+                if attempt >= retry_count - 1:
+                    break
+                # 熔断器已打开，不再继续重试
+                if breaker.is_open():
+                    logger.warning(f"模型{model}已熔断，停止重试")
+                    break
+                if retry_after is not None:
+                    if retry_after > max_wait:
+                        logger.warning(f"Retry-After为{retry_after:.1f}秒，超过最长等待时间{max_wait}秒，停止重试")
+                        break
+                    sleep_time = retry_after
+                else:
+                    sleep_time = backoff_delay(attempt, retry_interval, max_wait)
+                logger.info(f"等待 {sleep_time:.2f} 秒后重试...")
+                if model_type:
+                    self.metrics.record_retry(model_type)
+                await asyncio.sleep(sleep_time)
+        finally:
+            # 半开状态的探测请求未得出结论（如参数错误或被取消）时，释放探测名额；
+            # 普通请求不能释放，否则会清除其他请求持有的探测名额
+            if is_probe:
+                breaker.release_probe()
         
         # 所有重试都失败
         if last_exception:
@@ -179,12 +595,36 @@ class OpenRouterService:
         # 不应该到达这里，但以防万一
         raise Exception("API请求失败，所有重试尝试都失败")
     
-    async def get_chat_response(self, messages: List[Dict[str, str]], model_type: str = "chat") -> str:
+    def get_stats(self) -> Dict[str, Any]:
+        """返回各模型的健康状况和备用模型切换次数"""
+        return {
+            "circuit_breakers": {model: breaker.stats() for model, breaker in self.breakers.items()},
+            "failover": dict(self.failover_counts),
+            "coalesced": dict(self.coalesced_counts),
+            "inflight": len(self._inflight),
+            "response_cache": self.response_cache.stats() if self.response_cache is not None else None,
+            "concurrency": {model_type: limiter.stats() for model_type, limiter in self.limiters.items()},
+            "hedging": {
+                model_type: {
+                    "enabled": model_type in self.hedge_types,
+                    "samples": tracker.count(),
+                    "delay_threshold": self._get_hedge_delay(model_type),
+                    "hedged": self.hedge_counts.get(model_type, 0),
+                    "hedge_wins": self.hedge_win_counts.get(model_type, 0),
+                    "hedge_skipped": self.hedge_skipped_counts.get(model_type, 0)
+                }
+                for model_type, tracker in self.latency_trackers.items()
+            }
+        }
+    
+    async def get_chat_response(self, messages: List[Dict[str, str]], model_type: str = "chat",
+                                cache_scope: Optional[str] = None) -> str:
         """获取聊天回复（仅返回文本内容）
         
         Args:
             messages: 消息列表
             model_type: 模型类型
+            cache_scope: 响应缓存的作用范围（如数据指纹），见chat_completion
             
         Returns:
             聊天回复内容
@@ -202,17 +642,110 @@ class OpenRouterService:
             if len(messages) > 5:
                 logger.debug(f"...还有 {len(messages) - 5} 条消息")
             
-            import asyncio
-            # 使用线程池来执行同步方法
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, 
-                lambda: self.chat_completion(messages, model_type=model_type)
-            )
+            response = await self.chat_completion(messages, model_type=model_type, cache_scope=cache_scope)
             return response["choices"][0]["message"]["content"]
+        except OverloadedError as e:
+            logger.warning(f"大模型请求被拒绝: {str(e)}")
+            return OVERLOADED_MESSAGE
         except Exception as e:
             error_message = f"获取聊天回复失败: {str(e)}"
             logger.error(error_message)
             return f"抱歉，处理您的请求时出现了问题。错误详情: {str(e)}"
 
+    async def stream_chat_response(self, messages: List[Dict[str, str]], model_type: str = "chat") -> AsyncIterator[str]:
+        """流式获取聊天回复，逐段产生回复内容
+        
+        使用OpenRouter的流式接口（stream=true）转发模型输出的token。流式请求不重试；
+        主模型熔断或在产生任何内容前失败时，改用非流式调用（含重试和备用模型切换）一次性返回。
+        
+        Args:
+            messages: 消息列表
+            model_type: 模型类型
+            
+        Yields:
+            回复片段
+        """
+        config = self._get_model_config(model_type)
+        data = self._build_request_data(messages, config)
+        data["stream"] = True
+        
+        # 与非流式调用共用模型类型的并发限制
+        limiter = self._get_limiter(model_type)
+        try:
+            await limiter.acquire()
+        except OverloadedError as e:
+            logger.warning(f"流式请求被拒绝: {str(e)}")
+            self.metrics.record_error(model_type, "overloaded")
+            yield OVERLOADED_MESSAGE
+            return
+        
+        # 需要改用非流式调用时，先释放并发名额再调用
+        fallback = False
+        try:
+            breaker = self._get_breaker(data["model"])
+            allowed, is_probe = breaker.allow_request()
+            if not allowed:
+                logger.warning(f"模型{data['model']}熔断中，改用非流式调用")
+                fallback = True
+            else:
+                received = False
+                usage = None
+                finish_reason = None
+                count_failure = True
+                start_time = time.time()
+                try:
+                    client = self._get_client()
+                    async with client.stream("POST", self.api_url, json=data, timeout=config["timeout"]) as response:
+                        if response.status_code != 200:
+                            await response.aread()
+                            count_failure = response.status_code in RETRYABLE_STATUS_CODES or response.status_code >= 500
+                            raise Exception(f"流式请求返回非200状态码: {response.status_code}, 响应: {response.text}")
+                        async for line in response.aiter_lines():
+                            # 以冒号开头的是保活注释（如": OPENROUTER PROCESSING"）
+                            if not line.startswith("data:"):
+                                continue
+                            payload = line[5:].strip()
+                            if payload == "[DONE]":
+                                break
+                            try:
+                                chunk = json.loads(payload)
+                            except ValueError:
+                                continue
+                            if "error" in chunk:
+                                raise Exception(f"流式响应返回错误: {chunk['error']}")
+                            # 最后一个片段可能带有usage和finish_reason
+                            usage = chunk.get("usage") or usage
+                            choices = chunk.get("choices") or []
+                            finish_reason = (choices[0].get("finish_reason") if choices else None) or finish_reason
+                            text = choices[0].get("delta", {}).get("content") if choices else None
+                            if text:
+                                received = True
+                                yield text
+                    breaker.record_success(time.time() - start_time)
+                    self.metrics.record_success(model_type, data["model"], time.time() - start_time,
+                                                usage=usage, finish_reason=finish_reason, streamed=True)
+                    logger.info(f"流式回复完成，耗时: {time.time() - start_time:.2f}秒")
+                    if not received:
+                        logger.warning("流式回复没有内容，改用非流式调用")
+                        fallback = True
+                except Exception as e:
+                    logger.error(f"流式请求失败: {str(e)}")
+                    self.metrics.record_error(model_type, self._error_kind(e))
+                    if count_failure:
+                        breaker.record_failure(str(e))
+                    if received:
+                        # 已经输出了部分内容，无法无缝切换，提示用户
+                        yield "\n（回复中断，请稍后重试）"
+                    else:
+                        fallback = True
+                finally:
+                    if is_probe:
+                        breaker.release_probe()
+        finally:
+            limiter.release()
+        
+        if fallback:
+            yield await self.get_chat_response(messages, model_type=model_type)
+
 # 创建全局OpenRouter服务实例
 openrouter_service = OpenRouterService() 
\ No newline at end of file
@@ -4,26 +4,65 @@ import json
 import hashlib
 import aiohttp
 import logging
-from typing import Dict, List, Any, Optional, Tuple
-from datetime import datetime, timedelta
+import threading
+from typing import Dict, List, Any, Optional, Tuple, Callable
+from datetime import datetime
 import time
+from app.core.config import settings
 from app.services.openrouter_service import openrouter_service
+from app.services.keyword_matcher import KeywordMatcher
+from app.services.local_classifier import local_classifier
+from app.services.request_context import ChatRequestContext
+from app.utils.ttl_cache import TTLCache
+from app.utils.background_writer import BackgroundWriter
 
 logger = logging.getLogger(__name__)
 
+# 快速分类中直接判定为SQL查询的正则：部门名称和部门负责人查询
+FAST_SQL_PATTERNS = [
+    r'(大数据平台与信息部|数字经济研究所|生物经济研究所|海洋经济研究所|城市轨道与城市发展研究所|创新中心|党委办公室|合规管理部|综合协同部|战略发展与项目管理部)',
+    r'(\w+部|\w+所|\w+中心)',
+    r'(谁是|谁担任|谁负责|谁主管|谁分管)(.*?)(负责人|部长|所长|主任|主管|的)'
+]
+
+# 快速分类关键词，标签 -> 关键词列表
+FAST_KEYWORDS = {
+    # 与数据查询相关的关键词
+    "SQL_QUERY": [
+        "多少", "平均", "查询", "统计", "人数", "比例", "百分比", "总数", "查找",
+        "哪些", "列出", "平均年龄", "平均工资", "平均薪资", "几个", "几人", "谁是",
+        "入职", "年份", "年龄", "毕业", "学历", "大学", "本科", "硕士", "博士",
+        "学位", "专业"
+    ],
+    # 与数据可视化相关的关键词
+    "VISUALIZATION": [
+        "图表", "图形", "可视化", "柱状图", "饼图", "折线图", "直方图", "散点图",
+        "画一个", "展示一下", "看一下", "分布图", "趋势图", "展示"
+    ],
+    # 与数据分析相关的关键词
+    "DATA_ANALYSIS": [
+        "分析", "预测", "趋势", "相关性", "关联", "影响因素", "对比",
+        "增长", "下降", "变化", "模式", "特征", "总结", "建议"
+    ],
+    # 否定可视化的表述
+    "NO_VISUALIZATION": ["不需要图"]
+}
+
 class QuestionClassifier:
     """问题分类器，用于决定使用哪种方法回答问题"""
     
     def __init__(self):
         """初始化问题分类器"""
-        # 分类缓存，格式: {hash: {"result": 分类结果, "timestamp": 时间戳}}
-        self.cache = {}
-        # 用于更快访问的类型缓存
-        self.type_cache = {}
-        # 缓存过期时间（天）
-        self.cache_expiry_days = 7
-        # 尝试加载持久化缓存
+        # 分类缓存（有界LRU，带过期时间），快速路径和模型分类共用
+        # 值格式: {"result": 分类结果, "source": "fast"或"model", "timestamp": 时间}
+        self.cache = TTLCache(settings.CLASSIFIER_CACHE_MAX_ENTRIES, settings.CLASSIFIER_CACHE_TTL_SECONDS)
+        # 缓存快照和监控数据由后台线程批量写入，不阻塞请求
+        self.writer = BackgroundWriter("classifier-writer", settings.CLASSIFIER_PERSIST_INTERVAL_SECONDS)
+        # 尝试加载持久化缓存（只持久化模型分类的结果）
         self._load_cache()
+        # 分类统计保存在内存中，定期写入文件
+        self._stats_lock = threading.Lock()
+        self.stats = self._load_stats()
         
         # 保留一些基本模式用于快速匹配
         self.fast_patterns = {
@@ -44,6 +83,10 @@ class QuestionClassifier:
             ]
         }
         
+        # 快速分类规则只在初始化时编译一次：正则合并为一个，关键词编译为一个自动机
+        self.fast_sql_regex = re.compile("|".join(f"(?:{pattern})" for pattern in FAST_SQL_PATTERNS))
+        self.keyword_matcher = KeywordMatcher(FAST_KEYWORDS)
+        
         # 系统提示
         self.system_prompt = "你是HR系统的问题分类专家，能准确将用户问题分类为SQL查询、数据可视化、数据分析或一般问题。"
         
@@ -56,71 +99,74 @@ class QuestionClassifier:
         Returns:
             问题类型: SQL_QUERY, VISUALIZATION, DATA_ANALYSIS, HYBRID_QUERY, GENERAL_QUERY
         """
+        result, _ = await self.classify_with_source(question)
+        return result
+    
+    async def classify_context(self, context: ChatRequestContext,
+                               on_model_path: Optional[Callable[[ChatRequestContext], None]] = None) -> str:
+        """对请求上下文中的问题分类，结果写入上下文；已分类的上下文直接返回原结果
+        
+        Args:
+            context: 请求上下文
+            on_model_path: 缓存、快速规则和本地模型都无法判断、即将调用大模型分类时的回调，
+                可用于在等待大模型的同时预先开始后续处理
+            
+        Returns:
+            问题类型
+        """
+        if not context.classified:
+            hook = (lambda: on_model_path(context)) if on_model_path else None
+            context.question_type, context.classification_source = await self.classify_with_source(
+                context.question, on_model_path=hook
+            )
+            context.mentions_department = self.mentions_department(context.question)
+        return context.question_type
+    
+    def mentions_department(self, question: str) -> bool:
+        """问题是否提到部门名称或部门负责人（与快速分类使用同一组规则）"""
+        return bool(self.fast_sql_regex.search(question))
+    
+    async def classify_with_source(self, question: str,
+                                   on_model_path: Optional[Callable[[], None]] = None) -> Tuple[str, str]:
+        """对问题进行分类，同时返回分类来源
+        
+        Args:
+            question: 用户问题
+            on_model_path: 即将调用大模型分类时的回调
+            
+        Returns:
+            (问题类型, 来源)，来源为cache、fast、local、model或error
+        """
+        start_time = time.time()
+        
         # 首先检查缓存
         cache_key = self._generate_cache_key(question)
-        cached_type = self.type_cache.get(cache_key)
+        cached_type = self._get_from_cache(cache_key)
         if cached_type:
             logger.info(f"缓存命中: 问题 '{question[:20]}...' 分类为 {cached_type}")
-            return cached_type
-        
-        # 检查问题是否与部门相关
-        dept_patterns = [
-            r'(大数据平台与信息部|数字经济研究所|生物经济研究所|海洋经济研究所|城市轨道与城市发展研究所|创新中心|党委办公室|合规管理部|综合协同部|战略发展与项目管理部)',
-            r'(\w+部|\w+所|\w+中心)'
-        ]
-        
-        for pattern in dept_patterns:
-            if re.search(pattern, question):
-                logger.info(f"快速分类: 问题 '{question[:20]}...' 包含部门名称，分类为 SQL_QUERY")
-                self.type_cache[cache_key] = "SQL_QUERY"
-                return "SQL_QUERY"
-        
-        # 部门负责人查询的模式
-        dept_head_pattern = r'(谁是|谁担任|谁负责|谁主管|谁分管)(.*?)(负责人|部长|所长|主任|主管|的)'
-        if re.search(dept_head_pattern, question):
-            logger.info(f"快速分类: 问题 '{question[:20]}...' 是部门负责人查询，分类为 SQL_QUERY")
-            self.type_cache[cache_key] = "SQL_QUERY"
-            return "SQL_QUERY"
-        
-        # 关键词快速识别
-        # 与数据查询相关的关键词
-        sql_keywords = [
-            "多少", "平均", "查询", "统计", "人数", "比例", "百分比", "总数", "查找", 
-            "哪些", "列出", "平均年龄", "平均工资", "平均薪资", "几个", "几人", "谁是", 
-            "入职", "年份", "年龄", "毕业", "学历", "大学", "本科", "硕士", "博士", 
-            "学位", "专业"
-        ]
-        
-        # 与数据可视化相关的关键词
-        viz_keywords = [
-            "图表", "图形", "可视化", "柱状图", "饼图", "折线图", "直方图", "散点图",
-            "画一个", "展示一下", "看一下", "分布图", "趋势图", "展示"
-        ]
-        
-        # 与数据分析相关的关键词
-        analysis_keywords = [
-            "分析", "预测", "趋势", "相关性", "关联", "影响因素", "对比",
-            "增长", "下降", "变化", "模式", "特征", "总结", "建议"
-        ]
-        
-        # 检查问题是否包含这些关键词
-        if self._contains_keywords(question, sql_keywords):
-            logger.info(f"快速分类: 问题 '{question[:20]}...' 识别为 SQL_QUERY")
-            self.type_cache[cache_key] = "SQL_QUERY"
-            return "SQL_QUERY"
+            self._track_classification(question, cached_type, (time.time() - start_time) * 1000, "cache")
+            return cached_type, "cache"
         
-        if self._contains_keywords(question, viz_keywords) and not self._contains_keywords(question, ["不需要图"]):
-            logger.info(f"快速分类: 问题 '{question[:20]}...' 识别为 VISUALIZATION")
-            self.type_cache[cache_key] = "VISUALIZATION"
-            return "VISUALIZATION"
+        # 快速路径：一次扫描得到全部命中的规则，再按优先级决定分类
+        fast_result = self._fast_classify(question)
+        if fast_result:
+            self._add_to_cache(cache_key, fast_result, source="fast")
+            self._track_classification(question, fast_result, (time.time() - start_time) * 1000, "fast")
+            return fast_result, "fast"
         
-        if self._contains_keywords(question, analysis_keywords):
-            logger.info(f"快速分类: 问题 '{question[:20]}...' 识别为 DATA_ANALYSIS")
-            self.type_cache[cache_key] = "DATA_ANALYSIS"
-            return "DATA_ANALYSIS"
+        # 本地分类模型：置信度达到阈值时直接采用，否则再调用大模型
+        local_result = self._local_classify(question)
+        if local_result:
+            self._add_to_cache(cache_key, local_result, source="local")
+            self._track_classification(question, local_result, (time.time() - start_time) * 1000, "local")
+            return local_result, "local"
         
         # 使用模型进行分类
-        start_time = time.time()
+        if on_model_path:
+            try:
+                on_model_path()
+            except Exception as e:
+                logger.warning(f"大模型分类前的回调执行失败: {str(e)}")
         try:
             # 构建分类提示
             messages = [
@@ -149,12 +195,51 @@ class QuestionClassifier:
             logger.info(f"模型分类: 问题 '{question[:20]}...' 分类为 {result}, 耗时 {elapsed_time:.2f}ms")
             
             # 缓存结果
-            self.type_cache[cache_key] = result
-            return result
+            self._add_to_cache(cache_key, result, source="model")
+            self._track_classification(question, result, elapsed_time, "model")
+            return result, "model"
         except Exception as e:
             logger.error(f"模型分类失败: {str(e)}")
             # 如果模型分类失败，使用保守的默认分类
-            return "HYBRID_QUERY"
+            self._track_classification(question, "HYBRID_QUERY", (time.time() - start_time) * 1000, "error")
+            return "HYBRID_QUERY", "error"
+    
+    def _fast_classify(self, question: str) -> Optional[str]:
+        """基于规则的快速分类，无法判断时返回None
+        
+        优先级：部门/负责人正则 > 数据查询关键词 > 可视化关键词（未否定时）> 数据分析关键词
+        """
+        if self.fast_sql_regex.search(question):
+            logger.info(f"快速分类: 问题 '{question[:20]}...' 包含部门名称或负责人查询，分类为 SQL_QUERY")
+            return "SQL_QUERY"
+        
+        labels = self.keyword_matcher.match_labels(question)
+        if "SQL_QUERY" in labels:
+            result = "SQL_QUERY"
+        elif "VISUALIZATION" in labels and "NO_VISUALIZATION" not in labels:
+            result = "VISUALIZATION"
+        elif "DATA_ANALYSIS" in labels:
+            result = "DATA_ANALYSIS"
+        else:
+            return None
+        
+        logger.info(f"快速分类: 问题 '{question[:20]}...' 识别为 {result}")
+        return result
+    
+    def _local_classify(self, question: str) -> Optional[str]:
+        """使用本地分类模型分类，模型不可用或置信度低于阈值时返回None"""
+        if local_classifier is None:
+            return None
+        try:
+            prediction = local_classifier.classify(question, settings.LOCAL_CLASSIFIER_THRESHOLD)
+        except Exception as e:
+            logger.warning(f"本地分类模型预测失败: {str(e)}")
+            return None
+        if prediction is None:
+            return None
+        result, confidence = prediction
+        logger.info(f"本地模型分类: 问题 '{question[:20]}...' 分类为 {result}, 置信度 {confidence:.2f}")
+        return result
     
     async def _call_fast_model(self, question: str) -> str:
         """调用轻量级AI模型进行分类"""
@@ -199,27 +284,26 @@ class QuestionClassifier:
         """计算问题的哈希值，用于缓存"""
         return hashlib.md5(question.encode('utf-8')).hexdigest()
     
-    def _get_from_cache(self, question_hash: str) -> Optional[str]:
-        """从缓存中获取分类结果"""
-        if question_hash in self.cache:
-            cache_entry = self.cache[question_hash]
-            # 检查缓存是否过期
-            timestamp = datetime.fromisoformat(cache_entry["timestamp"])
-            if datetime.now() - timestamp < timedelta(days=self.cache_expiry_days):
-                return cache_entry["result"]
-            else:
-                # 删除过期缓存
-                del self.cache[question_hash]
-        return None
+    def _get_from_cache(self, cache_key: str) -> Optional[str]:
+        """从缓存中获取分类结果，过期的条目由缓存自动删除"""
+        cache_entry = self.cache.get(cache_key)
+        return cache_entry["result"] if cache_entry else None
     
-    def _add_to_cache(self, question_hash: str, classification: str) -> None:
-        """将分类结果添加到缓存"""
-        self.cache[question_hash] = {
+    def _add_to_cache(self, cache_key: str, classification: str, source: str) -> None:
+        """将分类结果添加到缓存
+        
+        Args:
+            cache_key: 缓存键
+            classification: 分类结果
+            source: 分类来源，fast为规则快速分类，local为本地模型分类，model为大模型分类；只有大模型分类的结果会持久化
+        """
+        self.cache.set(cache_key, {
             "result": classification,
+            "source": source,
             "timestamp": datetime.now().isoformat()
-        }
-        # 持久化缓存
-        self._save_cache()
+        })
+        if source == "model":
+            self._save_cache()
     
     def _normalize_classification(self, classification: str, valid_classifications: List[str]) -> str:
         """标准化分类结果"""
@@ -239,76 +323,120 @@ class QuestionClassifier:
         # 如果无法匹配，默认使用混合查询
         return "HYBRID_QUERY"
     
+    def _cache_file(self) -> str:
+        """缓存文件路径"""
+        cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "cache")
+        return os.path.join(cache_dir, "classification_cache.json")
+    
     def _save_cache(self) -> None:
-        """保存缓存到文件"""
-        try:
-            # 创建缓存目录
-            cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "cache")
-            os.makedirs(cache_dir, exist_ok=True)
-            
-            # 写入缓存文件
-            cache_file = os.path.join(cache_dir, "classification_cache.json")
-            with open(cache_file, "w", encoding="utf-8") as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.warning(f"保存缓存失败: {str(e)}")
+        """请求后台线程写入缓存快照，多次请求在一个刷新周期内合并为一次写入"""
+        self.writer.snapshot(self._cache_file(), self._cache_snapshot)
+    
+    def _cache_snapshot(self) -> Dict[str, Any]:
+        """生成要持久化的缓存数据（在后台线程中调用）
+        
+        只保存模型分类的结果，快速分类的结果重新计算的代价很低
+        """
+        return {
+            key: {"result": value["result"], "timestamp": value["timestamp"], "expires_at": expires_at}
+            for key, value, expires_at in self.cache.items()
+            if value.get("source") == "model"
+        }
     
     def _load_cache(self) -> None:
-        """从文件加载缓存"""
+        """从文件加载缓存，跳过已过期的条目"""
         try:
-            cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "cache")
-            cache_file = os.path.join(cache_dir, "classification_cache.json")
-            if os.path.exists(cache_file):
-                with open(cache_file, "r", encoding="utf-8") as f:
-                    self.cache = json.load(f)
-                logger.info(f"已加载 {len(self.cache)} 条分类缓存")
+            cache_file = self._cache_file()
+            if not os.path.exists(cache_file):
+                return
+            with open(cache_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            
+            now = time.time()
+            loaded = 0
+            for key, entry in entries.items():
+                expires_at = entry.get("expires_at")
+                if expires_at is None:
+                    # 兼容只有写入时间的旧格式
+                    expires_at = datetime.fromisoformat(entry["timestamp"]).timestamp() + self.cache.ttl_seconds
+                if expires_at <= now:
+                    continue
+                self.cache.set(key, {
+                    "result": entry["result"],
+                    "source": "model",
+                    "timestamp": entry["timestamp"]
+                }, expires_at=expires_at)
+                loaded += 1
+            logger.info(f"已加载 {loaded} 条分类缓存")
         except Exception as e:
             logger.warning(f"加载缓存失败: {str(e)}")
-            self.cache = {}
+            self.cache.clear()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """返回分类缓存统计信息"""
+        stats = self.cache.stats()
+        stats["by_source"] = {}
+        for _, value, _ in self.cache.items():
+            source = value.get("source", "model")
+            stats["by_source"][source] = stats["by_source"].get(source, 0) + 1
+        return stats
+    
+    def _monitoring_dir(self) -> str:
+        """监控数据目录"""
+        return os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "monitoring")
     
-    def _track_classification(self, question: str, classification: str, latency_ms: float) -> None:
-        """记录分类数据用于监控和改进"""
+    def _load_stats(self) -> Dict[str, Any]:
+        """从文件加载分类统计，在此基础上继续累计"""
+        stats = {"total": 0, "by_type": {}, "by_source": {}, "latency": {"sum": 0, "count": 0}}
+        stats_file = os.path.join(self._monitoring_dir(), "classification_stats.json")
         try:
-            # 确保监控目录存在
-            monitoring_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "monitoring")
-            os.makedirs(monitoring_dir, exist_ok=True)
-            
-            # 记录分类结果
-            log_file = os.path.join(monitoring_dir, "classifications.jsonl")
-            with open(log_file, "a", encoding="utf-8") as f:
-                record = {
-                    "timestamp": datetime.now().isoformat(),
-                    "question_hash": self._hash_question(question),
-                    "question_preview": question[:50] + "..." if len(question) > 50 else question,
-                    "classification": classification,
-                    "latency_ms": latency_ms
-                }
-                f.write(json.dumps(record, ensure_ascii=False) + "\n")
-                
-            # 更新分类统计
-            stats_file = os.path.join(monitoring_dir, "classification_stats.json")
-            stats = {"total": 0, "by_type": {}, "latency": {"sum": 0, "count": 0}}
-            
-            # 尝试读取现有统计
             if os.path.exists(stats_file):
-                try:
-                    with open(stats_file, "r", encoding="utf-8") as f:
-                        stats = json.load(f)
-                except:
-                    pass
+                with open(stats_file, "r", encoding="utf-8") as f:
+                    stats.update(json.load(f))
+                stats.setdefault("by_source", {})
+        except Exception as e:
+            logger.warning(f"加载分类统计失败: {str(e)}")
+        return stats
+    
+    def _track_classification(self, question: str, classification: str, latency_ms: float, source: str) -> None:
+        """记录分类数据用于监控和改进
+        
+        Args:
+            question: 用户问题
+            classification: 分类结果
+            latency_ms: 分类耗时（毫秒）
+            source: 分类来源，cache、fast、local、model或error
+        """
+        try:
+            monitoring_dir = self._monitoring_dir()
             
-            # 更新统计数据
-            stats["total"] = stats.get("total", 0) + 1
-            stats["by_type"][classification] = stats.get("by_type", {}).get(classification, 0) + 1
-            stats["latency"]["sum"] = stats.get("latency", {}).get("sum", 0) + latency_ms
-            stats["latency"]["count"] = stats.get("latency", {}).get("count", 0) + 1
+            # 记录分类结果，由后台线程批量追加到文件
+            self.writer.append(os.path.join(monitoring_dir, "classifications.jsonl"), {
+                "timestamp": datetime.now().isoformat(),
+                "question_hash": self._hash_question(question),
+                # 完整问题用于重新训练本地分类模型，预览便于人工查看
+                "question": question,
+                "question_preview": question[:50] + "..." if len(question) > 50 else question,
+                "classification": classification,
+                "source": source,
+                "latency_ms": round(latency_ms, 3)
+            })
             
-            # 写回文件
-            with open(stats_file, "w", encoding="utf-8") as f:
-                json.dump(stats, f, ensure_ascii=False, indent=2)
-                
+            # 更新内存中的分类统计，定期写入文件
+            with self._stats_lock:
+                self.stats["total"] += 1
+                self.stats["by_type"][classification] = self.stats["by_type"].get(classification, 0) + 1
+                self.stats["by_source"][source] = self.stats["by_source"].get(source, 0) + 1
+                self.stats["latency"]["sum"] += latency_ms
+                self.stats["latency"]["count"] += 1
+            self.writer.snapshot(os.path.join(monitoring_dir, "classification_stats.json"), self.get_stats)
         except Exception as e:
             logger.warning(f"记录分类监控数据失败: {str(e)}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """返回分类统计的副本"""
+        with self._stats_lock:
+            return json.loads(json.dumps(self.stats))
             
     def _convert_to_legacy_type(self, new_classification: str) -> str:
         """将新的分类结果转换为旧有的类型，保持兼容性"""
@@ -358,14 +486,6 @@ class QuestionClassifier:
         # 移除多余空格
         key = re.sub(r'\s+', ' ', key)
         return key
-    
-    def _contains_keywords(self, text: str, keywords: List[str]) -> bool:
-        """检查文本是否包含关键词"""
-        text = text.lower()
-        for keyword in keywords:
-            if keyword.lower() in text:
-                return True
-        return False
 
 # 创建全局问题分类器实例
 question_classifier = QuestionClassifier() 
\ No newline at end of file
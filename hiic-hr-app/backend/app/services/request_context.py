@@ -0,0 +1,66 @@
+"""
+对话请求上下文模块，一轮对话的分类结果和抽取的实体只计算一次，沿路由、混合聊天服务和SQL服务传递
+"""
+
+import asyncio
+from typing import Dict, List, Any, Optional
+
+from app.models.hr_models import ChatMessage
+
+
+class ChatRequestContext:
+    """单轮对话的请求上下文"""
+
+    def __init__(self, messages: List[ChatMessage], question: str):
+        """初始化上下文
+
+        Args:
+            messages: 消息列表
+            question: 本轮的用户问题
+        """
+        self.messages = messages
+        self.question = question
+        # 分类结果及来源（cache、fast、local、model或error），由问题分类器填写
+        self.question_type: Optional[str] = None
+        self.classification_source: Optional[str] = None
+        # 问题是否提到部门名称或部门负责人，由问题分类器的快速规则判断
+        self.mentions_department: Optional[bool] = None
+        # SQL服务执行的SQL和结果行数，便于路由记录日志
+        self.sql_query: Optional[str] = None
+        self.row_count: Optional[int] = None
+        # 与大模型分类同时进行的预测性SQL生成任务及其使用的数据快照，由SQL服务填写
+        self.speculative_sql: Optional[asyncio.Task] = None
+        self.speculative_snapshot: Optional[Any] = None
+
+    @classmethod
+    def from_messages(cls, messages: List[ChatMessage]) -> Optional["ChatRequestContext"]:
+        """以最后一条用户消息为本轮问题创建上下文，没有用户消息时返回None"""
+        question = next((msg.content for msg in reversed(messages) if msg.role == "user"), None)
+        if not question:
+            return None
+        return cls(messages, question)
+
+    @property
+    def classified(self) -> bool:
+        """是否已分类"""
+        return self.question_type is not None
+
+    def cancel_speculation(self) -> bool:
+        """取消尚未使用的预测性SQL生成，返回是否取消了进行中的任务"""
+        task, self.speculative_sql = self.speculative_sql, None
+        self.speculative_snapshot = None
+        if task is not None and not task.done():
+            task.cancel()
+            return True
+        return False
+    
+    def summary(self) -> Dict[str, Any]:
+        """返回上下文摘要，用于日志"""
+        return {
+            "question": self.question[:30],
+            "question_type": self.question_type,
+            "classification_source": self.classification_source,
+            "mentions_department": self.mentions_department,
+            "sql_query": self.sql_query,
+            "row_count": self.row_count
+        }
@@ -0,0 +1,120 @@
+"""
+回复过滤模块，在流式转发大模型回复时去掉代码块和SQL查询说明语句，与非流式回复的清理保持一致
+"""
+
+import re
+
+# 常见的SQL查询说明语句
+SQL_INTRO_PATTERNS = [
+    r"我将使用以下SQL查询[^:：]*[:：]",
+    r"以下是(我的|用于解答的)?SQL查询[:：]",
+    r"(首先|让我)(使用|执行|运行)SQL查询[:：]",
+    r"(我(将|要|准备)(执行|运行|使用).*查询|查询数据库)[^:：]*[:：]",
+    r"根据SQL查询结果[^:：]*[:：]",
+    r"SQL查询结果[^:：]*[:：]"
+]
+
+# 说明语句的检查以句子为单位，遇到这些字符时之前的文字可以输出
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"[\n。！？!?：:]")
+
+FENCE = "```"
+
+
+class StreamingResponseFilter:
+    """流式回复过滤器
+
+    从```开始的文字一直扣留到闭合的```并整体丢弃，`内联代码`同样整体丢弃；
+    其余文字按句子输出，输出前去掉SQL查询说明语句。没有闭合的内联反引号在结束时原样输出，
+    没有闭合的代码块在结束时丢弃（多为被截断的SQL）。
+    """
+
+    def __init__(self):
+        """初始化过滤器"""
+        # 尚未处理的原始文字
+        self._buffer = ""
+        # 当前所处的位置：text（普通文字）、fence（代码块内）、inline（内联代码内）
+        self._state = "text"
+        # 已过滤代码、等待凑成完整句子后输出的文字
+        self._sentence = ""
+        # 是否已经输出过非空白文字，回复开头的空白不输出
+        self._started = False
+
+    def feed(self, text: str) -> str:
+        """处理一个token片段，返回可以输出的文字（可能为空）"""
+        self._buffer += text
+        self._consume(final=False)
+        return self._emit(final=False)
+
+    def finish(self) -> str:
+        """回复结束，返回剩余可以输出的文字"""
+        self._consume(final=True)
+        return self._emit(final=True)
+
+    def _consume(self, final: bool) -> None:
+        """按状态处理缓冲区中的文字，需要更多文字才能判断时停止"""
+        while self._buffer:
+            if self._state == "fence":
+                end = self._buffer.find(FENCE)
+                if end < 0:
+                    # 保留末尾可能是闭合标记一部分的反引号
+                    self._buffer = "" if final else self._buffer[-(len(FENCE) - 1):]
+                    return
+                self._buffer = self._buffer[end + len(FENCE):]
+                self._state = "text"
+                continue
+
+            if self._state == "inline":
+                end = self._buffer.find("`")
+                if end < 0:
+                    if final:
+                        self._sentence += "`" + self._buffer
+                        self._buffer = ""
+                    return
+                self._buffer = self._buffer[end + 1:]
+                self._state = "text"
+                continue
+
+            start = self._buffer.find("`")
+            if start < 0:
+                self._sentence += self._buffer
+                self._buffer = ""
+                return
+            self._sentence += self._buffer[:start]
+            rest = self._buffer[start:]
+            if rest.startswith(FENCE):
+                self._buffer = rest[len(FENCE):]
+                self._state = "fence"
+            elif not final and rest.strip("`") == "":
+                # 末尾只有一两个反引号，等下一个片段再判断是不是代码块
+                self._buffer = rest
+                return
+            elif final and rest.strip("`") == "":
+                self._sentence += rest
+                self._buffer = ""
+            else:
+                self._buffer = rest.lstrip("`")
+                self._state = "inline"
+
+    def _emit(self, final: bool) -> str:
+        """输出已凑成完整句子的文字"""
+        if final:
+            ready, self._sentence = self._sentence, ""
+        else:
+            boundaries = list(SENTENCE_BOUNDARY_PATTERN.finditer(self._sentence))
+            if not boundaries:
+                return ""
+            cut = boundaries[-1].end()
+            ready, self._sentence = self._sentence[:cut], self._sentence[cut:]
+
+        ready = self._strip_intros(ready)
+        if not self._started:
+            ready = ready.lstrip()
+            self._started = bool(ready)
+        return ready
+
+    def _strip_intros(self, text: str) -> str:
+        """去掉SQL查询说明语句"""
+        for pattern in SQL_INTRO_PATTERNS:
+            text = re.sub(pattern, "", text, flags=re.IGNORECASE)
+        return text
+
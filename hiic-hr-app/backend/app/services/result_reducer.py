@@ -0,0 +1,131 @@
+"""
+查询结果精简模块，在生成自然语言回复前把大结果集压缩为摘要
+"""
+
+import json
+import logging
+from collections import Counter
+from typing import Dict, List, Any, Optional
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+# 视为"人员标识"的列，摘要中会尽量列出其取值
+NAME_COLUMNS = ["name", "姓名", "employee_name"]
+
+
+class ResultReducer:
+    """查询结果精简器
+
+    小结果集原样以JSON发送；大结果集只发送行数、各列的不同取值数、
+    Top-K取值、数值列的范围和均值，以及一个紧凑的样例表格，
+    使发送给大模型的内容大小与结果行数无关。
+    """
+
+    def __init__(self, max_raw_rows: int = 20, max_raw_chars: int = 3000, top_k: int = 5,
+                 table_rows: int = 15, max_cell_chars: int = 20, max_names: int = 60):
+        """初始化结果精简器
+
+        Args:
+            max_raw_rows: 不超过该行数时原样发送
+            max_raw_chars: 原样发送时JSON的最大字符数
+            top_k: 每列列出的最常见取值数量
+            table_rows: 紧凑表格中的样例行数
+            max_cell_chars: 表格单元格的最大字符数
+            max_names: 最多列出的人员姓名数量
+        """
+        self.max_raw_rows = max_raw_rows
+        self.max_raw_chars = max_raw_chars
+        self.top_k = top_k
+        self.table_rows = table_rows
+        self.max_cell_chars = max_cell_chars
+        self.max_names = max_names
+
+    def is_large(self, results: List[Dict[str, Any]]) -> bool:
+        """判断结果集是否需要精简"""
+        if len(results) > self.max_raw_rows:
+            return True
+        return len(json.dumps(results, ensure_ascii=False, default=str)) > self.max_raw_chars
+
+    def format_for_prompt(self, results: List[Dict[str, Any]]) -> str:
+        """把查询结果格式化为提示中使用的文本"""
+        if not results or not self.is_large(results):
+            return json.dumps(results, ensure_ascii=False, default=str)
+
+        summary = self.summarize(results)
+        logger.info(f"查询结果共{len(results)}行，已精简为{len(summary)}字符的摘要")
+        return summary
+
+    def summarize(self, results: List[Dict[str, Any]]) -> str:
+        """生成结果集摘要"""
+        columns = self._get_columns(results)
+        lines = [f"查询共返回{len(results)}行，包含列: {', '.join(columns)}", "各列统计:"]
+
+        for column in columns:
+            values = [row.get(column) for row in results if row.get(column) not in (None, "")]
+            lines.append(f"- {column}: {self._describe_column(column, values, len(results))}")
+
+        name_column = next((col for col in columns if col in NAME_COLUMNS), None)
+        if name_column:
+            names = [str(row.get(name_column)) for row in results if row.get(name_column)]
+            shown = names[:self.max_names]
+            suffix = f"等，共{len(names)}人" if len(names) > len(shown) else f"，共{len(names)}人"
+            lines.append(f"人员名单: {'、'.join(shown)}{suffix}")
+
+        lines.append(f"样例（前{min(self.table_rows, len(results))}行）:")
+        lines.append(self._compact_table(columns, results[:self.table_rows]))
+        return "\n".join(lines)
+
+    def _describe_column(self, column: str, values: List[Any], total: int) -> str:
+        """描述单列的取值情况"""
+        if not values:
+            return "全部为空"
+
+        missing = total - len(values)
+        missing_text = f"，{missing}行为空" if missing else ""
+
+        numeric = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        if len(numeric) == len(values):
+            average = sum(numeric) / len(numeric)
+            return (f"最小{self._format_number(min(numeric))}，最大{self._format_number(max(numeric))}，"
+                    f"平均{self._format_number(average)}{missing_text}")
+
+        counter = Counter(str(value) for value in values)
+        distinct = len(counter)
+        if distinct == len(values):
+            # 每行取值都不同（如姓名、ID），列出计数即可
+            return f"{distinct}个不同值{missing_text}"
+
+        top = "、".join(f"{self._truncate(value)}({count})" for value, count in counter.most_common(self.top_k))
+        more = "" if distinct <= self.top_k else "等"
+        return f"{distinct}个不同值，最多的是 {top}{more}{missing_text}"
+
+    def _compact_table(self, columns: List[str], rows: List[Dict[str, Any]]) -> str:
+        """生成以竖线分隔的紧凑表格"""
+        lines = [" | ".join(columns)]
+        for row in rows:
+            lines.append(" | ".join(self._truncate(row.get(column, "")) for column in columns))
+        return "\n".join(lines)
+
+    def _get_columns(self, results: List[Dict[str, Any]]) -> List[str]:
+        """按出现顺序获取所有列名"""
+        columns: List[str] = []
+        for row in results[:50]:
+            for key in row.keys():
+                if key not in columns:
+                    columns.append(key)
+        return columns
+
+    def _truncate(self, value: Optional[Any]) -> str:
+        """截断过长的单元格内容"""
+        text = "" if value is None else self._format_number(value) if isinstance(value, float) else str(value)
+        text = text.replace("\n", " ")
+        if len(text) > self.max_cell_chars:
+            return text[:self.max_cell_chars - 1] + "…"
+        return text
+
+    def _format_number(self, value: Any) -> str:
+        """格式化数字，最多保留两位小数"""
+        if isinstance(value, float):
+            return f"{value:.2f}".rstrip("0").rstrip(".")
+        return str(value)
@@ -0,0 +1,384 @@
+"""
+SQL索引顾问模块，基于EXPLAIN QUERY PLAN为内存数据库自动补充索引
+"""
+
+import re
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+# 等值类谓词操作符（适合放在复合索引前缀）
+EQUALITY_OPERATORS = {"=", "==", "IN", "IS"}
+# 范围类谓词操作符（只能放在复合索引最后一列）
+RANGE_OPERATORS = {">", "<", ">=", "<=", "BETWEEN"}
+
+# WHERE子句提取（遇到GROUP BY/ORDER BY/LIMIT/HAVING即结束）
+WHERE_PATTERN = re.compile(
+    r"\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|$)",
+    re.IGNORECASE | re.DOTALL
+)
+# 谓词操作符
+OPERATOR_PATTERN = r"(==|>=|<=|=|>|<|\bIN\b|\bIS\b|\bBETWEEN\b)"
+# 表达式谓词：substr(hire_date, 1, 4) = '2017' 等（列在第一个参数）
+EXPRESSION_PATTERN = re.compile(
+    r"^\(?\s*(substr|lower|upper|trim|date)\s*\(\s*(?:\w+\.)?(\w+)\s*((?:,\s*(?:-?\d+|'[\w%\- ]{0,20}')\s*)*)\)\s*"
+    + OPERATOR_PATTERN,
+    re.IGNORECASE
+)
+# 表达式谓词：strftime('%Y', hire_date) = '2017'
+STRFTIME_PATTERN = re.compile(
+    r"^\(?\s*strftime\s*\(\s*('[%\w\-]{1,20}')\s*,\s*(?:\w+\.)?(\w+)\s*\)\s*" + OPERATOR_PATTERN,
+    re.IGNORECASE
+)
+# 普通列谓词：department = 'xxx'
+COLUMN_PATTERN = re.compile(r"^\(?\s*(?:\w+\.)?(\w+)\s*" + OPERATOR_PATTERN, re.IGNORECASE)
+
+
+class SQLIndexAdvisor:
+    """索引顾问
+
+    对抽样的查询（慢查询或每N条中的一条）在执行它的只读连接上记录执行计划，
+    统计高频谓词上的全表扫描，达到阈值后把谓词加入待建列表；
+    索引由后台维护步骤在可写连接上统一创建，不占用请求路径，并记录新增了哪些索引。
+    """
+
+    def __init__(self, table_name: str = "employees", min_scans: int = 3, max_indexes: int = 16,
+                 sample_rate: int = 10, slow_query_ms: float = 200.0):
+        """初始化索引顾问
+
+        Args:
+            table_name: 需要优化的表名
+            min_scans: 同一组谓词出现多少次低效扫描后创建索引
+            max_indexes: 最多自动创建的索引数量
+            sample_rate: 普通查询每多少条记录一次执行计划（1表示全部记录）
+            slow_query_ms: 执行时间达到该值（毫秒）的慢查询总是记录执行计划
+        """
+        self.table_name = table_name
+        self.min_scans = min_scans
+        self.max_indexes = max_indexes
+        self.sample_rate = max(1, sample_rate)
+        self.slow_query_ms = slow_query_ms
+
+        # 谓词签名 -> 低效扫描次数
+        self.scan_counts: Dict[Tuple[str, ...], int] = {}
+        # 已尝试过的谓词签名（无论索引是否有效，都不再重复尝试）
+        self.attempted: set = set()
+        # 等待维护步骤创建索引的谓词签名 -> (等值谓词数, 触发的查询)
+        self.pending: Dict[Tuple[str, ...], Tuple[int, str]] = {}
+        # 已新增的索引
+        self.added_indexes: List[Dict[str, Any]] = []
+        # 最近的执行计划
+        self.recent_plans = deque(maxlen=50)
+
+        # 统计信息
+        self.queries_seen = 0
+        self.plans_recorded = 0
+        self.full_scans = 0
+
+        self._lock = threading.Lock()
+        # 保证同一时间只有一个维护步骤在建索引
+        self._maintenance_lock = threading.Lock()
+
+    def should_sample(self, elapsed_ms: float) -> bool:
+        """判断是否需要记录这条查询的执行计划：慢查询总是记录，其余每sample_rate条记录一条"""
+        with self._lock:
+            self.queries_seen += 1
+            if elapsed_ms >= self.slow_query_ms:
+                return True
+            return self.queries_seen % self.sample_rate == 0
+
+    def observe(self, conn: sqlite3.Connection, sql: str) -> Optional[Tuple[str, ...]]:
+        """记录一条查询的执行计划，低效扫描达到阈值时把谓词加入待建列表
+
+        执行计划在调用方传入的连接（执行该查询的只读连接）上获取，不持有顾问的锁，
+        多个线程可以同时记录；索引由apply_pending在维护步骤中创建。
+
+        Args:
+            conn: 执行该查询的SQLite连接
+            sql: 已生成的SELECT查询
+
+        Returns:
+            如果本次新加入了待建列表，返回谓词签名，否则返回None
+        """
+        if conn is None or not sql:
+            return None
+
+        plan = self._explain(conn, sql)
+        if plan is None:
+            return None
+        eq_terms, range_terms = self._extract_predicates(conn, sql)
+        inefficient = self._is_inefficient(plan, len(eq_terms))
+
+        with self._lock:
+            self.plans_recorded += 1
+            self.recent_plans.append({
+                "sql": sql[:200],
+                "plan": plan,
+                "inefficient": inefficient,
+                "timestamp": time.time()
+            })
+
+            if not inefficient or not (eq_terms or range_terms):
+                return None
+
+            self.full_scans += 1
+
+            # 等值列在前，最多追加一个范围列
+            signature = tuple(sorted(eq_terms)) + tuple(range_terms[:1])
+            if signature in self.attempted or signature in self.pending:
+                return None
+
+            self.scan_counts[signature] = self.scan_counts.get(signature, 0) + 1
+            if self.scan_counts[signature] < self.min_scans:
+                return None
+            if len(self.added_indexes) + len(self.pending) >= self.max_indexes:
+                return None
+
+            self.pending[signature] = (len(eq_terms), sql)
+            return signature
+
+    def apply_pending(self, conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        """维护步骤：在可写连接上创建待建列表中的索引，返回本次新增的索引信息"""
+        if conn is None:
+            return []
+
+        created = []
+        with self._maintenance_lock:
+            with self._lock:
+                pending = list(self.pending.items())
+                self.pending = {}
+                self.attempted.update(signature for signature, _ in pending)
+            for signature, (eq_count, sql) in pending:
+                index_info = self._create_index(conn, sql, signature, eq_count)
+                if index_info:
+                    created.append(index_info)
+        return created
+
+    def replay(self, conn: sqlite3.Connection) -> int:
+        """在新加载的数据库上重建已新增的索引，返回成功重建的数量"""
+        with self._lock:
+            indexes = list(self.added_indexes)
+
+        replayed = 0
+        for index_info in indexes:
+            try:
+                conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{index_info["name"]}" '
+                    f'ON {self.table_name}({", ".join(index_info["terms"])})'
+                )
+                replayed += 1
+            except sqlite3.Error as e:
+                logger.warning(f"索引顾问：重建索引{index_info['name']}失败 - {str(e)}")
+        conn.commit()
+        return replayed
+
+    def report(self) -> Dict[str, Any]:
+        """返回索引顾问的统计报告"""
+        with self._lock:
+            candidates = sorted(
+                (
+                    {"terms": list(signature), "scans": count}
+                    for signature, count in self.scan_counts.items()
+                    if signature not in self.attempted
+                ),
+                key=lambda item: item["scans"],
+                reverse=True
+            )
+            return {
+                "queries_seen": self.queries_seen,
+                "plans_recorded": self.plans_recorded,
+                "sample_rate": self.sample_rate,
+                "slow_query_ms": self.slow_query_ms,
+                "inefficient_scans": self.full_scans,
+                "indexes_added": list(self.added_indexes),
+                "pending": [list(signature) for signature in self.pending],
+                "candidates": candidates[:10],
+                "recent_plans": list(self.recent_plans)[-10:]
+            }
+
+    def _explain(self, conn: sqlite3.Connection, sql: str) -> Optional[List[str]]:
+        """获取查询的执行计划"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql.strip().rstrip(';')}")
+            # 执行计划格式: (id, parent, notused, detail)
+            return [row[3] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.debug(f"获取执行计划失败: {str(e)}")
+            return None
+
+    def _is_inefficient(self, plan: List[str], eq_count: int) -> bool:
+        """判断执行计划是否低效
+
+        全表扫描视为低效；使用了索引但索引只覆盖了部分等值谓词时也视为低效。
+        """
+        for detail in plan:
+            if detail.startswith("SCAN") and "CONSTANT ROW" not in detail:
+                return True
+            if detail.startswith("SEARCH") and eq_count > 1:
+                # 例如: SEARCH employees USING INDEX idx_department (department=?)
+                constraint = re.search(r"\((.*)\)\s*$", detail)
+                used = constraint.group(1).count("=?") if constraint else 0
+                if used < eq_count:
+                    return True
+        return False
+
+    def _extract_predicates(self, conn: sqlite3.Connection, sql: str) -> Tuple[List[str], List[str]]:
+        """从WHERE子句中提取可索引的谓词
+
+        Returns:
+            (等值谓词列表, 范围谓词列表)，元素为规范化后的列名或表达式
+        """
+        match = WHERE_PATTERN.search(sql)
+        if not match:
+            return [], []
+
+        columns = self._get_columns(conn)
+        eq_terms: List[str] = []
+        range_terms: List[str] = []
+
+        for conjunct in self._split_conjuncts(match.group(1)):
+            # 含OR的条件通常无法利用单个索引
+            if re.search(r"\bOR\b", conjunct, re.IGNORECASE):
+                continue
+
+            term, operator = self._parse_term(conjunct.strip(), columns)
+            if not term:
+                continue
+
+            if operator in EQUALITY_OPERATORS and term not in eq_terms:
+                eq_terms.append(term)
+            elif operator in RANGE_OPERATORS and term not in range_terms:
+                range_terms.append(term)
+
+        # 同一列既有等值又有范围条件时，只保留等值
+        range_terms = [term for term in range_terms if term not in eq_terms]
+        return eq_terms, range_terms
+
+    def _parse_term(self, conjunct: str, columns: List[str]) -> Tuple[Optional[str], Optional[str]]:
+        """解析单个谓词，返回(规范化的索引项, 操作符)"""
+        match = STRFTIME_PATTERN.match(conjunct)
+        if match:
+            fmt, column, operator = match.groups()
+            if column in columns:
+                return f'strftime({fmt}, "{column}")', operator.upper()
+            return None, None
+
+        match = EXPRESSION_PATTERN.match(conjunct)
+        if match:
+            func, column, args, operator = match.groups()
+            if column not in columns:
+                return None, None
+            arg_list = [arg.strip() for arg in args.split(",") if arg.strip()]
+            expression = f'{func.lower()}("{column}"' + "".join(f", {arg}" for arg in arg_list) + ")"
+            return expression, operator.upper()
+
+        match = COLUMN_PATTERN.match(conjunct)
+        if match:
+            column, operator = match.groups()
+            if column in columns:
+                return f'"{column}"', operator.upper()
+
+        return None, None
+
+    def _split_conjuncts(self, where_clause: str) -> List[str]:
+        """按顶层AND拆分WHERE子句（忽略括号内和BETWEEN ... AND ...中的AND）"""
+        conjuncts = []
+        depth = 0
+        current = []
+        between_pending = False
+        tokens = re.split(r"(\(|\)|'[^']*'|\bAND\b|\bBETWEEN\b)", where_clause, flags=re.IGNORECASE)
+
+        for token in tokens:
+            if not token:
+                continue
+            upper = token.upper()
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif upper == "BETWEEN" and depth == 0:
+                between_pending = True
+            elif upper == "AND" and depth == 0:
+                if between_pending:
+                    between_pending = False
+                else:
+                    conjuncts.append("".join(current))
+                    current = []
+                    continue
+            current.append(token)
+
+        if current:
+            conjuncts.append("".join(current))
+        return [conjunct for conjunct in conjuncts if conjunct.strip()]
+
+    def _get_columns(self, conn: sqlite3.Connection) -> List[str]:
+        """获取表的实际列名"""
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA table_info({self.table_name})")
+        return [col[1] for col in cursor.fetchall()]
+
+    def _create_index(self, conn: sqlite3.Connection, sql: str,
+                      signature: Tuple[str, ...], eq_count: int) -> Optional[Dict[str, Any]]:
+        """创建索引，并验证查询是否真正用上了新索引"""
+        terms = list(signature)
+        # 等值部分按区分度从高到低排序，提高索引过滤效率
+        eq_part = terms[:eq_count]
+        eq_part.sort(key=lambda term: self._distinct_count(conn, term), reverse=True)
+        terms = eq_part + terms[eq_count:]
+
+        name = self._index_name(terms)
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON {self.table_name}({", ".join(terms)})')
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"索引顾问：创建索引{name}失败 - {str(e)}")
+            return None
+
+        # 验证新索引是否被查询计划采用，未采用则删除
+        plan = self._explain(conn, sql) or []
+        if not any(name in detail for detail in plan):
+            try:
+                conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+                conn.commit()
+            except sqlite3.Error:
+                pass
+            logger.info(f"索引顾问：索引{name}未被查询计划采用，已删除")
+            return None
+
+        with self._lock:
+            index_info = {
+                "name": name,
+                "terms": terms,
+                "scans_before_creation": self.scan_counts.get(signature, 0),
+                "trigger_sql": sql[:200],
+                "plan_after": plan,
+                "created_at": time.time()
+            }
+            self.added_indexes.append(index_info)
+        logger.info(f"索引顾问：已创建索引 {name} ON {self.table_name}({', '.join(terms)})")
+        return index_info
+
+    def _index_name(self, terms: List[str]) -> str:
+        """生成索引名：可读的列名前缀加上完整索引项的短哈希，截断后也不会重名"""
+        readable = "_".join(re.sub(r"\W+", "_", term).strip("_") for term in terms)
+        digest = hashlib.sha1("|".join(terms).encode("utf-8")).hexdigest()[:8]
+        return f"idx_auto_{readable[:42]}_{digest}"
+
+    def _distinct_count(self, conn: sqlite3.Connection, term: str) -> int:
+        """计算索引项的不同取值数量"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(DISTINCT {term}) FROM {self.table_name}")
+            return cursor.fetchone()[0] or 0
+        except sqlite3.Error:
+            return 0
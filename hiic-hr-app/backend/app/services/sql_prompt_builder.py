@@ -0,0 +1,273 @@
+"""
+SQL生成提示构建模块，按问题裁剪数据库结构和示例，控制提示长度
+"""
+
+import re
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+# 列名 -> 能指向该列的中文关键词
+COLUMN_KEYWORDS = {
+    "name": ["姓名", "名字", "谁", "叫", "哪位", "哪些人", "名单", "列出"],
+    "gender": ["性别", "男", "女"],
+    "age": ["年龄", "岁", "年轻", "年长", "老"],
+    "birth_date": ["生日", "出生"],
+    "department": ["部门", "部", "所", "中心", "办公室", "团队"],
+    "department_id": ["部门", "部", "所", "中心", "办公室", "团队"],
+    "position": ["职位", "岗位", "职务", "负责人", "部长", "所长", "主任", "总监", "经理", "主管", "领导"],
+    "education": ["学历", "本科", "硕士", "博士", "研究生", "大专", "学位"],
+    "education_level": ["学历", "本科", "硕士", "博士", "研究生", "大专", "学位"],
+    "degree": ["学位"],
+    "university": ["大学", "学校", "院校", "毕业", "学院", "985", "211", "C9", "QS", "名校"],
+    "major": ["专业", "学科"],
+    "major_category": ["专业", "学科", "类别"],
+    "is_985": ["985", "名校"],
+    "is_211": ["211", "名校"],
+    "is_c9": ["C9", "c9", "名校"],
+    "is_qs50": ["QS", "qs", "名校"],
+    "is_qs100": ["QS", "qs", "名校"],
+    # 问题中的年份（如"2017年"）另行计分，单字"年"会误中"年龄"、"工作年限"
+    "hire_date": ["入职", "加入", "进公司"],
+    "first_work_date": ["参加工作", "首次工作", "开始工作"],
+    "total_work_years": ["工作年限", "工龄", "经验", "年限"],
+    "company_years": ["司龄", "在职年限", "在公司", "年限", "老员工"],
+    "ethnicity": ["民族", "汉族"],
+    "sequence": ["序列"],
+    "section": ["处室", "科室"],
+    "team": ["团队", "小组"],
+    "salary": ["工资", "薪资", "薪水", "收入"],
+}
+
+# 无论问题是什么都保留的列，每组取表中实际存在的第一个列名
+CORE_COLUMNS = [["name"], ["department", "department_id"]]
+
+# 提示各部分的标题，部分之间以空行分隔
+SCHEMA_TITLE = "数据库结构（仅列出与问题相关的列）:\n"
+HINTS_TITLE = "注意事项:\n"
+EXAMPLES_TITLE = "示例:\n"
+SECTION_SEPARATOR_TOKENS = 1
+
+# 表之间的关系说明
+TABLE_RELATIONS = {
+    "education": "education.employee_id 关联 employees.id - 员工的教育背景",
+    "work_experience": "work_experience.employee_id 关联 employees.id - 员工的工作经验",
+    "departments": "departments.manager_id 关联 employees.id - 部门经理",
+}
+
+# 示例：(触发关键词, 问题, SQL模板, 需要的列)
+# SQL模板中的{education}会替换为实际的学历列名
+FEW_SHOT_EXAMPLES = [
+    (["多少", "人数", "几个", "几人"], "大数据平台与信息部有多少人？",
+     "SELECT COUNT(*) AS count FROM employees WHERE department = '大数据平台与信息部'", ["department"]),
+    (["各", "分布", "每个"], "各部门的人数分布如何？",
+     "SELECT department, COUNT(*) AS count FROM employees GROUP BY department ORDER BY count DESC", ["department"]),
+    (["年轻", "年长", "最大", "最小", "年龄"], "谁是最年轻的员工？",
+     "SELECT name, age FROM employees ORDER BY age ASC LIMIT 1", ["age"]),
+    (["入职", "加入"], "2017年入职的员工有哪些？",
+     "SELECT name, department, hire_date FROM employees WHERE SUBSTR(hire_date, 1, 4) = '2017' ORDER BY hire_date",
+     ["hire_date"]),
+    (["学历", "博士", "硕士", "本科"], "各部门有多少博士？",
+     "SELECT department, COUNT(*) AS count FROM employees WHERE {education} LIKE '%博士%' GROUP BY department",
+     ["{education}"]),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数：中文字符约1个token，其他字符约4个字符1个token"""
+    if not text:
+        return 0
+    cjk_count = len(re.findall(r"[\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]", text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+class SQLPromptBuilder:
+    """SQL生成提示构建器
+
+    只选取与问题相关的表和列、相关的处理说明和示例，
+    并保证提示总长度不超过配置的token预算。
+    """
+
+    def __init__(self, db_schema: Dict[str, Any], token_budget: int = 800):
+        """初始化提示构建器
+
+        Args:
+            db_schema: 数据库结构（与SQLService._get_db_schema格式相同）
+            token_budget: 提示的token预算
+        """
+        self.db_schema = db_schema
+        self.token_budget = token_budget
+
+        # 实际的学历列名
+        employee_columns = [col.get("name") for col in db_schema.get("employees", {}).get("columns", [])]
+        self.education_column = "education_level" if "education_level" in employee_columns else "education"
+        # 实际的核心列名（示例数据的部门列为department_id）
+        self.core_columns = [
+            next(name for name in candidates if name in employee_columns)
+            for candidates in CORE_COLUMNS
+            if any(name in employee_columns for name in candidates)
+        ]
+
+    def build(self, question: str, years: Optional[List[str]] = None) -> str:
+        """构建SQL生成的系统提示
+
+        Args:
+            question: 用户问题
+            years: 问题中提到的年份
+
+        Returns:
+            系统提示
+        """
+        years = years or []
+        header = (
+            "你是HIIC公司内部HR系统的SQL专家。请把用户的问题转换为一条SQLite的SELECT查询，"
+            "只能使用下面列出的表和列，并把SQL放在```sql代码块中返回。"
+        )
+        hints = self._build_hints(question, years)
+
+        # 必需部分占用的预算（各部分的标题和分隔的换行也计入，分段估算之和不小于整体估算）
+        used = estimate_tokens(header)
+        if hints:
+            used += SECTION_SEPARATOR_TOKENS + estimate_tokens(HINTS_TITLE)
+            used += sum(estimate_tokens(hint) + 1 for hint in hints)
+        schema_text, used = self._build_schema(question, years, used)
+
+        sections = [header, schema_text]
+        if hints:
+            sections.append(HINTS_TITLE + "\n".join(hints))
+
+        # 示例按相关度依次加入，超出预算即停止
+        examples = []
+        for example in self._rank_examples(question):
+            cost = estimate_tokens(example) + 1
+            if not examples:
+                cost += SECTION_SEPARATOR_TOKENS + estimate_tokens(EXAMPLES_TITLE)
+            if used + cost > self.token_budget:
+                break
+            examples.append(example)
+            used += cost
+        if examples:
+            sections.append(EXAMPLES_TITLE + "\n".join(examples))
+
+        prompt = "\n\n".join(sections)
+        logger.info(f"SQL生成提示约{estimate_tokens(prompt)} tokens（预算{self.token_budget}）")
+        return prompt
+
+    def _score_column(self, question: str, column: Dict[str, Any], years: Optional[List[str]] = None) -> int:
+        """计算列与问题的相关度"""
+        name = column.get("name", "")
+        score = 0
+        if name == "hire_date" and years:
+            score += 2
+        if name and name.lower() in question.lower():
+            score += 3
+        for keyword in COLUMN_KEYWORDS.get(name, []):
+            if keyword in question:
+                score += 2 if len(keyword) > 1 else 1
+        description = column.get("description", "")
+        # 描述中的中文词（以逗号、括号等分隔）出现在问题中也视为相关
+        for word in re.split(r"[，,、'()（）\s如等]+", description):
+            if len(word) >= 2 and word in question:
+                score += 1
+        return score
+
+    def _build_schema(self, question: str, years: List[str], used: int) -> Tuple[str, int]:
+        """构建裁剪后的数据库结构说明"""
+        selected_tables: List[Tuple[str, Dict[str, Any], List[Dict[str, Any]]]] = []
+
+        for table_name, table_info in self.db_schema.items():
+            columns = table_info.get("columns", [])
+            scored = [(self._score_column(question, col, years), col) for col in columns]
+            is_main = table_name == "employees"
+
+            relevant = [col for score, col in scored if score > 0 and col.get("name") not in ("id", "employee_id")]
+            if not is_main and not relevant:
+                continue
+
+            # 主表保留核心列，从表保留关联键
+            keep = []
+            for col in columns:
+                name = col.get("name")
+                if (is_main and name in self.core_columns) or (not is_main and name == "employee_id"):
+                    keep.append(col)
+            ranked = sorted(
+                (item for item in scored if item[0] > 0 and item[1] not in keep),
+                key=lambda item: item[0],
+                reverse=True
+            )
+            selected_tables.append((table_name, table_info, keep + [col for _, col in ranked]))
+
+        # 关联从表时主表需要id列
+        if len(selected_tables) > 1:
+            for table_name, table_info, columns in selected_tables:
+                if table_name == "employees":
+                    id_col = next((col for col in table_info.get("columns", []) if col.get("name") == "id"), None)
+                    if id_col and id_col not in columns:
+                        columns.insert(0, id_col)
+
+        parts = []
+        used += SECTION_SEPARATOR_TOKENS + estimate_tokens(SCHEMA_TITLE)
+        for table_name, table_info, columns in selected_tables:
+            lines = [f"表名: {table_name}（{table_info.get('description', '')}）"]
+            used += estimate_tokens(lines[0]) + SECTION_SEPARATOR_TOKENS
+            for col in columns:
+                line = f"- {col.get('name')}: {col.get('type')} - {col.get('description')}"
+                cost = estimate_tokens(line) + 1
+                # 核心列和关联键必须保留，其余列按相关度在预算内加入
+                mandatory = col.get("name") in self.core_columns + ["id", "employee_id"]
+                if not mandatory and used + cost > self.token_budget:
+                    continue
+                lines.append(line)
+                used += cost
+            parts.append("\n".join(lines))
+
+        relations = [TABLE_RELATIONS[name] for name, _, _ in selected_tables if name in TABLE_RELATIONS]
+        if relations:
+            relation_text = "表之间的关系:\n" + "\n".join(relations)
+            parts.append(relation_text)
+            used += estimate_tokens(relation_text) + SECTION_SEPARATOR_TOKENS
+
+        return SCHEMA_TITLE + "\n\n".join(parts), used
+
+    def _build_hints(self, question: str, years: List[str]) -> List[str]:
+        """根据问题生成针对性的处理说明"""
+        hints = []
+
+        if years or any(keyword in question for keyword in ["入职", "加入", "日期", "出生"]):
+            hints.append("日期字段格式为YYYY-MM-DD，按年份筛选请使用 SUBSTR(hire_date, 1, 4) = '2017'。")
+        if years and ("入职" in question or "加入" in question):
+            hints.append(f"问题中提到的年份是{', '.join(years)}，入职年份条件写作 SUBSTR(hire_date, 1, 4) = '{years[0]}'。")
+
+        if any(keyword in question for keyword in ["负责人", "部长", "所长", "主任", "总监"]):
+            hints.append(
+                "部门负责人是该部门职位级别最高的员工：部长、所长、主任、总监、负责人为第一级，"
+                "副部长、副所长、副主任、副总监为第二级，其余为第三级，可用CASE表达式排序后取第一条。"
+            )
+
+        if "部门" in question and ("人数" in question or "多少人" in question):
+            hints.append("部门人数统计使用 GROUP BY department 并按人数降序排列。")
+
+        if "大数据" in question:
+            hints.append("'大数据部'的正式名称是'大数据平台与信息部'。")
+
+        hints.append("部门名称不确定时使用 LIKE '%关键词%' 匹配；返回的行数不要超过1000。")
+        return hints
+
+    def _rank_examples(self, question: str) -> List[str]:
+        """按与问题的相关度对示例排序，只返回相关的示例"""
+        employee_columns = [col.get("name") for col in self.db_schema.get("employees", {}).get("columns", [])]
+        ranked = []
+        for keywords, example_question, sql_template, required in FEW_SHOT_EXAMPLES:
+            required_columns = [col.replace("{education}", self.education_column) for col in required]
+            if any(col not in employee_columns for col in required_columns):
+                continue
+            score = sum(1 for keyword in keywords if keyword in question)
+            if score == 0:
+                continue
+            sql = sql_template.replace("{education}", self.education_column)
+            ranked.append((score, f"问题: {example_question}\nSQL: {sql}"))
+
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [example for _, example in ranked]
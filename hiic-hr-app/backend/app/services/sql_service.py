@@ -3,23 +3,45 @@ import json
 import sqlite3
 import pandas as pd
 import asyncio
-from typing import Dict, List, Any, Optional, Union, Tuple
+from typing import Dict, List, Any, Optional, Union, Tuple, AsyncIterator
 from app.db.supabase import supabase_client
-from app.services.openrouter_service import openrouter_service
+from app.db.sqlite_pool import SQLiteSnapshotPool
+from app.services.openrouter_service import openrouter_service, OVERLOADED_MESSAGE
+from app.services.llm_resilience import OverloadedError
+from app.services.sql_index_advisor import SQLIndexAdvisor
+from app.services.sql_prompt_builder import SQLPromptBuilder, estimate_tokens
+from app.services.result_reducer import ResultReducer
+from app.services.answer_renderer import AnswerRenderer
+from app.services.response_filter import StreamingResponseFilter, SQL_INTRO_PATTERNS
+from app.services.sql_validator import SQLValidator, load_catalog
+from app.services.hr_cube import HRAggregateCube, MISSING_VALUE
+from app.services.sql_snapshot import SQLDataSnapshot
+from app.services.request_context import ChatRequestContext
 from app.core.config import settings
+from app.core.executor import sql_executor, ExecutorSaturatedError
 import time
 import logging
+import threading
 
 # 配置日志记录器
 logger = logging.getLogger(__name__)
 
+class SQLQueryError(Exception):
+    """SQL查询执行失败且无法修复"""
+    pass
+
 class SQLService:
     """SQL服务，用于处理基于SQL的查询"""
     
     def __init__(self):
         """初始化SQL服务"""
-        self.df = None
-        self.conn = None
+        # 当前版本的数据快照（员工数据、只读连接池、表结构及派生结构），重新加载时整体替换
+        self.snapshot = SQLDataSnapshot()
+        self._snapshot_lock = threading.Lock()
+        # 已被替换、等待正在处理的请求结束后释放的旧快照: (替换时间, 快照)
+        self._retired_snapshots: List[Tuple[float, SQLDataSnapshot]] = []
+        # 旧快照至少保留的时间（秒）
+        self.retire_grace_seconds = settings.DATA_RELOAD_GRACE_SECONDS
         
         # 安全配置
         self.max_rows = 1000  # 最大返回行数
@@ -37,17 +59,25 @@ class SQLService:
         
         # 数据库表名
         self.table_name = "employees"
+        # 索引顾问，根据抽样查询的执行计划自动补充索引
+        self.index_advisor = SQLIndexAdvisor(
+            table_name=self.table_name,
+            min_scans=settings.SQL_INDEX_ADVISOR_MIN_SCANS,
+            max_indexes=settings.SQL_INDEX_ADVISOR_MAX_INDEXES,
+            sample_rate=settings.SQL_INDEX_ADVISOR_SAMPLE_RATE,
+            slow_query_ms=settings.SQL_INDEX_ADVISOR_SLOW_QUERY_MS
+        ) if settings.SQL_INDEX_ADVISOR_ENABLED else None
+        # 索引维护间隔（秒），索引顾问发现的索引由后台维护任务创建
+        self.index_maintenance_interval = settings.SQL_INDEX_ADVISOR_INTERVAL_SECONDS
         # 员工数据
         self.employees = []
-        # 加载数据
-        self.load_data()
-        # 表结构信息
-        self.schema = self._get_db_schema()
         # 结果缓存
         self.results_cache = {}
         # 部门统计数据缓存
         self.department_stats_cache = None
         self.department_stats_cache_expiry = None
+        # 部门统计数据缓存对应的数据版本
+        self.department_stats_cache_version = None
         # 缓存过期时间（秒）
         self.cache_expiry_seconds = 300  # 5分钟
         
@@ -55,41 +85,286 @@ class SQLService:
         self.query_count = 0
         self.cache_hit_count = 0
         self.api_call_count = 0
+        # SQL生成提示的token统计
+        self.prompt_token_total = 0
+        self.prompt_count = 0
+        # 按模板直接生成回答的次数
+        self.rendered_answer_count = 0
+        # 直接由聚合立方体回答的次数
+        self.cube_answer_count = 0
+        # 预测性SQL生成的统计：启动、被使用、被取消的次数
+        self.speculative_counts = {"started": 0, "used": 0, "cancelled": 0}
         
-        # 获取数据库表结构
-        self.db_schema = self._get_db_schema()
-        # 创建系统提示
-        self.system_prompt = self._create_system_prompt()
+        # 查询结果精简器，大结果集在生成回复前压缩为摘要
+        self.result_reducer = ResultReducer(
+            max_raw_rows=settings.RESULT_MAX_RAW_ROWS,
+            table_rows=settings.RESULT_SAMPLE_ROWS
+        )
+        # 答案模板渲染器，简单聚合结果直接生成回答
+        self.answer_renderer = AnswerRenderer() if settings.ANSWER_RENDERER_ENABLED else None
+        
+        # 加载数据
+        self.load_data()
+        self._schedule_index_maintenance()
+    
+    # 以下属性始终指向当前版本快照中的数据
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.snapshot.df
+    
+    @property
+    def conn(self) -> Optional[sqlite3.Connection]:
+        return self.snapshot.conn
+    
+    @property
+    def pool(self) -> Optional[SQLiteSnapshotPool]:
+        return self.snapshot.pool
+    
+    @property
+    def cube(self) -> Optional[HRAggregateCube]:
+        return self.snapshot.cube
+    
+    @property
+    def db_schema(self) -> Dict[str, Any]:
+        return self.snapshot.db_schema
+    
+    @property
+    def schema(self) -> Dict[str, Any]:
+        return self.snapshot.db_schema
+    
+    @property
+    def prompt_builder(self) -> SQLPromptBuilder:
+        return self.snapshot.prompt_builder
+    
+    @property
+    def sql_validator(self) -> Optional[SQLValidator]:
+        return self.snapshot.sql_validator
+    
+    @property
+    def data_version(self) -> int:
+        return self.snapshot.version
     
     def load_data(self) -> None:
-        """加载员工数据并创建内存数据库"""
+        """加载员工数据，构建新版本的数据快照并替换当前版本"""
+        self._swap_snapshot(self._build_snapshot(self.snapshot.version + 1))
+    
+    def reload_data(self) -> Dict[str, Any]:
+        """重新加载数据
+        
+        新快照（内存数据库、索引、连接池、立方体、表结构和预检器）全部在后台构建完成后才替换当前版本；
+        加载失败时保留当前版本的数据。数据源不可用时Supabase客户端会退回示例数据，
+        当前版本是真实数据时拒绝用示例数据替换。
+        
+        Returns:
+            新快照的基本信息
+        
+        Raises:
+            RuntimeError: 新数据为空，或数据源退回了示例数据
+        """
+        snapshot = self._build_snapshot(self.snapshot.version + 1)
+        if snapshot.df.empty and not self.snapshot.df.empty:
+            snapshot.close()
+            raise RuntimeError("重新加载的员工数据为空，保留当前版本的数据")
+        if snapshot.source == "sample" and self.snapshot.source not in (None, "sample"):
+            snapshot.close()
+            raise RuntimeError("数据源不可用，重新加载得到的是示例数据，保留当前版本的数据")
+        
+        self._swap_snapshot(snapshot)
+        return snapshot.info()
+    
+    def _build_snapshot(self, version: int) -> SQLDataSnapshot:
+        """加载员工数据并构建一个完整的数据快照"""
+        df = pd.DataFrame()
+        conn = None
+        pool = None
+        cube = None
+        source = None
         try:
             # 从Supabase获取数据
-            self.df = supabase_client.get_employees_as_dataframe()
-            print(f"SQL服务：成功加载{len(self.df)}条员工记录")
+            df = supabase_client.get_employees_as_dataframe()
+            source = supabase_client.employees_source
+            print(f"SQL服务：成功加载{len(df)}条员工记录")
             
-            # 创建内存数据库
-            self.conn = sqlite3.connect(':memory:', timeout=self.timeout)
+            # 创建内存数据库（连接池创建失败时由SQL线程池的线程共用，访问时持有快照的连接锁）
+            conn = sqlite3.connect(':memory:', timeout=self.timeout, check_same_thread=False)
             
             # 将数据写入SQLite
-            self.df.to_sql('employees', self.conn, if_exists='replace', index=False)
+            df.to_sql('employees', conn, if_exists='replace', index=False)
             
             # 创建索引以提高查询性能
-            self._create_indexes()
+            self._create_indexes(conn)
+            
+            # 重建索引顾问在上一版本数据上发现的索引
+            if self.index_advisor is not None:
+                replayed = self.index_advisor.replay(conn)
+                if replayed:
+                    print(f"SQL服务：已重建{replayed}个自动索引")
             
             print("SQL服务：成功创建内存数据库")
+            
+            # 构建聚合立方体
+            cube = self._build_cube(df)
+            
+            # 将内存数据库导出为文件快照，并创建只读连接池
+            pool = self._create_snapshot_pool(conn)
+            if pool is not None:
+                # 内存数据库已复制到快照，后续的索引维护在快照的可写连接上进行
+                conn.close()
+                conn = pool.writer
         except Exception as e:
             print(f"SQL服务：加载数据失败 - {str(e)}")
-            self.df = pd.DataFrame()
-            self.conn = None
+            if conn is not None and pool is None:
+                conn.close()
+            df = pd.DataFrame()
+            conn = None
+            pool = None
+        
+        db_schema = self._get_db_schema(conn)
+        return SQLDataSnapshot(
+            version=version,
+            df=df,
+            conn=conn,
+            pool=pool,
+            db_schema=db_schema,
+            cube=cube,
+            # SQL生成提示构建器，按问题裁剪表结构和示例
+            prompt_builder=SQLPromptBuilder(db_schema, settings.SQL_PROMPT_TOKEN_BUDGET),
+            # SQL预检器，执行前在本地检查并修复常见错误
+            sql_validator=self._create_sql_validator(pool),
+            source=source
+        )
+    
+    def _pin_snapshot(self) -> SQLDataSnapshot:
+        """获取当前快照并登记一次使用，请求结束时需调用snapshot.release()
+        
+        在快照锁内登记，保证旧快照不会在登记前被释放。
+        """
+        with self._snapshot_lock:
+            return self.snapshot.acquire()
+    
+    def _swap_snapshot(self, snapshot: SQLDataSnapshot) -> None:
+        """用新快照替换当前快照，旧快照在宽限期后释放"""
+        with self._snapshot_lock:
+            old_snapshot = self.snapshot
+            self.snapshot = snapshot
+            # 基于旧数据的缓存全部失效
+            self.results_cache = {}
+            self.department_stats_cache = None
+            self.department_stats_cache_expiry = None
+            self.department_stats_cache_version = None
+        
+        print(f"SQL服务：数据已切换到版本{snapshot.version}（{len(snapshot.df)}条员工记录）")
+        if old_snapshot.pool is not None or old_snapshot.conn is not None:
+            with self._snapshot_lock:
+                self._retired_snapshots.append((time.time(), old_snapshot))
+            timer = threading.Timer(self.retire_grace_seconds, self._release_retired_snapshots)
+            timer.daemon = True
+            timer.start()
+    
+    def _release_retired_snapshots(self) -> None:
+        """释放宽限期已过且没有请求在使用的旧快照
+        
+        请求可能在等待大模型时并不占用连接，因此以请求登记的使用数为准，连接占用数只作兜底。
+        """
+        now = time.time()
+        with self._snapshot_lock:
+            remaining = []
+            releasable = []
+            for retired_at, snapshot in self._retired_snapshots:
+                if (now - retired_at >= self.retire_grace_seconds
+                        and snapshot.refs == 0 and snapshot.in_use() == 0):
+                    releasable.append(snapshot)
+                else:
+                    remaining.append((retired_at, snapshot))
+            self._retired_snapshots = remaining
+        
+        for snapshot in releasable:
+            snapshot.close()
+            print(f"SQL服务：已释放旧数据版本{snapshot.version}")
+        
+        # 仍有请求在使用的旧快照稍后再检查
+        if remaining:
+            timer = threading.Timer(self.retire_grace_seconds, self._release_retired_snapshots)
+            timer.daemon = True
+            timer.start()
+    
+    def _schedule_index_maintenance(self) -> None:
+        """按间隔在后台运行索引维护"""
+        if self.index_advisor is None or self.index_maintenance_interval <= 0:
+            return
+        timer = threading.Timer(self.index_maintenance_interval, self._index_maintenance_tick)
+        timer.daemon = True
+        timer.start()
+    
+    def _index_maintenance_tick(self) -> None:
+        """定时维护任务：创建索引后安排下一次"""
+        try:
+            self.run_index_maintenance()
+        finally:
+            self._schedule_index_maintenance()
+    
+    def run_index_maintenance(self) -> List[Dict[str, Any]]:
+        """在当前快照的可写连接上创建索引顾问待建的索引，返回新增的索引信息"""
+        if self.index_advisor is None:
+            return []
+        snapshot = self._pin_snapshot()
+        try:
+            if snapshot.pool is None or snapshot.closed:
+                return []
+            created = self.index_advisor.apply_pending(snapshot.conn)
+            for index_info in created:
+                print(f"SQL服务：索引顾问新增索引 {index_info['name']}: {', '.join(index_info['terms'])}")
+            return created
+        except Exception as e:
+            logger.warning(f"索引维护失败: {str(e)}")
+            return []
+        finally:
+            snapshot.release()
+    
+    def _build_cube(self, df: pd.DataFrame) -> Optional[HRAggregateCube]:
+        """根据员工数据构建聚合立方体，失败时统计问题继续走SQL"""
+        try:
+            cube = HRAggregateCube(df)
+            print(f"SQL服务：聚合立方体构建完成，{len(cube.cells)}个单元格")
+            return cube
+        except Exception as e:
+            print(f"SQL服务：构建聚合立方体失败 - {str(e)}")
+            return None
+    
+    def _create_snapshot_pool(self, conn: sqlite3.Connection) -> Optional[SQLiteSnapshotPool]:
+        """创建快照文件和只读连接池，失败时继续使用单个内存连接"""
+        try:
+            pool = SQLiteSnapshotPool(
+                conn,
+                size=settings.SQL_POOL_SIZE,
+                timeout=self.timeout,
+                directory=settings.SQL_SNAPSHOT_DIR or None
+            )
+            print(f"SQL服务：成功创建只读连接池，连接数{pool.size}")
+            return pool
+        except Exception as e:
+            print(f"SQL服务：创建连接池失败，继续使用内存数据库 - {str(e)}")
+            return None
+    
+    def _create_sql_validator(self, pool: Optional[SQLiteSnapshotPool]) -> Optional[SQLValidator]:
+        """根据快照中的表结构创建SQL预检器"""
+        if pool is None:
+            return None
+        
+        try:
+            with pool.connection() as conn:
+                return SQLValidator(load_catalog(conn))
+        except Exception as e:
+            print(f"SQL服务：创建SQL预检器失败 - {str(e)}")
+            return None
     
-    def _create_indexes(self) -> None:
+    def _create_indexes(self, conn: Optional[sqlite3.Connection]) -> None:
         """创建数据库索引"""
-        if self.conn is None:
+        if conn is None:
             return
         
         try:
-            cursor = self.conn.cursor()
+            cursor = conn.cursor()
             
             # 获取表的实际列名
             cursor.execute("PRAGMA table_info(employees)")
@@ -129,17 +404,17 @@ class SQLService:
                 cursor.execute('CREATE INDEX idx_university ON employees(university)')
                 print("SQL服务：已在university列上创建索引")
                 
-            self.conn.commit()
+            conn.commit()
             print("SQL服务：索引创建完成")
         except Exception as e:
             print(f"SQL服务：创建索引失败 - {str(e)}")
     
-    def _get_db_schema(self) -> Dict[str, Any]:
+    def _get_db_schema(self, conn: Optional[sqlite3.Connection]) -> Dict[str, Any]:
         """获取数据库表结构"""
         # 如果有连接，从数据库中获取实际的表结构
-        if self.conn is not None:
+        if conn is not None:
             try:
-                cursor = self.conn.cursor()
+                cursor = conn.cursor()
                 # 获取employees表的列信息
                 cursor.execute("PRAGMA table_info(employees)")
                 columns = cursor.fetchall()
@@ -249,81 +524,6 @@ class SQLService:
             }
         }
     
-    def _create_system_prompt(self) -> str:
-        """创建系统提示"""
-        # 格式化数据库表结构
-        schema_parts = []
-        for table_name, table_info in self.db_schema.items():
-            columns_desc = []
-            for col in table_info.get("columns", []):
-                columns_desc.append(f"- {col.get('name')}: {col.get('type')} - {col.get('description')}")
-            
-            schema_parts.append(f"""表名: {table_name}
-描述: {table_info.get('description', '')}
-列:
-{chr(10).join(columns_desc)}
-""")
-        
-        # 构建系统提示
-        system_prompt = f"""你是HIIC公司内部HR系统的SQL专家助手。你的任务是将用户的自然语言问题转换为SQL查询，然后执行查询并以自然语言回答用户的问题。
-
-数据库结构:
-{chr(10).join(schema_parts)}
-
-表之间的关系:
-1. education.employee_id 关联 employees.id - 员工的教育背景
-2. work_experience.employee_id 关联 employees.id - 员工的工作经验
-
-重要的日期处理说明:
-1. hire_date字段存储入职日期，格式为YYYY-MM-DD
-2. 对于涉及年份的查询（如查询特定年份入职的员工），应使用以下SQL函数:
-   - SUBSTR(hire_date, 1, 4) 提取年份
-   - 例如：WHERE SUBSTR(hire_date, 1, 4) = '2017'
-3. 可能需要在employees表和work_experience表中都检查hire_date字段
-4. 对于特定日期范围的查询，使用字符串比较：
-   - 例如：WHERE hire_date >= '2017-01-01' AND hire_date <= '2017-12-31'
-
-你的工作流程:
-1. 分析用户的问题，理解他们想要查询的信息
-2. 将问题转换为SQL查询
-3. 执行SQL查询并获取结果
-4. 以自然、对话化的方式回答用户的问题，不要直接展示SQL或原始数据
-
-回复格式和语言风格：
-1. 完全不要使用Markdown格式（不使用*、**、#、-等符号）
-2. 使用自然对话方式，就像人与人对话一样流畅
-3. 不要使用列表符号，直接用自然语言表达
-4. 以"好的"或类似的自然开场白开始回答
-5. 使用简单直接的语言，没有技术性标记
-6. 将数据融入到自然对话中，不要罗列数据
-7. 用中文回答，语气要友好活泼但专业
-8. 不要说"根据数据"或"查询结果表明"等技术性表达
-9. 不要在一句话开头使用"嗨"、"您好"等问候语（只在答案最开始可以）
-
-示例:
-用户问题: "大数据平台与信息部有多少人？"
-SQL查询: SELECT COUNT(*) as count FROM employees WHERE department = '大数据平台与信息部'
-错误回答: "根据查询结果，大数据平台与信息部有42人。"
-正确回答: "好的，大数据平台与信息部目前有42名员工，这是我们公司规模较大的部门之一。"
-
-用户问题: "谁是最年轻的员工？"
-SQL查询: SELECT name, age FROM employees ORDER BY age ASC LIMIT 1
-错误回答: "**最年轻的员工**是李明，年龄22岁。"
-正确回答: "我们公司最年轻的员工是李明，他今年22岁，是我们近期招聘的新鲜血液。"
-
-用户问题: "各部门的人数分布如何？"
-SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY department ORDER BY count DESC
-错误回答: "各部门人数分布如下：
-* 大数据平台与信息部：42人
-* 研发部：35人
-* 市场部：28人
-..."
-正确回答: "好的，让我来告诉你公司各部门的人数分布情况。大数据平台与信息部有42人，是我们人数最多的部门。研发部有35人，市场部有28人，财务部有15人，人力资源部有10人，运营部有8人，产品部有7人。这些部门都是我们公司的核心力量，支撑着公司的日常运营和业务发展。"
-
-记住，你的目标是提供准确、有用并且自然流畅的信息。不要使用任何Markdown格式或代码块，就像正常人对话一样表达。
-"""
-        return system_prompt
-    
     def validate_sql(self, sql: str) -> bool:
         """验证SQL查询的安全性"""
         # 检查是否为空
@@ -364,11 +564,19 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
         
         return True
     
-    async def get_sql_response(self, question: str) -> str:
-        """获取SQL回复"""
+    async def get_sql_response(self, question: str, context: Optional[ChatRequestContext] = None) -> str:
+        """获取SQL回复
+        
+        Args:
+            question: 用户问题
+            context: 请求上下文，执行的SQL和结果行数会记录在上下文中
+        """
         import time
         start_time = time.time()
         
+        # 整个请求使用同一版本的数据，处理期间数据重新加载不影响本次请求
+        snapshot = self._pin_snapshot()
+        
         try:
             # 记录开始处理时间
             logger.info(f"开始处理SQL查询: {question[:50]}...")
@@ -376,60 +584,27 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
             # 检查是否是部门人数分布查询
             if self._is_department_stats_query(question):
                 logger.info("检测到部门人数分布查询，使用优化路径处理")
-                return await self._handle_department_stats_query()
-            
-            # 预处理问题，提取年份信息和简单分析问题类型
-            processed_question, years = self._preprocess_date_query(question)
-            
-            # 增强系统提示，添加问题相关信息
-            enhanced_prompt = self._enhance_system_prompt(question, years)
-            
-            # 构建消息列表
-            messages = [
-                {"role": "system", "content": enhanced_prompt},
-                {"role": "user", "content": f"请分析并回答以下问题，直接生成最合适的SQL查询：{processed_question}"}
-            ]
+                return await self._handle_department_stats_query(snapshot)
             
-            # 获取SQL查询
-            logger.info("向OpenRouter发送SQL生成请求...")
-            response = await openrouter_service.get_chat_response(messages)
-            sql_query = self._extract_sql_query(response)
-            
-            if not sql_query:
-                logger.warning("无法从响应中提取SQL查询，尝试再次请求...")
-                # 如果无法提取SQL，尝试明确指示大模型生成SQL
-                clarification_messages = [
-                    {"role": "system", "content": enhanced_prompt},
-                    {"role": "user", "content": f"请为以下问题生成一个SQL查询。必须返回SQL代码块：{processed_question}"}
-                ]
-                response = await openrouter_service.get_chat_response(clarification_messages)
-                sql_query = self._extract_sql_query(response)
-                
-                if not sql_query:
-                    # 仍然无法获取SQL，尝试使用简单规则生成基本查询
-                    logger.warning("二次尝试仍无法提取SQL，使用简单规则生成查询...")
-                    sql_query = self._generate_simple_sql(question)
+            # 简单的人数、平均年龄问题直接从聚合立方体回答
+            cube_answer = self._answer_from_cube(question, snapshot)
+            if cube_answer:
+                logger.info(f"问题已由聚合立方体回答，SQL查询处理总耗时: {time.time() - start_time:.2f}秒")
+                return cube_answer
             
-            # 记录生成的SQL查询
-            logger.info(f"最终SQL查询: {sql_query}")
+            processed_question, sql_query, cache_key = await self._generate_or_reuse_sql(question, snapshot, context)
             
-            # 执行SQL查询
             try:
-                print(f"尝试在Supabase上执行SQL查询: {sql_query}...")
-                results = self._execute_sql_query(sql_query)
-                print(f"SQL查询执行成功，返回{len(results)}条记录")
-            except Exception as sql_error:
-                # SQL执行错误，尝试修复
-                logger.error(f"SQL查询执行错误: {str(sql_error)}")
-                fixed_sql = await self._attempt_sql_fix(sql_query, str(sql_error), processed_question)
-                if fixed_sql:
-                    logger.info(f"修复后的SQL: {fixed_sql}")
-                    results = self._execute_sql_query(fixed_sql)
-                    print(f"修复后的SQL查询执行成功，返回{len(results)}条记录")
-                else:
-                    # 无法修复，返回错误信息
-                    logger.error("无法修复SQL查询")
-                    return f"抱歉，无法执行您的查询。可能的问题: {str(sql_error)[:100]}... 请尝试重新表述您的问题。"
+                sql_query, results = await self._execute_with_repair(sql_query, processed_question, snapshot, cache_key)
+            except SQLQueryError as e:
+                return f"抱歉，无法执行您的查询。可能的问题: {str(e)[:100]}... 请尝试重新表述您的问题。"
+            self._record_in_context(context, sql_query, results)
+            
+            # 简单的计数、平均值和小分组结果直接按模板生成回答
+            rendered = self._render_answer(question, sql_query, results)
+            if rendered:
+                logger.info(f"查询结果已按模板生成回答，SQL查询处理总耗时: {time.time() - start_time:.2f}秒")
+                return rendered
             
             # 构建最终响应的上下文
             final_context = {
@@ -448,12 +623,286 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
             
             return final_response
             
+        except ExecutorSaturatedError as e:
+            logger.warning(f"SQL线程池繁忙，拒绝查询: {str(e)}")
+            return "抱歉，当前查询的人比较多，请稍等片刻再试一次。"
+        except OverloadedError as e:
+            logger.warning(f"大模型请求过多，拒绝查询: {str(e)}")
+            return OVERLOADED_MESSAGE
         except Exception as e:
             elapsed_time = time.time() - start_time
             logger.error(f"SQL查询处理失败: {str(e)}")
             logger.error(f"处理耗时: {elapsed_time:.2f}秒")
             return f"抱歉，处理您的查询时出现了问题: {str(e)[:100]}... 请稍后再试。"
+        finally:
+            snapshot.release()
+            # 由部门统计或聚合立方体直接回答时，预测性生成的SQL不再需要
+            self.cancel_speculative_sql(context)
+    
+    async def stream_sql_response(self, question: str,
+                                  context: Optional[ChatRequestContext] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """流式获取SQL回复，依次产生处理阶段事件和回复内容
+        
+        事件依次为sql_ready（SQL已生成）、rows_fetched（查询已执行）和若干token（回复片段）；
+        由部门统计、聚合立方体或模板直接得到的回答作为一个完整的token事件产生。
+        
+        Args:
+            question: 用户问题
+            context: 请求上下文，执行的SQL和结果行数会记录在上下文中
             
+        Yields:
+            (事件名, 事件数据)
+        """
+        import time
+        start_time = time.time()
+        snapshot = self._pin_snapshot()
+        
+        try:
+            if self._is_department_stats_query(question):
+                yield "token", {"text": await self._handle_department_stats_query(snapshot)}
+                return
+            
+            cube_answer = self._answer_from_cube(question, snapshot)
+            if cube_answer:
+                yield "token", {"text": cube_answer}
+                return
+            
+            processed_question, sql_query, cache_key = await self._generate_or_reuse_sql(question, snapshot, context)
+            yield "sql_ready", {"sql": sql_query}
+            
+            try:
+                sql_query, results = await self._execute_with_repair(sql_query, processed_question, snapshot, cache_key)
+            except SQLQueryError as e:
+                yield "token", {"text": f"抱歉，无法执行您的查询。可能的问题: {str(e)[:100]}... 请尝试重新表述您的问题。"}
+                return
+            self._record_in_context(context, sql_query, results)
+            yield "rows_fetched", {"sql": sql_query, "rows": len(results)}
+            
+            rendered = self._render_answer(question, sql_query, results)
+            if rendered:
+                yield "token", {"text": rendered}
+                return
+            
+            # 转发大模型生成回复的token流，与非流式回复一样去掉代码块和SQL查询说明语句
+            prompt = self._build_answer_prompt({"question": question, "sql_query": sql_query, "results": results})
+            self.api_call_count += 1
+            response_filter = StreamingResponseFilter()
+            async for text in openrouter_service.stream_chat_response([{"role": "system", "content": prompt}]):
+                text = response_filter.feed(text)
+                if text:
+                    yield "token", {"text": text}
+            text = response_filter.finish()
+            if text:
+                yield "token", {"text": text}
+            logger.info(f"流式SQL查询处理总耗时: {time.time() - start_time:.2f}秒")
+            
+        except ExecutorSaturatedError as e:
+            logger.warning(f"SQL线程池繁忙，拒绝查询: {str(e)}")
+            yield "token", {"text": "抱歉，当前查询的人比较多，请稍等片刻再试一次。"}
+        except OverloadedError as e:
+            logger.warning(f"大模型请求过多，拒绝查询: {str(e)}")
+            yield "token", {"text": OVERLOADED_MESSAGE}
+        except Exception as e:
+            logger.error(f"流式SQL查询处理失败: {str(e)}")
+            yield "token", {"text": f"抱歉，处理您的查询时出现了问题: {str(e)[:100]}... 请稍后再试。"}
+        finally:
+            snapshot.release()
+            self.cancel_speculative_sql(context)
+    
+    def start_speculative_sql(self, context: ChatRequestContext) -> None:
+        """在大模型分类的同时预先生成SQL，结果保存在请求上下文中
+        
+        部门人数分布查询走专门的优化路径，不需要生成SQL，不做预测。
+        """
+        if not settings.SPECULATIVE_SQL_ENABLED or context.speculative_sql is not None:
+            return
+        if self._is_department_stats_query(context.question):
+            return
+        snapshot = self.snapshot
+        task = asyncio.create_task(self._generate_sql(context.question, snapshot))
+        # 任务可能在无人等待时失败，读取异常以免asyncio报告未处理的异常
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        context.speculative_sql = task
+        context.speculative_snapshot = snapshot
+        self.speculative_counts["started"] += 1
+        logger.info(f"问题需要大模型分类，同时预先生成SQL: {context.question[:30]}...")
+    
+    def cancel_speculative_sql(self, context: Optional[ChatRequestContext]) -> None:
+        """取消请求上下文中未使用的预测性SQL生成"""
+        if context is not None and context.cancel_speculation():
+            self.speculative_counts["cancelled"] += 1
+            logger.info("预测性SQL生成已取消")
+    
+    async def _generate_or_reuse_sql(self, question: str, snapshot: SQLDataSnapshot,
+                                     context: Optional[ChatRequestContext]) -> Tuple[str, str, Optional[str]]:
+        """优先使用预测性生成的SQL（需基于同一数据快照），否则现在生成"""
+        task = context.speculative_sql if context is not None else None
+        if task is not None and context.speculative_snapshot is snapshot and not task.cancelled():
+            context.speculative_sql = None
+            context.speculative_snapshot = None
+            self.speculative_counts["used"] += 1
+            logger.info("使用预测性生成的SQL")
+            return await task
+        self.cancel_speculative_sql(context)
+        return await self._generate_sql(question, snapshot)
+    
+    def _record_in_context(self, context: Optional[ChatRequestContext], sql_query: str,
+                           results: List[Dict[str, Any]]) -> None:
+        """把执行的SQL和结果行数记录到请求上下文"""
+        if context is not None:
+            context.sql_query = sql_query
+            context.row_count = len(results)
+    
+    async def _generate_sql(self, question: str, snapshot: SQLDataSnapshot) -> Tuple[str, str, Optional[str]]:
+        """由大模型生成SQL查询
+        
+        大模型的回复会写入响应缓存，但生成的SQL此时还未经执行验证，
+        因此同时返回回复的缓存键，SQL执行失败时由调用方删除该缓存。
+        
+        Returns:
+            (预处理后的问题, SQL查询, 回复的缓存键，SQL不是由大模型生成时为None)
+        """
+        # 预处理问题，提取年份信息和简单分析问题类型
+        processed_question, years = self._preprocess_date_query(question)
+        
+        # 构建只包含相关表结构和示例的系统提示
+        enhanced_prompt = snapshot.prompt_builder.build(question, years)
+        self.prompt_token_total += estimate_tokens(enhanced_prompt)
+        self.prompt_count += 1
+        
+        # 构建消息列表
+        messages = [
+            {"role": "system", "content": enhanced_prompt},
+            {"role": "user", "content": f"请分析并回答以下问题，直接生成最合适的SQL查询：{processed_question}"}
+        ]
+        
+        # 获取SQL查询
+        logger.info("向OpenRouter发送SQL生成请求...")
+        response = await openrouter_service.get_chat_response(
+            messages, model_type="sql", cache_scope=snapshot.fingerprint
+        )
+        if response == OVERLOADED_MESSAGE:
+            # 大模型请求过多被拒绝，直接返回繁忙提示，不再追问或按规则生成
+            raise OverloadedError("SQL生成请求被拒绝")
+        sql_query = self._extract_sql_query(response)
+        cache_key = openrouter_service.cache_key_for(messages, "sql", snapshot.fingerprint)
+        
+        if not sql_query:
+            logger.warning("无法从响应中提取SQL查询，尝试再次请求...")
+            # 提取不到SQL的回复不能留在缓存里，否则相同问题每次都会命中
+            openrouter_service.evict_cached_response(cache_key)
+            # 如果无法提取SQL，尝试明确指示大模型生成SQL
+            clarification_messages = [
+                {"role": "system", "content": enhanced_prompt},
+                {"role": "user", "content": f"请为以下问题生成一个SQL查询。必须返回SQL代码块：{processed_question}"}
+            ]
+            response = await openrouter_service.get_chat_response(
+                clarification_messages, model_type="sql", cache_scope=snapshot.fingerprint
+            )
+            sql_query = self._extract_sql_query(response)
+            cache_key = openrouter_service.cache_key_for(clarification_messages, "sql", snapshot.fingerprint)
+            
+            if not sql_query:
+                # 仍然无法获取SQL，尝试使用简单规则生成基本查询
+                logger.warning("二次尝试仍无法提取SQL，使用简单规则生成查询...")
+                openrouter_service.evict_cached_response(cache_key)
+                cache_key = None
+                sql_query = self._generate_simple_sql(question)
+        
+        # 记录生成的SQL查询
+        logger.info(f"最终SQL查询: {sql_query}")
+        return processed_question, sql_query, cache_key
+    
+    async def _execute_with_repair(self, sql_query: str, processed_question: str, snapshot: SQLDataSnapshot,
+                                   cache_key: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """执行SQL查询，失败时请大模型修复后再执行一次
+        
+        预检或执行失败的SQL对应的大模型回复从响应缓存中删除，只有执行成功的SQL留在缓存里。
+        
+        Args:
+            cache_key: 生成该SQL的大模型回复的缓存键
+        
+        Returns:
+            (实际执行的SQL, 查询结果)
+            
+        Raises:
+            SQLQueryError: 执行失败且无法修复
+        """
+        # 执行SQL查询（在专用线程池中执行，避免阻塞事件循环）
+        try:
+            print(f"尝试执行SQL查询: {sql_query}...")
+            sql_query, results = await sql_executor.run(self._validate_and_execute, sql_query, snapshot)
+            print(f"SQL查询执行成功，返回{len(results)}条记录")
+            return sql_query, results
+        except ExecutorSaturatedError:
+            raise
+        except Exception as sql_error:
+            # SQL执行错误，尝试修复
+            logger.error(f"SQL查询执行错误: {str(sql_error)}")
+            openrouter_service.evict_cached_response(cache_key)
+            fixed_sql, fix_cache_key = await self._attempt_sql_fix(
+                sql_query, str(sql_error), processed_question, snapshot
+            )
+            if not fixed_sql:
+                # 无法修复
+                logger.error("无法修复SQL查询")
+                raise SQLQueryError(str(sql_error)) from sql_error
+        
+        logger.info(f"修复后的SQL: {fixed_sql}")
+        try:
+            sql_query, results = await sql_executor.run(self._validate_and_execute, fixed_sql, snapshot)
+        except ExecutorSaturatedError:
+            raise
+        except Exception:
+            openrouter_service.evict_cached_response(fix_cache_key)
+            raise
+        print(f"修复后的SQL查询执行成功，返回{len(results)}条记录")
+        return sql_query, results
+    
+    def _render_answer(self, question: str, sql_query: str, results: List[Dict[str, Any]]) -> Optional[str]:
+        """简单的计数、平均值和小分组结果直接按模板生成回答，无法生成时返回None"""
+        if not self.answer_renderer:
+            return None
+        rendered = self.answer_renderer.render(question, sql_query, results)
+        if rendered:
+            self.rendered_answer_count += 1
+        return rendered
+            
+    def _answer_from_cube(self, question: str, snapshot: Optional[SQLDataSnapshot] = None) -> Optional[str]:
+        """尝试直接用聚合立方体回答简单统计问题，无法回答时返回None"""
+        cube = (snapshot or self.snapshot).cube
+        if cube is None or self.answer_renderer is None:
+            return None
+        
+        matched = cube.match_question(question)
+        if not matched:
+            return None
+        metric, filters = matched
+        
+        if metric == "count":
+            value = cube.count(**filters)
+            select, column = "COUNT(*) AS count", "count"
+        else:
+            value = cube.average(metric, **filters)
+            select, column = f"AVG({metric}) AS avg_{metric}", f"avg_{metric}"
+            if value is None:
+                return None
+        
+        # 等价的SQL，用于日志和答案渲染
+        conditions = []
+        for dimension, filter_value in filters.items():
+            source = cube.dimension_columns[dimension]
+            conditions.append(f"{source} = 1" if filter_value is True else f"{source} = '{filter_value}'")
+        sql_query = f"SELECT {select} FROM {self.table_name}"
+        if conditions:
+            sql_query += " WHERE " + " AND ".join(conditions)
+        
+        answer = self.answer_renderer.render(question, sql_query, [{column: value}])
+        if answer:
+            self.cube_answer_count += 1
+            logger.info(f"聚合立方体回答: {sql_query} -> {value}")
+        return answer
+    
     def _is_department_stats_query(self, question: str) -> bool:
         """判断是否是部门人数分布统计查询"""
         patterns = [
@@ -476,10 +925,15 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
                 return True
         return False
         
-    async def _handle_department_stats_query(self) -> str:
-        """专门处理部门人数分布查询"""
-        # 检查缓存
-        if self._is_valid_department_stats_cache():
+    async def _handle_department_stats_query(self, snapshot: Optional[SQLDataSnapshot] = None) -> str:
+        """专门处理部门人数分布查询
+        
+        Args:
+            snapshot: 请求开始时固定的数据快照，默认使用当前快照
+        """
+        snapshot = snapshot or self.snapshot
+        # 检查缓存（只使用同一数据版本的缓存）
+        if self._is_valid_department_stats_cache(snapshot.version):
             logger.info("使用部门统计数据缓存")
             return self.department_stats_cache
             
@@ -487,8 +941,8 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
         start_time = time.time()
         
         try:
-            # 从数据库获取部门统计数据
-            dept_data = self._get_department_stats()
+            # 从数据库获取部门统计数据（在专用线程池中执行）
+            dept_data = await sql_executor.run(self._get_department_stats, snapshot)
             
             # 如果没有获取到数据，返回错误信息
             if not dept_data:
@@ -532,8 +986,7 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
                 final_response = self._clean_response(response)
                 
                 # 缓存结果
-                self.department_stats_cache = final_response
-                self.department_stats_cache_expiry = time.time() + self.cache_expiry_seconds
+                self._cache_department_stats(final_response, snapshot)
                 
                 # 记录耗时
                 elapsed_time = time.time() - start_time
@@ -564,8 +1017,7 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
                     manual_response += f" 其他{len(other_depts)}个部门共有{total_other}人，分布相对均匀。每个部门都有其专业特长，共同构成了我们公司完整的组织架构。"
                 
                 # 缓存手动响应
-                self.department_stats_cache = manual_response
-                self.department_stats_cache_expiry = time.time() + self.cache_expiry_seconds
+                self._cache_department_stats(manual_response, snapshot)
                 
                 return manual_response
                 
@@ -573,15 +1025,39 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
             logger.error(f"部门统计查询处理失败: {str(e)}")
             return f"抱歉，获取部门人数分布时出现了问题: {str(e)[:100]}... 请稍后再试。"
             
-    def _is_valid_department_stats_cache(self) -> bool:
-        """检查部门统计数据缓存是否有效"""
+    def _is_valid_department_stats_cache(self, version: Optional[int] = None) -> bool:
+        """检查部门统计数据缓存是否有效（且属于指定的数据版本）"""
         if self.department_stats_cache is None or self.department_stats_cache_expiry is None:
             return False
+        if version is not None and self.department_stats_cache_version != version:
+            return False
             
         return time.time() < self.department_stats_cache_expiry
+    
+    def _cache_department_stats(self, response: str, snapshot: SQLDataSnapshot) -> None:
+        """缓存部门统计回复，旧版本数据生成的回复不缓存"""
+        with self._snapshot_lock:
+            if snapshot is not self.snapshot:
+                return
+            self.department_stats_cache = response
+            self.department_stats_cache_expiry = time.time() + self.cache_expiry_seconds
+            self.department_stats_cache_version = snapshot.version
+        
+    def _get_department_stats(self, snapshot: Optional[SQLDataSnapshot] = None) -> List[Dict[str, Any]]:
+        """获取部门统计数据
+        
+        Args:
+            snapshot: 请求固定的数据快照，默认使用当前快照
+        """
+        snapshot = snapshot or self.snapshot
+        # 优先使用聚合立方体，无需扫描员工明细
+        if snapshot.cube is not None and snapshot.cube.has_dimension("department"):
+            return [
+                {"department": department, "count": count}
+                for department, count in snapshot.cube.rollup(["department"]).items()
+                if department != MISSING_VALUE
+            ]
         
-    def _get_department_stats(self) -> List[Dict[str, Any]]:
-        """获取部门统计数据"""
         departments = {}
         
         # 从Supabase直接获取部门统计数据
@@ -611,19 +1087,21 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
             return result
         except Exception as e:
             logger.error(f"获取部门统计数据失败: {str(e)}")
-            # 使用备用方法 - 直接从内存数据库查询
-            if self.conn:
+            # 使用备用方法 - 直接从本地快照查询
+            if snapshot.pool or snapshot.conn:
                 try:
-                    cursor = self.conn.cursor()
-                    cursor.execute("SELECT department, COUNT(*) as count FROM employees GROUP BY department ORDER BY count DESC")
+                    rows = self._execute_on_snapshot(
+                        "SELECT department, COUNT(*) as count FROM employees GROUP BY department ORDER BY count DESC",
+                        snapshot
+                    )
                     backup_result = []
-                    for row in cursor.fetchall():
-                        if row[0]:  # 确保部门名称不为空
+                    for row in rows:
+                        if row["department"]:  # 确保部门名称不为空
                             backup_result.append({
-                                "department": row[0],
-                                "count": row[1]
+                                "department": row["department"],
+                                "count": row["count"]
                             })
-                            print(f"部门 '{row[0]}' 有 {row[1]} 名员工 (备用查询)")
+                            print(f"部门 '{row['department']}' 有 {row['count']} 名员工 (备用查询)")
                     return backup_result
                 except Exception as backup_error:
                     logger.error(f"备用查询也失败: {str(backup_error)}")
@@ -631,12 +1109,18 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
             # 如果所有查询都失败，返回空列表
             return []
         
-    async def _generate_natural_language_response(self, context: Dict[str, Any]) -> str:
-        """生成自然语言回复"""
+    def _build_answer_prompt(self, context: Dict[str, Any]) -> str:
+        """构建根据查询结果生成回复的提示"""
         question = context["question"]
         sql_query = context["sql_query"]
         results = context["results"]
         
+        # 大结果集只发送摘要和样例，避免把上千行数据发送给大模型
+        results_text = self.result_reducer.format_for_prompt(results)
+        summary_note = ""
+        if results and self.result_reducer.is_large(results):
+            summary_note = "\n7. 查询结果较多，上面提供的是统计摘要和部分样例，请概括性地回答，不要逐条罗列"
+        
         # 构建提示
         prompt = f"""你是HIIC公司内部HR系统的AI助手。我需要你基于SQL查询结果，以自然、友好、对话化的方式回答用户的问题。
 
@@ -644,7 +1128,7 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
 
 执行的SQL查询: {sql_query}
 
-查询结果: {json.dumps(results, ensure_ascii=False)}
+查询结果: {results_text}
 
 请遵循以下要求:
 1. 基于查询结果提供准确信息，不要编造数据
@@ -652,12 +1136,15 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
 3. 不要使用任何Markdown格式（如粗体、斜体、标题、列表符号等）
 4. 不要提及SQL查询本身，只提供答案
 5. 语气要友好专业，像同事之间交谈一样
-6. 如果结果为空，友好地告知未找到相关信息
+6. 如果结果为空，友好地告知未找到相关信息{summary_note}
 """
-
+        return prompt
+    
+    async def _generate_natural_language_response(self, context: Dict[str, Any]) -> str:
+        """生成自然语言回复"""
         # 获取回复
         messages = [
-            {"role": "system", "content": prompt}
+            {"role": "system", "content": self._build_answer_prompt(context)}
         ]
         
         self.api_call_count += 1
@@ -666,46 +1153,14 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
         # 清理回复
         return self._clean_response(response)
     
-    def _enhance_system_prompt(self, question: str, years: list) -> str:
-        """根据问题增强系统提示"""
-        # 基础系统提示
-        enhanced_prompt = self.system_prompt
-        
-        # 分析问题类型，添加针对性提示
-        if "部门" in question and "负责人" in question:
-            enhanced_prompt += "\n\n特别说明：对于部门负责人的查询，你应该查找该部门中职位级别最高的员工。职位级别判断规则：\n"
-            enhanced_prompt += "1. 部长、所长、主任、总监、负责人为最高级别\n"
-            enhanced_prompt += "2. 副部长、副所长、副主任、副总监为第二级别\n"
-            enhanced_prompt += "3. 高级研究员、主管、经理为第三级别\n"
-            enhanced_prompt += "可以使用SQL中的CASE表达式或其他方法来判断职位级别。"
-            enhanced_prompt += "示例: \n```sql\nSELECT name, position, department FROM employees WHERE department LIKE '%大数据平台与信息部%' ORDER BY \n"
-            enhanced_prompt += "CASE \n"
-            enhanced_prompt += "  WHEN position LIKE '%部长%' OR position LIKE '%所长%' OR position LIKE '%主任%' OR position LIKE '%总监%' THEN 1\n"
-            enhanced_prompt += "  WHEN position LIKE '%副部长%' OR position LIKE '%副所长%' OR position LIKE '%副主任%' THEN 2\n"
-            enhanced_prompt += "  ELSE 3\n"
-            enhanced_prompt += "END\n```"
-        
-        # 添加年份处理提示
-        if years:
-            enhanced_prompt += f"\n\n特别提示：用户问题中提到了年份 {', '.join(years)}。"
-            if "入职" in question or "加入" in question:
-                enhanced_prompt += f"\n对于入职年份的查询，请使用: SUBSTR(hire_date, 1, 4) = '{years[0]}'"
-                enhanced_prompt += f"\n或者: hire_date LIKE '{years[0]}%'"
-                enhanced_prompt += f"\n如果需要检查工作经验表，可能需要: SUBSTR(first_work_date, 1, 4) = '{years[0]}'"
-        
-        # 添加部门统计提示
-        if "部门" in question and ("人数" in question or "多少人" in question):
-            enhanced_prompt += "\n\n部门人数统计查询示例:\n"
-            enhanced_prompt += "```sql\nSELECT department, COUNT(*) as count FROM employees GROUP BY department ORDER BY count DESC\n```"
-        
-        # 确保实体名称映射正确
-        if "大数据" in question:
-            enhanced_prompt += "\n注意：'大数据部'的正式名称是'大数据平台与信息部'。"
-        
-        return enhanced_prompt
-        
-    async def _attempt_sql_fix(self, sql_query: str, error_message: str, original_question: str) -> Optional[str]:
-        """尝试修复错误的SQL查询"""
+    async def _attempt_sql_fix(self, sql_query: str, error_message: str, original_question: str,
+                               snapshot: Optional[SQLDataSnapshot] = None) -> Tuple[Optional[str], Optional[str]]:
+        """尝试修复错误的SQL查询
+        
+        Returns:
+            (修复后的SQL，无法修复时为None, 修复回复的缓存键)
+        """
+        snapshot = snapshot or self.snapshot
         try:
             # 构建提示以修复SQL
             fix_prompt = f"""你是SQL修复专家。原始SQL查询执行失败，请修复它。
@@ -720,7 +1175,7 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
 用户原始问题: {original_question}
 
 数据库模式:
-{json.dumps(self.db_schema, ensure_ascii=False, indent=2)}
+{json.dumps(snapshot.db_schema, ensure_ascii=False, indent=2)}
 
 请提供修复后的SQL查询，只返回修复后的SQL查询代码，不要解释。
 """
@@ -732,7 +1187,10 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
             ]
             
             # 获取修复后的SQL
-            fixed_sql_response = await openrouter_service.get_chat_response(messages)
+            fixed_sql_response = await openrouter_service.get_chat_response(
+                messages, model_type="sql", cache_scope=snapshot.fingerprint
+            )
+            cache_key = openrouter_service.cache_key_for(messages, "sql", snapshot.fingerprint)
             fixed_sql = self._extract_sql_query(fixed_sql_response)
             
             # 如果无法提取SQL，尝试全文使用
@@ -743,10 +1201,12 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
                 if "SELECT" in cleaned_response.upper():
                     fixed_sql = cleaned_response.strip()
             
-            return fixed_sql
+            if not fixed_sql:
+                openrouter_service.evict_cached_response(cache_key)
+            return fixed_sql, cache_key
         except Exception as e:
             logger.error(f"尝试修复SQL失败: {str(e)}")
-            return None
+            return None, None
     
     def _generate_simple_sql(self, question: str) -> str:
         """生成简单的SQL查询"""
@@ -803,8 +1263,28 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
         
         return None
     
-    def _execute_sql_query(self, sql_query: str) -> List[Dict[str, Any]]:
+    def _validate_and_execute(self, sql_query: str,
+                              snapshot: Optional[SQLDataSnapshot] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """先在本地预检（并修复）SQL，再执行，返回实际执行的SQL和结果
+        
+        预检无法修复的错误以SQLValidationError抛出，错误信息来自EXPLAIN，供大模型修复时参考
+        """
+        snapshot = snapshot or self.snapshot
+        if snapshot.sql_validator is not None and snapshot.pool is not None:
+            with snapshot.pool.connection() as conn:
+                sql_query = snapshot.sql_validator.preflight(conn, sql_query)
+        return sql_query, self._execute_sql_query(sql_query, snapshot)
+    
+    def _execute_sql_query(self, sql_query: str, snapshot: Optional[SQLDataSnapshot] = None) -> List[Dict[str, Any]]:
         """执行SQL查询"""
+        snapshot = snapshot or self.snapshot
+        
+        # 优先在本地快照上执行，SQL错误直接抛出，交由调用方尝试修复
+        if snapshot.pool is not None:
+            results = self._execute_on_snapshot(sql_query, snapshot)
+            print(f"SQL查询在本地快照上执行成功，返回{len(results)}条记录")
+            return results
+        
         try:
             # 使用Supabase客户端执行SQL查询
             result = supabase_client.execute_sql(sql_query)
@@ -824,6 +1304,63 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
             print(f"错误详情: {error_trace}")
             return [{'error': str(e), 'message': '查询执行失败，无法提供准确数据。'}]
     
+    def _execute_on_snapshot(self, sql_query: str, snapshot: Optional[SQLDataSnapshot] = None) -> List[Dict[str, Any]]:
+        """借出一个只读连接执行查询，超过超时时间的查询会被中断"""
+        snapshot = snapshot or self.snapshot
+        if snapshot.pool is None:
+            # 连接池不可用时退回到单个内存连接，同一时间只允许一个线程使用
+            with snapshot.conn_lock:
+                cursor = snapshot.conn.cursor()
+                cursor.execute(sql_query.strip().rstrip(';'))
+                columns = [desc[0] for desc in cursor.description or []]
+                return [dict(zip(columns, row)) for row in cursor.fetchmany(self.max_rows)]
+        
+        with snapshot.pool.connection() as conn:
+            start_time = time.time()
+            deadline = start_time + self.timeout
+            conn.set_progress_handler(lambda: 1 if time.time() > deadline else 0, 10000)
+            try:
+                cursor = conn.execute(sql_query.strip().rstrip(';'))
+                columns = [desc[0] for desc in cursor.description or []]
+                rows = cursor.fetchmany(self.max_rows)
+            finally:
+                conn.set_progress_handler(None, 0)
+            # 在执行该查询的只读连接上抽样记录执行计划
+            self._observe_query_plan(sql_query, conn, (time.time() - start_time) * 1000)
+        
+        return [dict(zip(columns, row)) for row in rows]
+    
+    def _observe_query_plan(self, sql_query: str, conn: sqlite3.Connection, elapsed_ms: float) -> None:
+        """抽样将查询交给索引顾问记录执行计划，索引由后台维护任务创建"""
+        if self.index_advisor is None or not self.index_advisor.should_sample(elapsed_ms):
+            return
+        
+        try:
+            signature = self.index_advisor.observe(conn, sql_query)
+            if signature:
+                logger.info(f"索引顾问：谓词{', '.join(signature)}已加入待建索引")
+        except Exception as e:
+            logger.warning(f"索引顾问记录执行计划失败: {str(e)}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取SQL服务的运行统计"""
+        return {
+            "data": self.snapshot.info(),
+            "retired_snapshots": len(self._retired_snapshots),
+            "query_count": self.query_count,
+            "cache_hit_count": self.cache_hit_count,
+            "api_call_count": self.api_call_count,
+            "avg_sql_prompt_tokens": round(self.prompt_token_total / self.prompt_count, 1) if self.prompt_count else 0,
+            "rendered_answer_count": self.rendered_answer_count,
+            "cube_answer_count": self.cube_answer_count,
+            "speculative_sql": dict(self.speculative_counts),
+            "cube": self.cube.stats() if self.cube else None,
+            "connection_pool": self.pool.stats() if self.pool else None,
+            "executor": sql_executor.stats(),
+            "sql_validator": self.sql_validator.stats() if self.sql_validator else None,
+            "index_advisor": self.index_advisor.report() if self.index_advisor else None
+        }
+    
     def _clean_response(self, response: str) -> str:
         """清理回复中的SQL查询和代码块"""
         if not response:
@@ -847,16 +1384,7 @@ SQL查询: SELECT department, COUNT(*) as count FROM employees GROUP BY departme
             response = re.sub(pattern, "", response, flags=re.IGNORECASE)
         
         # 移除常见的SQL查询说明语句
-        sql_intros = [
-            r"我将使用以下SQL查询[^:：]*[:：]",
-            r"以下是(我的|用于解答的)?SQL查询[:：]",
-            r"(首先|让我)(使用|执行|运行)SQL查询[:：]",
-            r"(我(将|要|准备)(执行|运行|使用).*查询|查询数据库)[^:：]*[:：]",
-            r"根据SQL查询结果[^:：]*[:：]",
-            r"SQL查询结果[^:：]*[:：]"
-        ]
-        
-        for intro in sql_intros:
+        for intro in SQL_INTRO_PATTERNS:
             response = re.sub(intro, "", response, flags=re.IGNORECASE)
         
         # 移除Markdown格式
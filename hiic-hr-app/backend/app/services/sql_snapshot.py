@@ -0,0 +1,119 @@
+"""
+SQL数据快照模块，把一个版本的数据及其派生结构打包，便于整体构建和原子替换
+"""
+
+import time
+import hashlib
+import threading
+import sqlite3
+import logging
+import pandas as pd
+from typing import Dict, Any, Optional
+from app.db.sqlite_pool import SQLiteSnapshotPool
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+
+class SQLDataSnapshot:
+    """SQL服务某一版本的数据
+
+    包括员工数据、数据库连接（只读连接池）、表结构，以及由数据派生的聚合立方体、
+    提示构建器和SQL预检器。新版本在后台完整构建后一次性替换当前版本，
+    正在处理的请求持有旧版本的引用，直到处理结束都使用同一版本的数据。
+    """
+
+    def __init__(self, version: int = 0, df: Optional[pd.DataFrame] = None,
+                 conn: Optional[sqlite3.Connection] = None, pool: Optional[SQLiteSnapshotPool] = None,
+                 db_schema: Optional[Dict[str, Any]] = None, cube: Any = None,
+                 prompt_builder: Any = None, sql_validator: Any = None, source: Optional[str] = None):
+        """初始化数据快照
+
+        Args:
+            version: 数据版本号，每次重新加载加1
+            df: 员工数据
+            conn: 可写连接（有连接池时为连接池的可写连接）
+            pool: 只读连接池
+            db_schema: 数据库表结构
+            cube: 聚合立方体
+            prompt_builder: SQL生成提示构建器
+            sql_validator: SQL预检器
+            source: 员工数据来源（supabase或sample示例数据）
+        """
+        self.version = version
+        self.df = df if df is not None else pd.DataFrame()
+        self.conn = conn
+        # 没有连接池时多个线程共用conn，访问前需持有该锁
+        self.conn_lock = threading.Lock()
+        self.pool = pool
+        self.db_schema = db_schema or {}
+        self.cube = cube
+        self.prompt_builder = prompt_builder
+        self.sql_validator = sql_validator
+        self.source = source
+        self.loaded_at = time.time()
+        self.closed = False
+        # 正在使用本快照的请求数，请求开始时获取、结束时释放，归零前不能关闭
+        self._refs = 0
+        self._refs_lock = threading.Lock()
+        # 数据内容指纹，内容不变时跨进程重启保持一致，用于限定大模型响应缓存的作用范围
+        self.fingerprint = self._fingerprint()
+
+    def _fingerprint(self) -> str:
+        """计算员工数据的内容指纹，无法计算时退回到版本号"""
+        try:
+            digest = hashlib.sha256(",".join(map(str, self.df.columns)).encode("utf-8"))
+            digest.update(pd.util.hash_pandas_object(self.df, index=False).values.tobytes())
+            return digest.hexdigest()[:16]
+        except Exception as e:
+            logger.warning(f"计算数据快照v{self.version}指纹失败: {str(e)}")
+            return f"v{self.version}"
+
+    def acquire(self) -> "SQLDataSnapshot":
+        """请求开始使用本快照"""
+        with self._refs_lock:
+            self._refs += 1
+        return self
+
+    def release(self) -> None:
+        """请求结束使用本快照"""
+        with self._refs_lock:
+            self._refs = max(0, self._refs - 1)
+
+    @property
+    def refs(self) -> int:
+        """正在使用本快照的请求数"""
+        with self._refs_lock:
+            return self._refs
+
+    def in_use(self) -> int:
+        """正在使用中的只读连接数"""
+        if self.pool is None:
+            return 0
+        return self.pool.stats()["in_use"]
+
+    def info(self) -> Dict[str, Any]:
+        """返回快照的基本信息"""
+        return {
+            "version": self.version,
+            "rows": len(self.df),
+            "fingerprint": self.fingerprint,
+            "source": self.source,
+            "requests": self.refs,
+            "loaded_at": self.loaded_at,
+            "snapshot_path": self.pool.path if self.pool else None
+        }
+
+    def close(self) -> None:
+        """释放连接池和数据库连接"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.pool is not None:
+                self.pool.close()
+            elif self.conn is not None:
+                with self.conn_lock:
+                    self.conn.close()
+        except Exception as e:
+            logger.warning(f"关闭数据快照v{self.version}失败: {str(e)}")
@@ -0,0 +1,299 @@
+"""
+SQL预检模块，执行前用EXPLAIN在本地目录上检查SQL，并在本地修复常见错误
+"""
+
+import re
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+
+class SQLValidationError(Exception):
+    """SQL预检失败且无法在本地修复"""
+
+
+# 列名别名：错误列名 -> 候选的实际列名（按顺序取第一个存在的列）
+COLUMN_ALIASES = {
+    "education": ["education_level", "education"],
+    "education_level": ["education", "education_level"],
+    "edu": ["education_level", "education"],
+    "edu_level": ["education_level", "education"],
+    "degree_level": ["education_level", "education"],
+    "dept": ["department"],
+    "dept_name": ["department"],
+    "department_name": ["department"],
+    "title": ["position"],
+    "job_title": ["position"],
+    "job": ["position"],
+    "school": ["university"],
+    "college": ["university"],
+    "graduate_school": ["university"],
+    "sex": ["gender"],
+    "employee_name": ["name"],
+    "emp_name": ["name"],
+    "full_name": ["name"],
+    "entry_date": ["hire_date"],
+    "join_date": ["hire_date"],
+    "onboard_date": ["hire_date"],
+    "hiredate": ["hire_date"],
+    "birthday": ["birth_date"],
+    "date_of_birth": ["birth_date"],
+    "birthdate": ["birth_date"],
+    "work_years": ["total_work_years"],
+    "years_of_experience": ["total_work_years"],
+    "tenure": ["company_years"],
+    "nation": ["ethnicity"],
+}
+
+# 中文列名 -> 候选的实际列名
+CHINESE_COLUMN_NAMES = {
+    "姓名": ["name"],
+    "名字": ["name"],
+    "员工姓名": ["name"],
+    "性别": ["gender"],
+    "年龄": ["age"],
+    "部门": ["department"],
+    "部门名称": ["department"],
+    "职位": ["position"],
+    "岗位": ["position"],
+    "职务": ["position"],
+    "学历": ["education_level", "education"],
+    "学位": ["degree"],
+    "毕业院校": ["university"],
+    "院校": ["university"],
+    "学校": ["university"],
+    "专业": ["major"],
+    "入职日期": ["hire_date"],
+    "入职时间": ["hire_date"],
+    "出生日期": ["birth_date"],
+    "工作年限": ["total_work_years"],
+    "工龄": ["total_work_years"],
+    "司龄": ["company_years"],
+    "民族": ["ethnicity"],
+    "团队": ["team"],
+    "处室": ["section"],
+    "序列": ["sequence"],
+}
+
+# 表名别名
+TABLE_ALIASES = {
+    "employee": "employees",
+    "employee_info": "employees",
+    "employees_info": "employees",
+    "staff": "employees",
+    "hr_data": "employees",
+    "hr_employees": "employees",
+    "员工": "employees",
+    "员工表": "employees",
+    "员工信息表": "employees",
+}
+
+# 全角标点 -> 半角
+FULL_WIDTH_PUNCTUATION = {
+    "，": ",",
+    "（": "(",
+    "）": ")",
+    "；": ";",
+    "＝": "=",
+    "＞": ">",
+    "＜": "<",
+    "＊": "*",
+    "　": " ",
+}
+FULL_WIDTH_QUOTES = {"‘": "'", "’": "'", "“": "'", "”": "'"}
+
+# 字符串字面量
+LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+NO_SUCH_COLUMN_PATTERN = re.compile(r"no such column:\s*(?:(\w+)\.)?(\w+)", re.IGNORECASE)
+NO_SUCH_TABLE_PATTERN = re.compile(r"no such table:\s*(?:\w+\.)?(\w+)", re.IGNORECASE)
+SYNTAX_ERROR_PATTERN = re.compile(r"syntax error|unrecognized token|incomplete input|one statement at a time",
+                                  re.IGNORECASE)
+
+
+def load_catalog(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    """读取数据库中所有表及其列名"""
+    catalog: Dict[str, List[str]] = {}
+    tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    for (table_name,) in tables:
+        if table_name.startswith("sqlite_"):
+            continue
+        columns = conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+        catalog[table_name] = [col[1] for col in columns]
+    return catalog
+
+
+class SQLValidator:
+    """SQL预检器
+
+    在只读连接上对SQL执行EXPLAIN（只编译不执行），捕获未知列、未知表和语法错误；
+    对列名别名、中文列名、表名别名、全角标点和多余分号等常见问题在本地修复后重新检查，
+    只有本地无法修复的错误才交给大模型处理。
+    """
+
+    def __init__(self, catalog: Dict[str, List[str]], max_repairs: int = 5):
+        """初始化预检器
+
+        Args:
+            catalog: 表名 -> 列名列表
+            max_repairs: 单条SQL最多尝试的本地修复次数
+        """
+        self.catalog = catalog
+        self.max_repairs = max_repairs
+        # 小写列名 -> 实际列名
+        self._columns = {col.lower(): col for columns in catalog.values() for col in columns}
+
+        # 统计信息
+        self.checked = 0
+        self.passed = 0
+        self.repaired = 0
+        self.rejected = 0
+        self.repair_kinds: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def preflight(self, conn: sqlite3.Connection, sql: str) -> str:
+        """检查SQL，必要时在本地修复
+
+        Args:
+            conn: 只读数据库连接
+            sql: 待检查的SQL
+
+        Returns:
+            可以执行的SQL（可能是修复后的版本）
+
+        Raises:
+            SQLValidationError: SQL有错误且无法在本地修复
+        """
+        current = self._strip_statement(sql)
+        applied: List[str] = []
+        error = self._explain(conn, current)
+
+        while error and len(applied) < self.max_repairs:
+            repair = self._repair(current, error)
+            if repair is None:
+                break
+            kind, repaired_sql = repair
+            if repaired_sql == current:
+                break
+            applied.append(kind)
+            current = repaired_sql
+            error = self._explain(conn, current)
+
+        with self._lock:
+            self.checked += 1
+            if error:
+                self.rejected += 1
+            elif applied:
+                self.repaired += 1
+                for kind in applied:
+                    self.repair_kinds[kind] = self.repair_kinds.get(kind, 0) + 1
+            else:
+                self.passed += 1
+
+        if error:
+            raise SQLValidationError(error)
+        if applied:
+            logger.info(f"SQL预检已在本地修复（{', '.join(applied)}）: {current}")
+        return current
+
+    def stats(self) -> Dict[str, Any]:
+        """返回预检统计信息"""
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "passed": self.passed,
+                "repaired": self.repaired,
+                "rejected": self.rejected,
+                "repair_kinds": dict(self.repair_kinds)
+            }
+
+    def _explain(self, conn: sqlite3.Connection, sql: str) -> Optional[str]:
+        """用EXPLAIN编译SQL，返回错误信息，没有错误时返回None"""
+        try:
+            conn.execute(f"EXPLAIN {sql}")
+            return None
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            return str(e)
+
+    def _repair(self, sql: str, error: str) -> Optional[Tuple[str, str]]:
+        """根据错误信息尝试一次本地修复，返回(修复类型, 修复后的SQL)"""
+        if (SYNTAX_ERROR_PATTERN.search(error) or any(quote in error for quote in FULL_WIDTH_QUOTES)
+                or any(mark in error for mark in FULL_WIDTH_PUNCTUATION)):
+            # 语法错误多由全角标点或全角引号引起（全角引号包裹的值会被当成列名，
+            # 紧挨标识符的全角标点会被SQLite当成标识符的一部分）
+            normalized = self._normalize_punctuation(sql)
+            if normalized != sql:
+                return "punctuation", normalized
+
+        match = NO_SUCH_COLUMN_PATTERN.search(error)
+        if match:
+            qualifier, column = match.group(1), match.group(2)
+            target = self._resolve_column(column)
+            if target is None:
+                return None
+            return "column_alias", self._replace_identifier(sql, column, target, qualifier)
+
+        match = NO_SUCH_TABLE_PATTERN.search(error)
+        if match:
+            table = match.group(1)
+            target = TABLE_ALIASES.get(table.lower()) or TABLE_ALIASES.get(table)
+            if target is None or target not in self.catalog:
+                return None
+            return "table_alias", self._replace_identifier(sql, table, target)
+
+        return None
+
+    def _resolve_column(self, column: str) -> Optional[str]:
+        """把错误的列名映射到实际存在的列"""
+        candidates = COLUMN_ALIASES.get(column.lower()) or CHINESE_COLUMN_NAMES.get(column) or [column]
+        for candidate in candidates:
+            actual = self._columns.get(candidate.lower())
+            if actual and actual != column:
+                return actual
+        return None
+
+    def _identifier_pattern(self, name: str) -> str:
+        """标识符匹配模式（可带引号，不匹配更长标识符的一部分）"""
+        return r'(?<![\w.])(["`\[]?)' + re.escape(name) + r'(["`\]]?)(?!\w)'
+
+    def _replace_identifier(self, sql: str, old: str, new: str, qualifier: Optional[str] = None) -> str:
+        """替换字符串字面量之外的标识符"""
+        if qualifier:
+            pattern = re.compile(r"(?<![\w.])" + re.escape(qualifier) + r"\." + re.escape(old) + r"(?!\w)")
+            replacement = f"{qualifier}.{new}"
+        else:
+            pattern = re.compile(self._identifier_pattern(old))
+            replacement = new
+        return self._map_outside_literals(sql, lambda part: pattern.sub(replacement, part))
+
+    def _normalize_punctuation(self, sql: str) -> str:
+        """把全角引号和字面量之外的全角标点替换为半角"""
+        for full, half in FULL_WIDTH_QUOTES.items():
+            sql = sql.replace(full, half)
+
+        def normalize(part: str) -> str:
+            for full, half in FULL_WIDTH_PUNCTUATION.items():
+                part = part.replace(full, half)
+            return part
+
+        return self._strip_statement(self._map_outside_literals(sql, normalize))
+
+    def _strip_statement(self, sql: str) -> str:
+        """去除首尾空白、代码块标记和末尾的分号"""
+        sql = sql.strip()
+        sql = re.sub(r"^```(?:sql)?\s*|\s*```$", "", sql, flags=re.IGNORECASE)
+        return sql.strip().rstrip(";").strip()
+
+    def _map_outside_literals(self, sql: str, func) -> str:
+        """只对字符串字面量之外的部分应用转换"""
+        parts = []
+        position = 0
+        for match in LITERAL_PATTERN.finditer(sql):
+            parts.append(func(sql[position:match.start()]))
+            parts.append(match.group(0))
+            position = match.end()
+        parts.append(func(sql[position:]))
+        return "".join(parts)
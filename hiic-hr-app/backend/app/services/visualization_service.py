@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 from typing import Dict, List, Any, Tuple, Optional
 from app.db.supabase import supabase_client
+from app.services.hr_cube import HRAggregateCube, MISSING_VALUE
 import re
 
 class VisualizationService:
@@ -9,13 +10,24 @@ class VisualizationService:
     
     def __init__(self):
         """初始化可视化服务"""
+        self.refresh_data()
+    
+    def refresh_data(self) -> None:
+        """加载HR数据并构建派生数据，全部完成后一次性替换当前数据"""
         # 加载HR数据
-        self.df_employees = self._load_employees_data()
-        self.df_education = self._load_education_data()
-        self.df_work_experience = self._load_work_experience_data()
+        df_employees = self._load_employees_data()
+        df_education = self._load_education_data()
+        df_work_experience = self._load_work_experience_data()
         
         # 合并数据
-        self._merge_data()
+        df = self._merge_data(df_employees, df_education, df_work_experience)
+        
+        # 按员工明细预先聚合的立方体（合并后的数据可能一人多行，因此基于员工表构建）
+        cube = HRAggregateCube(df_employees)
+        
+        self.df_employees, self.df_education, self.df_work_experience, self.df, self.cube = (
+            df_employees, df_education, df_work_experience, df, cube
+        )
     
     def _load_employees_data(self) -> pd.DataFrame:
         """加载员工数据"""
@@ -53,51 +65,57 @@ class VisualizationService:
             print(f"加载工作经验数据失败: {str(e)}")
             return pd.DataFrame()
     
-    def _merge_data(self):
+    def _merge_data(self, df_employees: pd.DataFrame, df_education: pd.DataFrame,
+                    df_work_experience: pd.DataFrame) -> pd.DataFrame:
         """合并所有数据"""
         # 创建合并后的数据框
-        self.df = self.df_employees.copy()
+        df = df_employees.copy()
         
         # 如果教育数据存在，合并到主数据框
-        if not self.df_education.empty and 'employee_id' in self.df_education.columns:
+        if not df_education.empty and 'employee_id' in df_education.columns:
             # 确保employee_id列类型一致
-            self.df_education['employee_id'] = self.df_education['employee_id'].astype(str)
-            self.df['id'] = self.df['id'].astype(str)
+            df_education['employee_id'] = df_education['employee_id'].astype(str)
+            df['id'] = df['id'].astype(str)
             
             # 左连接教育数据
-            self.df = pd.merge(
-                self.df, 
-                self.df_education, 
+            df = pd.merge(
+                df, 
+                df_education, 
                 left_on='id', 
                 right_on='employee_id', 
                 how='left',
                 suffixes=('', '_edu')
             )
-            print(f"合并教育数据后的列: {list(self.df.columns)}")
+            print(f"合并教育数据后的列: {list(df.columns)}")
         
         # 如果工作经验数据存在，合并到主数据框
-        if not self.df_work_experience.empty and 'employee_id' in self.df_work_experience.columns:
+        if not df_work_experience.empty and 'employee_id' in df_work_experience.columns:
             # 确保employee_id列类型一致
-            self.df_work_experience['employee_id'] = self.df_work_experience['employee_id'].astype(str)
+            df_work_experience['employee_id'] = df_work_experience['employee_id'].astype(str)
             
             # 左连接工作经验数据
-            self.df = pd.merge(
-                self.df, 
-                self.df_work_experience, 
+            df = pd.merge(
+                df, 
+                df_work_experience, 
                 left_on='id', 
                 right_on='employee_id', 
                 how='left',
                 suffixes=('', '_work')
             )
-            print(f"合并工作经验数据后的列: {list(self.df.columns)}")
+            print(f"合并工作经验数据后的列: {list(df.columns)}")
+        
+        return df
     
     def department_distribution(self) -> Dict[str, Any]:
         """部门人员分布可视化数据"""
         if self.df.empty or 'department' not in self.df.columns:
             return {"error": "无法获取部门数据"}
         
-        # 获取部门分布
-        dept_counts = self.df['department'].value_counts()
+        # 获取部门分布（从聚合立方体上卷，不统计缺失值）
+        if self.cube.has_dimension('department'):
+            dept_counts = pd.Series(self.cube.rollup(['department'])).drop(MISSING_VALUE, errors='ignore')
+        else:
+            dept_counts = self.df['department'].value_counts()
         
         # 计算部门统计信息
         dept_stats = {
@@ -125,8 +143,11 @@ class VisualizationService:
         if self.df.empty or 'gender' not in self.df.columns:
             return {"error": "无法获取性别数据"}
         
-        # 获取性别分布
-        gender_counts = self.df['gender'].value_counts()
+        # 获取性别分布（从聚合立方体上卷，不统计缺失值）
+        if self.cube.has_dimension('gender'):
+            gender_counts = pd.Series(self.cube.rollup(['gender'])).drop(MISSING_VALUE, errors='ignore')
+        else:
+            gender_counts = self.df['gender'].value_counts()
         total = gender_counts.sum()
         
         # 计算性别比例
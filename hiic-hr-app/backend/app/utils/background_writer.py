@@ -0,0 +1,155 @@
+"""
+后台批量写文件模块，把追加写和快照写从请求路径移到后台线程
+"""
+
+import os
+import json
+import atexit
+import logging
+import threading
+from typing import Any, Callable, Dict, List
+
+# 配置日志记录器
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriter:
+    """后台批量写入器
+
+    追加的记录先放在内存中，由后台线程定期批量写入JSONL文件；
+    快照只记录数据提供函数，刷新时取最新数据写入临时文件再原子替换，同一文件多次请求只写一次。
+    """
+
+    def __init__(self, name: str, flush_interval: float = 5.0, max_pending: int = 1000):
+        """初始化写入器
+
+        Args:
+            name: 名称，用于后台线程名和日志
+            flush_interval: 刷新间隔（秒）
+            max_pending: 待写记录达到该数量时提前刷新
+        """
+        self.name = name
+        self.flush_interval = flush_interval
+        self.max_pending = max(1, max_pending)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        # 文件路径 -> 待追加的行
+        self._appends: Dict[str, List[str]] = {}
+        # 文件路径 -> 快照数据提供函数
+        self._snapshots: Dict[str, Callable[[], Any]] = {}
+        self._pending = 0
+
+        # 统计信息
+        self.lines_written = 0
+        self.snapshots_written = 0
+        self.flushes = 0
+        self.errors = 0
+        atexit.register(self.stop)
+
+    def append(self, path: str, record: Dict[str, Any]) -> None:
+        """追加一条JSONL记录"""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._appends.setdefault(path, []).append(line)
+            self._pending += 1
+            pending = self._pending
+        if self._stopped:
+            # 已停止（如进程退出时）没有后台线程，直接写入
+            self.flush()
+            return
+        self._ensure_started()
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def snapshot(self, path: str, supplier: Callable[[], Any]) -> None:
+        """请求在下次刷新时写入文件快照
+
+        Args:
+            path: 文件路径
+            supplier: 返回可JSON序列化数据的函数，在后台线程中调用
+        """
+        with self._lock:
+            self._snapshots[path] = supplier
+        if self._stopped:
+            self.flush()
+            return
+        self._ensure_started()
+
+    def flush(self) -> None:
+        """立即写入所有待写数据"""
+        with self._flush_lock:
+            with self._lock:
+                appends, self._appends = self._appends, {}
+                snapshots, self._snapshots = self._snapshots, {}
+                self._pending = 0
+            if not appends and not snapshots:
+                return
+
+            for path, lines in appends.items():
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.writelines(lines)
+                    self.lines_written += len(lines)
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"{self.name}: 追加写入{path}失败: {str(e)}")
+
+            for path, supplier in snapshots.items():
+                try:
+                    self._write_atomic(path, supplier())
+                    self.snapshots_written += 1
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"{self.name}: 写入快照{path}失败: {str(e)}")
+            self.flushes += 1
+
+    def stop(self) -> None:
+        """停止后台线程并写入剩余数据"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回写入统计信息"""
+        with self._lock:
+            pending_snapshots = len(self._snapshots)
+            pending = self._pending
+        return {
+            "flush_interval": self.flush_interval,
+            "pending_lines": pending,
+            "pending_snapshots": pending_snapshots,
+            "lines_written": self.lines_written,
+            "snapshots_written": self.snapshots_written,
+            "flushes": self.flushes,
+            "errors": self.errors
+        }
+
+    def _ensure_started(self) -> None:
+        """首次有数据时启动后台线程"""
+        if self._thread is not None or self._stopped:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        """后台线程：定期或待写记录过多时刷新"""
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _write_atomic(self, path: str, data: Any) -> None:
+        """写入临时文件后原子替换，避免读到写了一半的文件"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
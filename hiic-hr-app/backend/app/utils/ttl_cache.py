@@ -0,0 +1,102 @@
+"""
+带过期时间的有界LRU缓存
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class TTLCache:
+    """有界LRU缓存，条目超过存活时间后失效
+
+    条目数超过上限时淘汰最久未访问的条目，过期时间使用墙上时间，便于持久化后恢复。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        """初始化缓存
+
+        Args:
+            max_entries: 最多保存的条目数
+            ttl_seconds: 条目存活时间（秒），小于等于0表示不过期
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # 键 -> (值, 过期时间戳)，按访问顺序排列，最近访问的在末尾
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中或已过期时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None) -> None:
+        """写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            expires_at: 过期时间戳，默认按存活时间计算（从持久化文件恢复时传入原过期时间）
+        """
+        if expires_at is None:
+            expires_at = time.time() + self.ttl_seconds if self.ttl_seconds > 0 else float("inf")
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        """删除条目"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def items(self) -> List[Tuple[str, Any, float]]:
+        """返回未过期的(键, 值, 过期时间戳)，从最久未访问到最近访问"""
+        now = time.time()
+        with self._lock:
+            return [(key, value, expires_at) for key, (value, expires_at) in self._entries.items()
+                    if expires_at > now]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,313 @@
+"""
+OpenRouter模拟服务，实现/chat/completions接口，用于离线压测和性能实验
+
+按请求内容识别问题分类、SQL生成、SQL修复和结果润色等提示，返回确定的回复；
+支持配置延迟分布、慢请求比例、错误率、限流（429）比例、流式输出以及脚本化回复。
+
+用法:
+    python scripts/openrouter_stub.py --port 8100 --latency lognormal:800:0.6 --error-rate 0.02
+    然后设置 OPENROUTER_API_URL=http://127.0.0.1:8100/api/v1/chat/completions 启动后端
+
+脚本化回复文件（--script）为JSON数组，按顺序匹配，第一个命中的规则生效:
+    [
+        {"kind": "sql", "pattern": "平均年龄", "content": "```sql\\nSELECT AVG(age) AS avg_age FROM employees\\n```"},
+        {"pattern": "你好", "content": "你好，我是HR助手。"}
+    ]
+    kind可选（classifier/sql/sql_fix/answer/chat），pattern为匹配最后一条消息的正则表达式。
+"""
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import Dict, List, Any, Optional, AsyncIterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 问题分类的关键词（与分类器的快速路径大致一致）
+CLASSIFIER_RULES = [
+    ("VISUALIZATION", ["图表", "可视化", "饼图", "柱状图", "折线图", "画"]),
+    ("DATA_ANALYSIS", ["分析", "趋势", "预测", "对比", "建议"]),
+    ("SQL_QUERY", ["多少", "几个", "哪些", "谁", "列出", "统计", "平均", "人数", "名单"]),
+]
+
+# SQL生成的模板，按问题关键词选择；{department}按提示中的表结构替换为实际的部门列，
+# 保证在真实数据和示例数据的本地SQLite快照上都可以执行
+SQL_RULES = [
+    (["部门"], "SELECT {department}, COUNT(*) AS count FROM employees GROUP BY {department} ORDER BY count DESC"),
+    (["平均年龄", "年龄"], "SELECT AVG(age) AS avg_age FROM employees"),
+    (["男"], "SELECT COUNT(*) AS count FROM employees WHERE gender = '男'"),
+    (["女"], "SELECT COUNT(*) AS count FROM employees WHERE gender = '女'"),
+    (["学历"], "SELECT education, COUNT(*) AS count FROM employees GROUP BY education ORDER BY count DESC"),
+    (["名单", "列出", "哪些"], "SELECT name, {department} FROM employees LIMIT 20"),
+]
+DEFAULT_SQL = "SELECT COUNT(*) AS count FROM employees"
+# 提示中的表结构：SQL生成提示为"- 列名: 类型 - 说明"，SQL修复提示为JSON中的"name": "列名"
+SCHEMA_COLUMN_PATTERN = re.compile(r'^- (\w+): |"name": "(\w+)"', re.MULTILINE)
+# 真实数据（hr_data）的部门列为department，示例数据为department_id
+DEPARTMENT_COLUMNS = ["department", "department_id"]
+
+
+class LatencyModel:
+    """延迟分布
+
+    fixed:MS、uniform:MIN_MS:MAX_MS 或 lognormal:MEDIAN_MS:SIGMA，
+    另外按slow_rate的比例额外增加slow_ms，用于模拟长尾。
+    """
+
+    def __init__(self, spec: str, slow_rate: float, slow_ms: float, rng: random.Random):
+        parts = spec.split(":")
+        self.kind = parts[0]
+        self.params = [float(value) for value in parts[1:]]
+        if self.kind not in ("fixed", "uniform", "lognormal") or not self.params:
+            raise ValueError(f"无效的延迟分布: {spec}")
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.rng = rng
+
+    def sample(self) -> float:
+        """返回一次请求的延迟（秒）"""
+        if self.kind == "fixed":
+            latency_ms = self.params[0]
+        elif self.kind == "uniform":
+            latency_ms = self.rng.uniform(self.params[0], self.params[-1])
+        else:
+            sigma = self.params[1] if len(self.params) > 1 else 0.5
+            latency_ms = self.rng.lognormvariate(0, sigma) * self.params[0]
+        if self.slow_rate and self.rng.random() < self.slow_rate:
+            latency_ms += self.slow_ms
+        return max(0.0, latency_ms) / 1000
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计token数（中文约1字1token，其他约4字符1token）"""
+    cjk = len(re.findall(r"[一-鿿]", text))
+    return cjk + max(0, len(text) - cjk) // 4 + 1
+
+
+def detect_kind(messages: List[Dict[str, str]]) -> str:
+    """根据提示内容识别请求类型"""
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    last = messages[-1].get("content", "") if messages else ""
+    if "分类专家" in system:
+        return "classifier"
+    if "SQL修复专家" in system:
+        return "sql_fix"
+    if "基于SQL查询结果" in system or "基于以下真实部门人数数据" in system:
+        return "answer"
+    if "SQL查询" in last and ("生成" in last or "请分析并回答" in last):
+        return "sql"
+    return "chat"
+
+
+def extract_question(kind: str, messages: List[Dict[str, str]]) -> str:
+    """提取用户问题"""
+    last = messages[-1].get("content", "") if messages else ""
+    if kind == "answer":
+        match = re.search(r'用户问题:\s*"?(.+?)"?\n', last)
+        return match.group(1) if match else last
+    if kind == "classifier":
+        match = re.search(r"问题:\s*(.+)", last)
+        return match.group(1).strip() if match else last
+    if kind == "sql_fix":
+        match = re.search(r"用户原始问题:\s*(.+)", last)
+        return match.group(1).strip() if match else last
+    return re.split(r"[：:]", last, maxsplit=1)[-1].strip()
+
+
+def schema_columns(messages: List[Dict[str, str]]) -> List[str]:
+    """提取提示中列出的表结构列名"""
+    text = "\n".join(m.get("content", "") for m in messages)
+    return [a or b for a, b in SCHEMA_COLUMN_PATTERN.findall(text)]
+
+
+def department_column(messages: List[Dict[str, str]]) -> str:
+    """提示中列出的部门列，未列出时使用示例数据的department_id"""
+    columns = schema_columns(messages)
+    return next((column for column in DEPARTMENT_COLUMNS if column in columns), DEPARTMENT_COLUMNS[-1])
+
+
+def build_reply(kind: str, messages: List[Dict[str, str]]) -> str:
+    """生成确定的回复内容"""
+    question = extract_question(kind, messages)
+    if kind == "classifier":
+        for label, keywords in CLASSIFIER_RULES:
+            if any(keyword in question for keyword in keywords):
+                return label
+        return "GENERAL_QUERY"
+    if kind in ("sql", "sql_fix"):
+        sql = next((sql for keywords, sql in SQL_RULES if any(k in question for k in keywords)), DEFAULT_SQL)
+        return f"```sql\n{sql.format(department=department_column(messages))}\n```"
+    if kind == "answer":
+        system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        match = re.search(r"查询结果:\s*(.+)", system)
+        results = match.group(1).strip()[:200] if match else "暂无数据"
+        return f"根据系统中的数据，关于“{question}”，查询到的结果是：{results}。如需更多细节可以继续问我。"
+    return f"这是模拟回复：您的问题是“{question[:50]}”。我是HIIC HR助手，可以帮您查询员工信息和统计数据。"
+
+
+class StubState:
+    """模拟服务的配置和统计"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.rng = random.Random(args.seed)
+        self.latency = LatencyModel(args.latency, args.slow_rate, args.slow_ms, self.rng)
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.retry_after = args.retry_after
+        self.chunk_chars = max(1, args.chunk_chars)
+        self.token_delay = args.token_delay_ms / 1000
+        self.rules = self._load_script(args.script)
+        self.requests: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def _load_script(self, path: Optional[str]) -> List[Dict[str, Any]]:
+        """加载脚本化回复"""
+        if not path:
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+        for rule in rules:
+            rule["regex"] = re.compile(rule.get("pattern", ".*"))
+        print(f"已加载{len(rules)}条脚本化回复规则")
+        return rules
+
+    def reply(self, kind: str, messages: List[Dict[str, str]]) -> str:
+        """优先使用脚本化回复，否则按请求类型生成"""
+        last = messages[-1].get("content", "") if messages else ""
+        for rule in self.rules:
+            if rule.get("kind") not in (None, kind):
+                continue
+            if rule["regex"].search(last):
+                return rule["content"]
+        return build_reply(kind, messages)
+
+    def count(self, table: Dict[str, int], key: str) -> None:
+        table[key] = table.get(key, 0) + 1
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    """创建模拟服务"""
+    app = FastAPI(title="OpenRouter Stub")
+    state = StubState(args)
+
+    async def completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        model = body.get("model", "stub-model")
+        kind = detect_kind(messages)
+        state.count(state.requests, kind)
+
+        await asyncio.sleep(state.latency.sample())
+
+        # 按配置的比例模拟限流和服务端错误
+        roll = state.rng.random()
+        if roll < state.rate_limit_rate:
+            state.count(state.errors, "429")
+            return JSONResponse({"error": {"code": 429, "message": "Rate limit exceeded (stub)"}},
+                                status_code=429, headers={"Retry-After": str(state.retry_after)})
+        if roll < state.rate_limit_rate + state.error_rate:
+            state.count(state.errors, "502")
+            return JSONResponse({"error": {"code": 502, "message": "Upstream error (stub)"}}, status_code=502)
+
+        content = state.reply(kind, messages)
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        completion_tokens = estimate_tokens(content)
+        max_tokens = body.get("max_tokens")
+        finish_reason = "length" if max_tokens and completion_tokens > max_tokens else "stop"
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        completion_id = f"gen-stub-{uuid.uuid4().hex[:12]}"
+
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_chunks(completion_id, model, content, usage, finish_reason),
+                media_type="text/event-stream"
+            )
+
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason
+            }],
+            "usage": usage
+        }
+
+    async def stream_chunks(completion_id: str, model: str, content: str,
+                            usage: Dict[str, int], finish_reason: str) -> AsyncIterator[str]:
+        """按OpenRouter的SSE格式逐段输出"""
+        yield ": OPENROUTER PROCESSING\n\n"
+        for start in range(0, len(content), state.chunk_chars):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[start:start + state.chunk_chars]},
+                             "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            if state.token_delay:
+                await asyncio.sleep(state.token_delay)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+            "usage": usage
+        }
+        yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    app.add_api_route("/api/v1/chat/completions", completions, methods=["POST"])
+    app.add_api_route("/chat/completions", completions, methods=["POST"])
+
+    @app.get("/stats")
+    async def stats():
+        """按请求类型统计的请求数和模拟错误数"""
+        return {"requests": state.requests, "errors": state.errors}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="OpenRouter模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", default="fixed:200",
+                        help="延迟分布: fixed:MS、uniform:MIN_MS:MAX_MS 或 lognormal:MEDIAN_MS:SIGMA")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="慢请求比例（模拟长尾）")
+    parser.add_argument("--slow-ms", type=float, default=10000, help="慢请求额外延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回502的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--retry-after", type=float, default=1, help="429响应的Retry-After（秒）")
+    parser.add_argument("--chunk-chars", type=int, default=4, help="流式输出每个片段的字符数")
+    parser.add_argument("--token-delay-ms", type=float, default=30, help="流式输出片段之间的间隔（毫秒）")
+    parser.add_argument("--script", default=None, help="脚本化回复JSON文件")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，相同种子得到相同的延迟和错误序列")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_args()
+    print(f"OpenRouter模拟服务: http://{args.host}:{args.port}/api/v1/chat/completions")
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,69 @@
+"""
+重新训练本地问题分类模型
+
+训练数据为标注好的种子数据（app/db/sample_data/classification_seed.json）加上
+线上分类记录（monitoring/classifications.jsonl）中大模型给出的分类。
+训练前会留出一部分数据评估准确率和置信度阈值下的覆盖率，最后用全部数据训练并保存。
+
+用法:
+    python scripts/train_question_classifier.py
+    python scripts/train_question_classifier.py --output cache/local_classifier.npz --threshold 0.8
+模型保存后需要重启后端服务才会生效。
+"""
+import os
+import sys
+import random
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.local_classifier import (
+    LocalQuestionClassifier, load_training_data, SEED_FILE, CLASSIFICATION_LOG_FILE, DEFAULT_MODEL_FILE
+)
+
+VALID_LABELS = ["SQL_QUERY", "VISUALIZATION", "DATA_ANALYSIS", "HYBRID_QUERY", "GENERAL_QUERY"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重新训练本地问题分类模型")
+    parser.add_argument("--seed-file", default=SEED_FILE, help="种子数据文件")
+    parser.add_argument("--log-file", default=CLASSIFICATION_LOG_FILE, help="线上分类记录文件，传空字符串则只用种子数据")
+    parser.add_argument("--output", default=settings.LOCAL_CLASSIFIER_PATH or DEFAULT_MODEL_FILE, help="模型输出路径")
+    parser.add_argument("--threshold", type=float, default=settings.LOCAL_CLASSIFIER_THRESHOLD, help="评估使用的置信度阈值")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--learning-rate", type=float, default=10.0)
+    parser.add_argument("--l2", type=float, default=1e-5)
+    parser.add_argument("--n-features", type=int, default=8192, help="哈希特征维数")
+    parser.add_argument("--holdout", type=float, default=0.2, help="评估留出比例")
+    args = parser.parse_args()
+
+    questions, labels = load_training_data(args.seed_file, args.log_file or None, VALID_LABELS)
+    print(f"训练数据: {len(labels)}条")
+    for label in VALID_LABELS:
+        print(f"  {label}: {labels.count(label)}")
+
+    train_options = {"epochs": args.epochs, "learning_rate": args.learning_rate, "l2": args.l2}
+
+    # 留出评估
+    indices = list(range(len(labels)))
+    random.Random(42).shuffle(indices)
+    holdout_size = int(len(indices) * args.holdout)
+    if holdout_size:
+        test, train = indices[:holdout_size], indices[holdout_size:]
+        model = LocalQuestionClassifier(args.n_features)
+        model.train([questions[i] for i in train], [labels[i] for i in train], **train_options)
+        result = model.evaluate([questions[i] for i in test], [labels[i] for i in test], args.threshold)
+        print(f"留出评估: 样本{result['samples']}条，准确率{result['accuracy']:.1%}，"
+              f"置信度≥{args.threshold}的覆盖率{result['coverage']:.1%}，其中准确率{result['confident_accuracy']:.1%}")
+
+    # 使用全部数据训练并保存
+    model = LocalQuestionClassifier(args.n_features)
+    model.train(questions, labels, **train_options)
+    model.save(args.output)
+    print(f"模型已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+测试公共配置：把backend目录加入Python路径，便于直接运行pytest
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,78 @@
+"""
+答案模板渲染测试
+"""
+from app.services.answer_renderer import AnswerRenderer
+
+renderer = AnswerRenderer()
+
+
+def test_renders_plain_count():
+    """普通COUNT(*)按人数模板渲染"""
+    answer = renderer.render("研发部有多少人？", "SELECT COUNT(*) FROM employees WHERE department = '研发部'",
+                             [{"COUNT(*)": 12}])
+    assert answer == "好的，研发部目前共有12人。"
+
+
+def test_renders_count_with_alias():
+    """带别名的COUNT(列)同样按人数模板渲染"""
+    answer = renderer.render("公司有多少名博士？",
+                             "SELECT COUNT(e.id) AS cnt FROM employees e WHERE education = '博士'",
+                             [{"cnt": 5}])
+    assert answer == "好的，公司目前共有5名博士。"
+
+
+def test_ratio_is_not_rendered_as_count():
+    """比例表达式里含有COUNT也不能当作人数"""
+    sql = ("SELECT COUNT(CASE WHEN education = '博士' THEN 1 END) * 100.0 / COUNT(*) AS ratio "
+           "FROM employees")
+    assert renderer.render("公司有多少博士占比？", sql, [{"ratio": 23.5}]) is None
+
+
+def test_non_integral_count_is_not_rendered():
+    """计数列返回非整数时交给大模型"""
+    assert renderer.render("研发部有多少人？", "SELECT COUNT(*) AS cnt FROM employees", [{"cnt": 3.5}]) is None
+
+
+def test_distinct_count_groups_are_not_rendered():
+    """分组COUNT(DISTINCT)统计的不是人数"""
+    sql = "SELECT department, COUNT(DISTINCT position) AS n FROM employees GROUP BY department"
+    results = [{"department": "A", "n": 3}, {"department": "B", "n": 2}]
+    assert renderer.render("各部门有多少种职位？", sql, results) is None
+
+
+def test_renders_grouped_count():
+    """分组计数按部门逐一列出并指出人数最多的部门"""
+    sql = "SELECT department, COUNT(*) AS total FROM employees GROUP BY department"
+    results = [{"department": "研发部", "total": 8}, {"department": "市场部", "total": 3}]
+    answer = renderer.render("各部门有多少人？", sql, results)
+    assert answer == "好的，按部门来看，研发部有8人，市场部有3人。其中研发部人数最多。"
+
+
+def test_renders_rounded_average():
+    """ROUND(AVG(列))按平均值模板渲染"""
+    sql = "SELECT ROUND(AVG(age), 1) AS avg_age FROM employees WHERE department = '研发部'"
+    answer = renderer.render("研发部的平均年龄是多少？", sql, [{"avg_age": 32.46}])
+    assert answer == "好的，研发部的平均年龄是32.5岁。"
+
+
+def test_unparseable_select_falls_back():
+    """无法对应到选择表达式的列交给大模型"""
+    sql = "WITH t AS (SELECT COUNT(*) AS c FROM employees) SELECT c FROM t"
+    assert renderer.render("公司有多少人？", sql, [{"c": 10}]) is None
+
+
+def test_renders_count_with_person_clause():
+    """"有多少人是博士"这类问题保留"人+谓语"的句式"""
+    sql = "SELECT COUNT(*) FROM employees WHERE education = '博士'"
+    assert renderer.render("有多少人是博士？", sql, [{"COUNT(*)": 5}]) == "好的，公司目前共有5人是博士。"
+    assert renderer.render("研发部有多少人是博士", sql, [{"COUNT(*)": 1}]) == "好的，研发部目前共有1人是博士。"
+    assert renderer.render("有多少人在研发部？", sql, [{"COUNT(*)": 8}]) == "好的，公司目前共有8人在研发部。"
+    assert (renderer.render("有多少人毕业于清华大学", sql, [{"COUNT(*)": 3}])
+            == "好的，公司目前共有3人毕业于清华大学。")
+    assert renderer.render("有多少员工是硕士", sql, [{"COUNT(*)": 2}]) == "好的，公司目前共有2名员工是硕士。"
+
+
+def test_person_noun_without_clause_falls_back():
+    """"人"后面接的不是谓语时交给大模型"""
+    sql = "SELECT COUNT(*) FROM employees"
+    assert renderer.render("有多少人的学历是博士", sql, [{"COUNT(*)": 5}]) is None
@@ -0,0 +1,83 @@
+"""
+后台批量写入测试：停止时写入剩余数据，快照写入最新数据
+"""
+import json
+import time
+
+from app.utils.background_writer import BackgroundWriter
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_stop_flushes_pending_records(tmp_path):
+    """刷新间隔未到时停止，待写记录和快照全部写入，后台线程退出"""
+    log_path = str(tmp_path / "logs" / "records.jsonl")
+    snapshot_path = str(tmp_path / "cache" / "snapshot.json")
+    writer = BackgroundWriter("test-writer", flush_interval=60)
+    state = {"version": 1}
+
+    writer.append(log_path, {"question": "研发部有多少人"})
+    writer.append(log_path, {"question": "平均年龄"})
+    writer.snapshot(snapshot_path, lambda: dict(state))
+    state["version"] = 2
+    assert writer.stats()["pending_lines"] == 2
+
+    start_time = time.time()
+    writer.stop()
+    assert time.time() - start_time < 5
+    assert not writer._thread.is_alive()
+
+    assert read_lines(log_path) == [{"question": "研发部有多少人"}, {"question": "平均年龄"}]
+    # 快照在刷新时才取数据，写入的是最新状态
+    with open(snapshot_path, encoding="utf-8") as f:
+        assert json.load(f) == {"version": 2}
+    stats = writer.stats()
+    assert (stats["pending_lines"], stats["lines_written"], stats["snapshots_written"]) == (0, 2, 1)
+
+
+def test_flushes_early_when_too_many_pending(tmp_path):
+    """待写记录达到上限时不等刷新间隔提前写入"""
+    path = str(tmp_path / "records.jsonl")
+    writer = BackgroundWriter("test-writer", flush_interval=60, max_pending=3)
+    try:
+        for i in range(3):
+            writer.append(path, {"i": i})
+
+        deadline = time.time() + 2
+        while writer.stats()["lines_written"] < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        assert [record["i"] for record in read_lines(path)] == [0, 1, 2]
+    finally:
+        writer.stop()
+
+
+def test_failed_snapshot_does_not_block_other_writes(tmp_path):
+    """某个快照写入失败时记录错误，其他数据照常写入"""
+    path = str(tmp_path / "records.jsonl")
+    writer = BackgroundWriter("test-writer", flush_interval=60)
+
+    def broken():
+        raise ValueError("not serializable")
+
+    writer.snapshot(str(tmp_path / "broken.json"), broken)
+    writer.append(path, {"ok": True})
+    writer.stop()
+
+    assert read_lines(path) == [{"ok": True}]
+    assert writer.stats()["errors"] == 1
+
+
+def test_writes_after_stop_are_not_lost(tmp_path):
+    """停止后仍在追加的记录（如退出时尚未结束的请求）直接写入"""
+    path = str(tmp_path / "records.jsonl")
+    writer = BackgroundWriter("test-writer", flush_interval=60)
+    writer.append(path, {"i": 0})
+    writer.stop()
+
+    writer.append(path, {"i": 1})
+    writer.snapshot(str(tmp_path / "snapshot.json"), lambda: {"ok": True})
+    assert [record["i"] for record in read_lines(path)] == [0, 1]
+    assert writer.stats()["snapshots_written"] == 1
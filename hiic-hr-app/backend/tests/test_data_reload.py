@@ -0,0 +1,140 @@
+"""
+数据重新加载测试：数据源不可用时保留原有数据
+"""
+import time
+import asyncio
+
+import pandas as pd
+import pytest
+
+from app.core.executor import sql_executor
+from app.db.supabase import supabase_client
+from app.services import sql_service as sql_service_module
+from app.services.hr_cube import HRAggregateCube
+from app.services.sql_service import sql_service
+from app.services.sql_snapshot import SQLDataSnapshot
+
+
+def test_refresh_cache_keeps_old_cache_on_failure(monkeypatch):
+    """获取hr_data失败（返回None或抛出异常）时保留原有缓存"""
+    old_data = [{"id": 1, "name": "张三", "department": "研发部"}]
+    monkeypatch.setattr(supabase_client, "client", object())
+    monkeypatch.setattr(supabase_client, "hr_data_cache", old_data)
+    monkeypatch.setattr(supabase_client, "employees_cache", supabase_client._map_hr_data_to_employees(old_data))
+    old_employees = supabase_client.employees_cache
+
+    monkeypatch.setattr(supabase_client, "_fetch_hr_data", lambda: None)
+    assert supabase_client.refresh_cache() is False
+    assert supabase_client.hr_data_cache is old_data
+    assert supabase_client.employees_cache is old_employees
+
+    def fail():
+        raise ConnectionError("network down")
+
+    monkeypatch.setattr(supabase_client, "_fetch_hr_data", fail)
+    assert supabase_client.refresh_cache() is False
+    assert supabase_client.hr_data_cache is old_data
+
+
+def test_refresh_cache_replaces_cache_on_success(monkeypatch):
+    """获取成功时替换缓存"""
+    new_data = [{"id": 2, "name": "李四", "department": "市场部"}]
+    monkeypatch.setattr(supabase_client, "client", object())
+    monkeypatch.setattr(supabase_client, "hr_data_cache", None)
+    monkeypatch.setattr(supabase_client, "employees_cache", None)
+    monkeypatch.setattr(supabase_client, "_fetch_hr_data", lambda: new_data)
+
+    assert supabase_client.refresh_cache() is True
+    assert supabase_client.hr_data_cache is new_data
+    assert [e["name"] for e in supabase_client.employees_cache] == ["李四"]
+
+
+def test_reload_refuses_to_replace_real_data_with_sample_data(monkeypatch):
+    """当前版本是真实数据、数据源退回示例数据时拒绝重新加载"""
+    # 测试环境没有配置Supabase，重新加载只能拿到示例数据
+    monkeypatch.setattr(sql_service.snapshot, "source", "supabase")
+    version = sql_service.data_version
+
+    with pytest.raises(RuntimeError):
+        sql_service.reload_data()
+    assert sql_service.data_version == version
+    assert sql_service.snapshot.source == "supabase"
+
+
+def test_reload_with_sample_data_when_already_on_sample_data():
+    """一直使用示例数据时（如开发环境）允许重新加载"""
+    assert sql_service.snapshot.source == "sample"
+    info = sql_service.reload_data()
+    assert info["source"] == "sample"
+    assert sql_service.data_version == info["version"]
+
+
+def test_retired_snapshot_stays_open_while_request_holds_it(monkeypatch):
+    """请求登记使用的旧快照即使没有占用连接，也要等请求结束后才释放"""
+    monkeypatch.setattr(sql_service, "retire_grace_seconds", 0.05)
+    snapshot = sql_service._pin_snapshot()
+    try:
+        sql_service.load_data()
+        assert sql_service.snapshot is not snapshot
+        time.sleep(0.3)
+        assert snapshot.in_use() == 0
+        assert not snapshot.closed
+    finally:
+        snapshot.release()
+
+    deadline = time.time() + 2
+    while not snapshot.closed and time.time() < deadline:
+        time.sleep(0.05)
+    assert snapshot.closed
+
+
+def test_in_memory_fallback_runs_on_executor_threads(monkeypatch):
+    """连接池创建失败时，内存连接可以在SQL线程池的线程中使用"""
+    monkeypatch.setattr(sql_service, "_create_snapshot_pool", lambda conn: None)
+    snapshot = sql_service._build_snapshot(sql_service.data_version + 1)
+    try:
+        assert snapshot.pool is None and snapshot.conn is not None
+
+        async def query():
+            return await asyncio.gather(*(
+                sql_executor.run(sql_service._execute_on_snapshot, "SELECT COUNT(*) AS total FROM employees", snapshot)
+                for _ in range(4)
+            ))
+
+        results = asyncio.run(query())
+        assert all(rows == [{"total": len(snapshot.df)}] for rows in results)
+    finally:
+        snapshot.close()
+
+
+def _department_snapshot(version, departments):
+    """只包含部门维度的数据快照"""
+    df = pd.DataFrame({"department": departments})
+    return SQLDataSnapshot(version=version, df=df, cube=HRAggregateCube(df), source="sample")
+
+
+def test_department_stats_use_pinned_snapshot(monkeypatch):
+    """部门统计查询使用请求开始时固定的快照，旧版本的回复不写入缓存"""
+    old_snapshot = _department_snapshot(100, ["研发部"] * 3)
+    new_snapshot = _department_snapshot(101, ["市场部"] * 5)
+    prompts = []
+
+    async def reply(messages, *args, **kwargs):
+        prompts.append(messages[0]["content"])
+        return "部门人数分布如上"
+
+    monkeypatch.setattr(sql_service_module.openrouter_service, "get_chat_response", reply)
+    monkeypatch.setattr(sql_service, "snapshot", new_snapshot)
+    monkeypatch.setattr(sql_service, "department_stats_cache", None)
+    monkeypatch.setattr(sql_service, "department_stats_cache_version", None)
+
+    asyncio.run(sql_service._handle_department_stats_query(old_snapshot))
+    assert "研发部: 3人" in prompts[-1] and "市场部" not in prompts[-1]
+    assert sql_service.department_stats_cache is None
+
+    asyncio.run(sql_service._handle_department_stats_query(new_snapshot))
+    assert "市场部: 5人" in prompts[-1]
+    assert sql_service.department_stats_cache_version == 101
+    # 缓存只给同一版本的请求使用
+    asyncio.run(sql_service._handle_department_stats_query(old_snapshot))
+    assert len(prompts) == 3
@@ -0,0 +1,55 @@
+"""
+有界线程池的排队计数测试
+"""
+import asyncio
+import threading
+
+import pytest
+
+from app.core.executor import BoundedExecutor, ExecutorSaturatedError
+
+
+def test_cancelled_queued_call_releases_queue_slot():
+    """排队中的调用被取消后，排队计数应归零，后续调用不受影响"""
+    executor = BoundedExecutor("test-executor", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        # 唯一的工作线程被占用，这个调用只能排队，超时后被取消
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(executor.run(lambda: "queued"), timeout=0.05)
+        release.set()
+        await blocker
+        return await executor.run(lambda: "after")
+
+    try:
+        assert asyncio.run(scenario()) == "after"
+        stats = executor.stats()
+        assert stats["queue_depth"] == 0
+        assert stats["running"] == 0
+        assert stats["cancelled"] == 1
+    finally:
+        executor.shutdown()
+
+
+def test_rejects_when_queue_full():
+    """工作线程和排队名额都用完时立即拒绝"""
+    executor = BoundedExecutor("test-executor", max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run(lambda: None)
+        release.set()
+        await blocker
+
+    try:
+        asyncio.run(scenario())
+        assert executor.stats()["rejected"] == 1
+        assert executor.stats()["queue_depth"] == 0
+    finally:
+        executor.shutdown()
@@ -0,0 +1,73 @@
+"""
+对冲请求测试：对冲请求要占用自己的并发名额
+"""
+import asyncio
+
+import pytest
+
+from app.services.llm_resilience import ConcurrencyLimiter
+from app.services.openrouter_service import openrouter_service
+
+MODEL_TYPE = "hedge-test"
+CONFIG = {"model": "primary", "temperature": 0, "retry_count": 0, "timeout": 5}
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, model):
+        self.model = model
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """主模型0.3秒返回，备用模型立即返回，记录发出的请求"""
+    calls = []
+
+    async def send(data, retry_count=3, timeout=30, model_type="chat"):
+        calls.append(data["model"])
+        await asyncio.sleep(0.3 if data["model"] == "primary" else 0.01)
+        return FakeResponse(data["model"])
+
+    monkeypatch.setattr(openrouter_service, "_send_api_request", send)
+    return calls
+
+
+def run_hedged(limiter):
+    async def scenario():
+        # 模拟_complete已经为这次请求占用了一个名额
+        async with limiter.slot():
+            response = await openrouter_service._send_hedged(
+                [{"role": "user", "content": "hi"}], CONFIG, MODEL_TYPE, ["primary", "backup"], 0.05
+            )
+            await asyncio.sleep(0)
+            return response, limiter.in_flight
+    return asyncio.run(scenario())
+
+
+def test_hedge_skipped_without_free_slot(monkeypatch, upstream):
+    """没有空闲名额时不发出对冲请求，等待主模型返回"""
+    limiter = ConcurrencyLimiter(MODEL_TYPE, max_concurrency=1)
+    monkeypatch.setitem(openrouter_service.limiters, MODEL_TYPE, limiter)
+    skipped = openrouter_service.hedge_skipped_counts.get(MODEL_TYPE, 0)
+
+    response, in_flight = run_hedged(limiter)
+    assert response.model == "primary"
+    assert upstream == ["primary"]
+    assert in_flight == 1
+    assert openrouter_service.hedge_skipped_counts[MODEL_TYPE] == skipped + 1
+    assert limiter.in_flight == 0
+
+
+def test_hedge_holds_its_own_slot(monkeypatch, upstream):
+    """有空闲名额时对冲请求占用一个名额，结束后释放"""
+    limiter = ConcurrencyLimiter(MODEL_TYPE, max_concurrency=2)
+    monkeypatch.setitem(openrouter_service.limiters, MODEL_TYPE, limiter)
+
+    response, in_flight = run_hedged(limiter)
+    assert response.model == "backup"
+    assert upstream == ["primary", "backup"]
+    # 对冲请求的名额已释放，只剩外层请求的名额
+    assert in_flight == 1
+    assert limiter.in_flight == 0
+    assert limiter.stats()["admitted"] == 2
@@ -0,0 +1,63 @@
+"""
+HR聚合立方体测试：简单统计问题的识别与切片结果
+"""
+import pandas as pd
+import pytest
+
+from app.services.hr_cube import HRAggregateCube
+
+
+@pytest.fixture(scope="module")
+def df():
+    return pd.DataFrame([
+        {"department": "研发部", "gender": "男", "education_level": "硕士", "age": 28, "company_years": 2, "is_985": "是"},
+        {"department": "研发部", "gender": "女", "education_level": "博士", "age": 35, "company_years": 6, "is_985": "否"},
+        {"department": "研发部", "gender": "女", "education_level": "本科", "age": 41, "company_years": 12, "is_985": "是"},
+        {"department": "市场部", "gender": "男", "education_level": "本科", "age": 30, "company_years": 4, "is_985": "否"},
+        {"department": "市场部", "gender": "女", "education_level": "硕士", "age": 26, "company_years": 1, "is_985": "否"},
+    ])
+
+
+@pytest.fixture(scope="module")
+def cube(df):
+    return HRAggregateCube(df)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("研发部有多少人？", ("count", {"department": "研发部"})),
+    ("请问研发部的女员工有多少人", ("count", {"department": "研发部", "gender": "女"})),
+    ("公司有多少博士", ("count", {"education": "博士"})),
+    ("985院校毕业的员工有多少人？", ("count", {"is_985": True})),
+    ("市场部的平均年龄是多少", ("age", {"department": "市场部"})),
+])
+def test_matches_simple_questions(cube, question, expected):
+    assert cube.match_question(question) == expected
+
+
+@pytest.mark.parametrize("question", [
+    # 立方体无法表达的条件
+    "研发部30岁以上的有多少人？",
+    "研发部去年入职了多少人",
+    # 同一维度的多个取值
+    "研发部和市场部有多少人",
+    "男女员工各有多少人",
+    # 不是统计问题
+    "研发部的负责人是谁",
+])
+def test_rejects_questions_outside_the_cube(cube, question):
+    assert cube.match_question(question) is None
+
+
+def test_answers_match_employee_rows(cube, df):
+    """按识别出的切片条件得到的人数和平均值与员工明细一致"""
+    metric, filters = cube.match_question("研发部的女员工有多少人")
+    assert metric == "count"
+    expected = df[(df["department"] == "研发部") & (df["gender"] == "女")]
+    assert cube.count(**filters) == len(expected)
+
+    metric, filters = cube.match_question("研发部的平均年龄")
+    assert metric == "age"
+    assert cube.average(metric, **filters) == pytest.approx(df[df["department"] == "研发部"]["age"].mean())
+
+    _, filters = cube.match_question("985院校毕业的员工有多少人？")
+    assert cube.count(**filters) == 2
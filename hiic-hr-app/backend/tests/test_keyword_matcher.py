@@ -0,0 +1,77 @@
+"""
+关键词匹配测试：自动机匹配结果与逐个关键词查找一致，快速分类结果与原有实现一致
+"""
+import random
+import re
+
+import pytest
+
+from app.services.keyword_matcher import KeywordMatcher
+from app.services.question_classifier import FAST_KEYWORDS, FAST_SQL_PATTERNS, question_classifier
+
+
+def baseline_fast_classify(question):
+    """原有的快速分类实现：逐个正则、逐个关键词查找"""
+    def contains(keywords):
+        text = question.lower()
+        return any(keyword.lower() in text for keyword in keywords)
+
+    if any(re.search(pattern, question) for pattern in FAST_SQL_PATTERNS):
+        return "SQL_QUERY"
+    if contains(FAST_KEYWORDS["SQL_QUERY"]):
+        return "SQL_QUERY"
+    if contains(FAST_KEYWORDS["VISUALIZATION"]) and not contains(FAST_KEYWORDS["NO_VISUALIZATION"]):
+        return "VISUALIZATION"
+    if contains(FAST_KEYWORDS["DATA_ANALYSIS"]):
+        return "DATA_ANALYSIS"
+    return None
+
+
+def random_questions(count, seed=7):
+    """由关键词片段和普通文字随机拼接的问题，覆盖关键词重叠、嵌套和被截断的情况"""
+    rng = random.Random(seed)
+    keywords = [keyword for words in FAST_KEYWORDS.values() for keyword in words]
+    fragments = keywords + [keyword[:-1] for keyword in keywords if len(keyword) > 1]
+    fragments += ["研发", "部", "所", "中心", "谁", "负责人", "的", "请", "帮我", "员工", "Ab", "？", " "]
+    for _ in range(count):
+        yield "".join(rng.choice(fragments) for _ in range(rng.randint(1, 6)))
+
+
+def test_matcher_finds_overlapping_keywords():
+    """重叠、嵌套的关键词都能找到，并按出现位置排序"""
+    matcher = KeywordMatcher({"A": ["he", "she", "hers"], "B": ["his", "HE"]})
+    assert matcher.find("ushers") == [("she", "A"), ("he", "A"), ("he", "B"), ("hers", "A")]
+    assert matcher.match_labels("this") == {"B"}
+    assert matcher.match_labels("xyz") == set()
+
+
+def test_matcher_respects_ignore_case():
+    assert KeywordMatcher({"A": ["Chart"]}).match_labels("bar CHART") == {"A"}
+    assert KeywordMatcher({"A": ["Chart"]}, ignore_case=False).match_labels("bar CHART") == set()
+
+
+def test_matcher_labels_equal_substring_search():
+    """每个标签的命中结果与逐个关键词做子串查找一致"""
+    matcher = KeywordMatcher(FAST_KEYWORDS)
+    for question in random_questions(2000):
+        expected = {label for label, keywords in FAST_KEYWORDS.items()
+                    if any(keyword.lower() in question.lower() for keyword in keywords)}
+        assert matcher.match_labels(question) == expected, question
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("研发部有多少人", "SQL_QUERY"),
+    ("谁是数字经济研究所的负责人", "SQL_QUERY"),
+    ("画一个饼图", "VISUALIZATION"),
+    ("画一个饼图展示学历分布", "SQL_QUERY"),
+    ("不需要图，只看一下趋势", "DATA_ANALYSIS"),
+    ("你好", None),
+])
+def test_fast_classify_examples(question, expected):
+    assert question_classifier._fast_classify(question) == expected
+
+
+def test_fast_classify_equals_baseline():
+    """随机问题上的快速分类结果与原有实现一致"""
+    for question in random_questions(5000, seed=11):
+        assert question_classifier._fast_classify(question) == baseline_fast_classify(question), question
@@ -0,0 +1,127 @@
+"""
+大模型响应缓存测试：有效期、删除、访问时间批量写入和旧缓存文件升级
+"""
+import sqlite3
+
+from app.services import llm_cache
+from app.services.llm_cache import LLMResponseCache
+
+RESPONSE = {"choices": [{"message": {"content": "```sql\nSELECT COUNT(*) FROM employees\n```"}}]}
+
+
+def test_expired_entry_is_a_miss(tmp_path, monkeypatch):
+    """超过有效期的条目按未命中处理并被删除"""
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), ttl_seconds=60)
+    try:
+        cache.put("k", "sql", RESPONSE)
+        now[0] += 59
+        assert cache.get("k") == RESPONSE
+        now[0] += 2
+        assert cache.get("k") is None
+        stats = cache.stats()
+        assert stats["entries"] == 0
+        assert stats["expirations"] == 1
+    finally:
+        cache.close()
+
+
+def test_zero_ttl_never_expires(tmp_path, monkeypatch):
+    """有效期为0时条目不过期"""
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), ttl_seconds=0)
+    try:
+        cache.put("k", "sql", RESPONSE)
+        now[0] += 10 ** 8
+        assert cache.get("k") == RESPONSE
+    finally:
+        cache.close()
+
+
+def test_delete_removes_entry(tmp_path):
+    """删除的条目不再命中"""
+    cache = LLMResponseCache(str(tmp_path / "cache.db"))
+    try:
+        cache.put("k", "sql", RESPONSE)
+        assert cache.delete("k") is True
+        assert cache.delete("k") is False
+        assert cache.get("k") is None
+    finally:
+        cache.close()
+
+
+def test_upgrades_cache_file_without_expiry_column(tmp_path):
+    """旧版本缓存文件补上expires_at列，旧条目仍可读取"""
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE responses (key TEXT PRIMARY KEY, model_type TEXT NOT NULL, "
+                 "response TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)")
+    conn.execute("INSERT INTO responses VALUES ('old', 'sql', '{\"ok\": true}', 0, 0)")
+    conn.commit()
+    conn.close()
+
+    cache = LLMResponseCache(path, ttl_seconds=60)
+    try:
+        assert cache.get("old") == {"ok": True}
+        cache.put("new", "sql", RESPONSE)
+        assert cache.get("new") == RESPONSE
+    finally:
+        cache.close()
+
+
+def test_hits_do_not_write_to_disk(tmp_path):
+    """命中只读取，访问时间在内存中累计"""
+    cache = LLMResponseCache(str(tmp_path / "cache.db"))
+    try:
+        cache.put("k", "sql", RESPONSE)
+        changes = cache._conn.total_changes
+        for _ in range(10):
+            assert cache.get("k") == RESPONSE
+        assert cache._conn.total_changes == changes
+        assert cache.stats()["pending_access_updates"] == 1
+    finally:
+        cache.close()
+
+
+def test_eviction_uses_pending_access_times(tmp_path, monkeypatch):
+    """淘汰前写入累计的访问时间，最近命中的条目不会被淘汰"""
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), max_entries=2)
+    try:
+        cache.put("a", "sql", RESPONSE)
+        now[0] += 1
+        cache.put("b", "sql", RESPONSE)
+        now[0] += 1
+        assert cache.get("a") == RESPONSE
+        now[0] += 1
+        cache.put("c", "sql", RESPONSE)
+        assert cache.get("b") is None
+        assert cache.get("a") == RESPONSE and cache.get("c") == RESPONSE
+    finally:
+        cache.close()
+
+
+def test_access_times_flushed_in_batches_and_on_close(tmp_path, monkeypatch):
+    """累计的访问时间达到批量大小或关闭时写入文件"""
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    monkeypatch.setattr(llm_cache, "ACCESS_FLUSH_BATCH", 2)
+    path = str(tmp_path / "cache.db")
+    cache = LLMResponseCache(path)
+    for key in ("a", "b", "c"):
+        cache.put(key, "sql", RESPONSE)
+    now[0] += 1
+    cache.get("a")
+    cache.get("b")
+    assert cache.stats()["pending_access_updates"] == 0
+    cache.get("c")
+    assert cache.stats()["pending_access_updates"] == 1
+    cache.close()
+
+    conn = sqlite3.connect(path)
+    rows = dict(conn.execute("SELECT key, last_access > created_at FROM responses"))
+    conn.close()
+    assert rows == {"a": 1, "b": 1, "c": 1}
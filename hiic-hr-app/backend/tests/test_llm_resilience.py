@@ -0,0 +1,147 @@
+"""
+大模型调用容错组件测试
+"""
+import asyncio
+
+import pytest
+
+from app.services import llm_resilience
+from app.services.llm_resilience import (
+    CircuitBreaker, ConcurrencyLimiter, OverloadedError, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控的时钟"""
+    now = [1000.0]
+    monkeypatch.setattr(llm_resilience.time, "time", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    """连续失败达到阈值后打开，打开期间拒绝请求"""
+    breaker = CircuitBreaker("m", failure_threshold=3, recovery_timeout=30)
+    for _ in range(2):
+        breaker.record_failure("HTTP 502")
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow_request() == (True, False)
+
+    breaker.record_failure("HTTP 502")
+    assert breaker.state == STATE_OPEN
+    assert breaker.allow_request() == (False, False)
+    assert breaker.retry_after() == pytest.approx(30)
+
+
+def test_success_resets_failure_count(clock):
+    """成功后连续失败计数清零"""
+    breaker = CircuitBreaker("m", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+
+
+def test_half_open_admits_single_probe(clock):
+    """恢复时间后进入半开状态，只放行一个探测请求；探测成功则关闭"""
+    breaker = CircuitBreaker("m", failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+
+    assert breaker.allow_request() == (True, True)
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow_request() == (False, False)
+
+    breaker.record_success(0.2)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow_request() == (True, False)
+
+
+def test_failed_probe_reopens(clock):
+    """探测失败重新打开"""
+    breaker = CircuitBreaker("m", failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow_request() == (True, True)
+    breaker.record_failure("timeout")
+    assert breaker.state == STATE_OPEN
+    assert breaker.allow_request() == (False, False)
+    assert breaker.stats()["open_count"] == 2
+
+
+def test_released_probe_can_be_retried(clock):
+    """探测请求未得出结论释放名额后，下一个请求成为探测请求"""
+    breaker = CircuitBreaker("m", failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow_request() == (True, True)
+    breaker.release_probe()
+    assert breaker.allow_request() == (True, True)
+
+
+def test_limiter_removes_cancelled_waiter():
+    """排队中被取消的请求从队列中移除，不占用名额"""
+    async def scenario():
+        limiter = ConcurrencyLimiter("m", max_concurrency=1, max_queue=4, queue_timeout=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 1
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.stats()["queue_depth"] == 0
+
+        limiter.release()
+        assert limiter.in_flight == 0
+        assert limiter.try_acquire()
+
+    asyncio.run(scenario())
+
+
+def test_limiter_hands_over_slot_granted_to_cancelled_waiter():
+    """名额刚转交给排队请求时该请求被取消，名额不会丢失，后面排队的请求仍能拿到名额
+
+    取消与转交同时发生时，不同Python版本下被取消的请求可能放弃名额转交给下一个，
+    也可能照常拿到名额，两种情况结束后名额都要全部归还。
+    """
+    async def scenario():
+        limiter = ConcurrencyLimiter("m", max_concurrency=1, max_queue=4, queue_timeout=5)
+
+        async def request():
+            async with limiter.slot():
+                await asyncio.sleep(0)
+
+        await limiter.acquire()
+        cancelled = asyncio.create_task(request())
+        following = asyncio.create_task(request())
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 2
+
+        # 释放名额（转交给第一个排队请求）后、该请求恢复运行前将其取消
+        limiter.release()
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+
+        await asyncio.wait_for(following, timeout=1)
+        assert limiter.in_flight == 0
+        assert limiter.stats()["queue_depth"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_limiter_queue_timeout_leaves_no_waiter():
+    """排队超时抛出OverloadedError，并从队列中移除"""
+    async def scenario():
+        limiter = ConcurrencyLimiter("m", max_concurrency=1, max_queue=4, queue_timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(OverloadedError):
+            await limiter.acquire()
+        assert limiter.stats()["queue_depth"] == 0
+        assert limiter.stats()["timed_out"] == 1
+
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
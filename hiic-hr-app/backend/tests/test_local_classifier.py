@@ -0,0 +1,43 @@
+"""
+本地分类模型训练数据测试
+"""
+import json
+
+from app.services.local_classifier import load_training_data
+
+LONG_QUESTION = "请帮我统计一下各个部门里面硕士及以上学历并且年龄在三十五岁以下的员工分别有多少人，并按人数从高到低排列出来"
+
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def test_training_data_uses_model_labels_and_full_questions(tmp_path):
+    """只使用大模型分类的记录，优先使用完整问题，跳过被截断的旧预览"""
+    seed = tmp_path / "seed.json"
+    seed.write_text(json.dumps([{"question": "研发部有多少人", "label": "SQL_QUERY"}], ensure_ascii=False),
+                    encoding="utf-8")
+    log = tmp_path / "classifications.jsonl"
+    write_jsonl(log, [
+        # 快速规则的分类不作为标签
+        {"question": "画一个部门人数的饼图", "question_preview": "画一个部门人数的饼图",
+         "classification": "SQL_QUERY", "source": "fast"},
+        # 新记录带完整问题
+        {"question": LONG_QUESTION, "question_preview": LONG_QUESTION[:50] + "...",
+         "classification": "SQL_QUERY", "source": "model"},
+        # 旧记录只有预览：截断的跳过，未截断的保留；没有source字段视为模型分类
+        {"question_preview": ("另一个很长的问题" * 7)[:50] + "...", "classification": "DATA_ANALYSIS"},
+        {"question_preview": "公司的人才结构怎么样", "classification": "DATA_ANALYSIS"},
+        # 种子数据优先于线上记录
+        {"question": "研发部有多少人", "classification": "GENERAL_QUERY", "source": "model"},
+    ])
+
+    questions, labels = load_training_data(str(seed), str(log))
+    samples = dict(zip(questions, labels))
+    assert samples == {
+        LONG_QUESTION: "SQL_QUERY",
+        "公司的人才结构怎么样": "DATA_ANALYSIS",
+        "研发部有多少人": "SQL_QUERY",
+    }
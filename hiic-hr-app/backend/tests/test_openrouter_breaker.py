@@ -0,0 +1,54 @@
+"""
+熔断器探测名额测试：熔断器关闭时放行的请求结束时不能释放半开状态的探测名额
+"""
+import asyncio
+
+from app.services.llm_resilience import STATE_HALF_OPEN
+from app.services.openrouter_service import openrouter_service
+
+MODEL = "breaker-test-model"
+
+
+class FakeResponse:
+    status_code = 400
+    text = "bad request"
+    headers = {}
+
+
+class SlowClient:
+    """等待放行信号后返回400（不计入熔断器成功或失败）"""
+
+    def __init__(self, release: asyncio.Event):
+        self.release = release
+
+    async def post(self, url, json=None, timeout=None):
+        await self.release.wait()
+        return FakeResponse()
+
+
+def test_normal_request_does_not_release_probe(monkeypatch):
+    breaker = openrouter_service._get_breaker(MODEL)
+    breaker.recovery_timeout = 0
+
+    async def scenario():
+        release = asyncio.Event()
+        monkeypatch.setattr(openrouter_service, "_get_client", lambda: SlowClient(release))
+        # 熔断器关闭时放行的普通请求
+        normal = asyncio.create_task(openrouter_service._send_api_request({"model": MODEL}, retry_count=1))
+        await asyncio.sleep(0.01)
+
+        # 请求进行期间熔断器打开并进入半开状态，另一个请求成为探测请求
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure("HTTP 502")
+        assert breaker.allow_request() == (True, True)
+        assert breaker.state == STATE_HALF_OPEN
+
+        release.set()
+        await normal
+        # 普通请求结束后探测名额仍被占用
+        return breaker.allow_request()
+
+    try:
+        assert asyncio.run(scenario()) == (False, False)
+    finally:
+        openrouter_service.breakers.pop(MODEL, None)
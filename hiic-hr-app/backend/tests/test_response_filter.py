@@ -0,0 +1,71 @@
+"""
+流式回复过滤测试：代码块和SQL查询说明语句不会出现在流式回复中
+"""
+import asyncio
+
+import pytest
+
+from app.services import sql_service as sql_service_module
+from app.services.response_filter import StreamingResponseFilter
+from app.services.sql_service import sql_service
+
+FENCED_REPLY = [
+    "以下是SQL", "查询：\n``", "`sql\nSELECT department, COUNT(*) ",
+    "FROM employees GROUP BY department\n`", "``\n研发部有", "8人，占比最高。",
+    "其中`COUNT(*", ")`统计的是在职员工。"
+]
+
+
+def run_filter(chunks):
+    response_filter = StreamingResponseFilter()
+    return "".join(response_filter.feed(chunk) for chunk in chunks) + response_filter.finish()
+
+
+def test_fenced_reply_split_across_chunks():
+    """跨片段的代码块标记、代码块内容、内联代码和说明语句都被去掉"""
+    text = run_filter(FENCED_REPLY)
+    assert text == "研发部有8人，占比最高。其中统计的是在职员工。"
+    assert text == sql_service._clean_response("".join(FENCED_REPLY))
+
+
+def test_code_is_never_emitted_before_the_fence_closes():
+    """代码块闭合前不输出其中任何文字"""
+    response_filter = StreamingResponseFilter()
+    emitted = [response_filter.feed(chunk) for chunk in FENCED_REPLY[:4]]
+    assert "".join(emitted) == ""
+    assert "SELECT" not in "".join(emitted)
+
+
+@pytest.mark.parametrize("chunks, expected", [
+    (["研发部有8人。", "市场部有3人。"], "研发部有8人。市场部有3人。"),
+    # 没有闭合的内联反引号原样输出
+    (["单个`符号"], "单个`符号"),
+    # 没有闭合的代码块丢弃
+    (["结论如下。\n", "```sql\nSELECT *"], "结论如下。\n"),
+])
+def test_plain_and_unterminated_text(chunks, expected):
+    assert run_filter(chunks) == expected
+
+
+def test_stream_sql_response_filters_model_tokens(monkeypatch):
+    """SQL服务的流式回复与非流式回复一样不显示SQL"""
+    async def generate(question, snapshot, context):
+        return question, "SELECT department, COUNT(*) FROM employees GROUP BY department", None
+
+    async def execute(sql_query, question, snapshot, cache_key=None):
+        return sql_query, [{"department": "研发部", "COUNT(*)": 8}] * 20
+
+    async def stream(messages, model_type="default"):
+        for chunk in FENCED_REPLY:
+            yield chunk
+
+    monkeypatch.setattr(sql_service, "_generate_or_reuse_sql", generate)
+    monkeypatch.setattr(sql_service, "_execute_with_repair", execute)
+    monkeypatch.setattr(sql_service_module.openrouter_service, "stream_chat_response", stream)
+
+    async def collect():
+        return [event async for event in sql_service.stream_sql_response("研发部员工的学历结构有什么特点")]
+
+    events = asyncio.run(collect())
+    text = "".join(data["text"] for name, data in events if name == "token")
+    assert text == "研发部有8人，占比最高。其中统计的是在职员工。"
@@ -0,0 +1,71 @@
+"""
+SQL索引顾问测试：抽样、在只读连接上记录执行计划、由维护步骤创建索引
+"""
+import sqlite3
+
+import pytest
+
+from app.services.sql_index_advisor import SQLIndexAdvisor
+
+QUERY = "SELECT name FROM employees WHERE department = '研发部' AND gender = '男'"
+
+
+@pytest.fixture
+def connections(tmp_path):
+    """可写连接和只读连接，模拟快照连接池"""
+    path = str(tmp_path / "snapshot.db")
+    writer = sqlite3.connect(path)
+    writer.execute("CREATE TABLE employees (name TEXT, department TEXT, gender TEXT, age INTEGER)")
+    writer.executemany(
+        "INSERT INTO employees VALUES (?, ?, ?, ?)",
+        [(f"员工{i}", f"部门{i % 7}", "男" if i % 2 else "女", 20 + i % 30) for i in range(200)]
+    )
+    writer.commit()
+    reader = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    reader.execute("PRAGMA query_only = ON")
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def auto_indexes(conn):
+    return [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_auto_%'"
+    )]
+
+
+def test_observe_queues_index_without_creating_it(connections):
+    """记录执行计划只在只读连接上进行，达到阈值后加入待建列表而不建索引"""
+    writer, reader = connections
+    advisor = SQLIndexAdvisor(min_scans=2, sample_rate=1)
+
+    assert advisor.observe(reader, QUERY) is None
+    signature = advisor.observe(reader, QUERY)
+    assert signature == ('"department"', '"gender"')
+    assert auto_indexes(writer) == []
+    assert advisor.report()["pending"] == [list(signature)]
+
+    created = advisor.apply_pending(writer)
+    assert [info["terms"] for info in created] == [['"department"', '"gender"']]
+    assert auto_indexes(writer) == [created[0]["name"]]
+    assert advisor.report()["pending"] == []
+    # 已尝试过的谓词不会再次加入待建列表
+    for _ in range(3):
+        assert advisor.observe(reader, QUERY) is None
+
+
+def test_should_sample_slow_queries_and_one_in_n():
+    """慢查询总是记录，其余每N条记录一条"""
+    advisor = SQLIndexAdvisor(sample_rate=3, slow_query_ms=100)
+    assert [advisor.should_sample(5) for _ in range(6)] == [False, False, True, False, False, True]
+    assert advisor.should_sample(150) is True
+
+
+def test_index_names_do_not_collide_after_truncation():
+    """前缀相同的长索引项生成不同的索引名"""
+    advisor = SQLIndexAdvisor()
+    common = ['"department_normalized"', '"education_normalized"', '"major_category"']
+    first = advisor._index_name(common + ['"age"'])
+    second = advisor._index_name(common + ['"gender"'])
+    assert first != second
+    assert len(first) <= 60 and len(second) <= 60
@@ -0,0 +1,66 @@
+"""
+SQL生成提示构建测试：按问题选取列，提示长度不超过预算
+"""
+import re
+
+import pytest
+
+from app.services.sql_prompt_builder import SQLPromptBuilder, estimate_tokens
+
+COLUMNS = [
+    ("id", "INTEGER", "员工ID"),
+    ("name", "TEXT", "员工姓名"),
+    ("gender", "TEXT", "性别（男、女）"),
+    ("age", "INTEGER", "年龄"),
+    ("department", "TEXT", "部门名称"),
+    ("position", "TEXT", "职位"),
+    ("education_level", "TEXT", "学历（本科、硕士、博士等）"),
+    ("university", "TEXT", "毕业院校"),
+    ("major", "TEXT", "专业"),
+    ("hire_date", "TEXT", "入职日期，格式YYYY-MM-DD"),
+    ("total_work_years", "REAL", "工作年限"),
+    ("company_years", "REAL", "司龄"),
+    ("ethnicity", "TEXT", "民族"),
+]
+
+
+def make_schema(columns):
+    return {"employees": {
+        "description": "员工信息表",
+        "columns": [{"name": name, "type": type_, "description": description} for name, type_, description in columns]
+    }}
+
+
+def selected_columns(prompt):
+    """提示中列出的列名"""
+    return re.findall(r"^- (\w+): ", prompt, re.MULTILINE)
+
+
+def test_average_age_question_keeps_schema_small():
+    """平均年龄问题只选取核心列和年龄列，"年龄"不会带出入职日期和工作年限"""
+    prompt = SQLPromptBuilder(make_schema(COLUMNS)).build("研发部员工的平均年龄是多少")
+    assert selected_columns(prompt) == ["name", "department", "age"]
+
+
+def test_year_in_question_selects_hire_date():
+    """问题中提到年份时选取入职日期"""
+    builder = SQLPromptBuilder(make_schema(COLUMNS))
+    assert "hire_date" in selected_columns(builder.build("2017年有哪些人", ["2017"]))
+    assert "hire_date" not in selected_columns(builder.build("工作年限最长的是谁"))
+
+
+def test_core_columns_resolved_from_schema():
+    """示例数据的部门列为department_id，同样作为核心列保留"""
+    columns = [column for column in COLUMNS if column[0] != "department"]
+    columns.append(("department_id", "TEXT", "部门名称"))
+    prompt = SQLPromptBuilder(make_schema(columns)).build("研发部员工的平均年龄是多少")
+    assert selected_columns(prompt) == ["name", "department_id", "age"]
+
+
+@pytest.mark.parametrize("budget", [250, 400, 800])
+def test_prompt_respects_token_budget(budget):
+    """相关列再多，提示也不超过预算，核心列始终保留"""
+    question = "各部门2017年入职的985毕业博士中，男女比例、平均年龄、工作年限、司龄、专业和民族分布如何"
+    prompt = SQLPromptBuilder(make_schema(COLUMNS), token_budget=budget).build(question, ["2017"])
+    assert estimate_tokens(prompt) <= budget
+    assert selected_columns(prompt)[:2] == ["name", "department"]
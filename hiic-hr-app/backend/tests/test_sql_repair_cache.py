@@ -0,0 +1,59 @@
+"""
+SQL执行失败时删除生成该SQL的缓存回复
+"""
+import asyncio
+
+import pytest
+
+from app.services import sql_service as sql_service_module
+from app.services.sql_service import sql_service, SQLQueryError
+
+BROKEN_SQL = "SELECT FROM employees WHERE"
+VALID_SQL = "SELECT COUNT(*) AS total FROM employees"
+
+
+@pytest.fixture
+def evicted(monkeypatch):
+    keys = []
+    monkeypatch.setattr(sql_service_module.openrouter_service, "evict_cached_response", keys.append)
+    return keys
+
+
+def test_successful_sql_keeps_cached_reply(evicted):
+    """执行成功的SQL保留缓存"""
+    sql, results = asyncio.run(sql_service._execute_with_repair(VALID_SQL, "公司有多少人", sql_service.snapshot, "k1"))
+    assert results[0]["total"] > 0
+    assert evicted == []
+
+
+def test_failed_sql_evicts_generation_reply(monkeypatch, evicted):
+    """生成的SQL执行失败时删除其缓存，修复后的SQL成功则保留修复回复"""
+    async def fix(sql_query, error_message, original_question, snapshot=None):
+        return VALID_SQL, "k2"
+
+    monkeypatch.setattr(sql_service, "_attempt_sql_fix", fix)
+    sql, _ = asyncio.run(sql_service._execute_with_repair(BROKEN_SQL, "公司有多少人", sql_service.snapshot, "k1"))
+    assert sql == VALID_SQL
+    assert evicted == ["k1"]
+
+
+def test_failed_fix_evicts_both_replies(monkeypatch, evicted):
+    """修复后的SQL仍然失败时两次回复的缓存都删除"""
+    async def fix(sql_query, error_message, original_question, snapshot=None):
+        return BROKEN_SQL, "k2"
+
+    monkeypatch.setattr(sql_service, "_attempt_sql_fix", fix)
+    with pytest.raises(Exception):
+        asyncio.run(sql_service._execute_with_repair(BROKEN_SQL, "公司有多少人", sql_service.snapshot, "k1"))
+    assert evicted == ["k1", "k2"]
+
+
+def test_unfixable_sql_raises_query_error(monkeypatch, evicted):
+    """无法修复时抛出SQLQueryError"""
+    async def fix(sql_query, error_message, original_question, snapshot=None):
+        return None, None
+
+    monkeypatch.setattr(sql_service, "_attempt_sql_fix", fix)
+    with pytest.raises(SQLQueryError):
+        asyncio.run(sql_service._execute_with_repair(BROKEN_SQL, "公司有多少人", sql_service.snapshot, "k1"))
+    assert evicted == ["k1"]
@@ -0,0 +1,61 @@
+"""
+SQL预检器测试：本地修复常见错误
+"""
+import sqlite3
+
+import pytest
+
+from app.services.sql_validator import SQLValidator, SQLValidationError, load_catalog
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE employees (name TEXT, gender TEXT, age INTEGER, department TEXT, "
+                 "position TEXT, education_level TEXT, hire_date TEXT)")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def validator(conn):
+    return SQLValidator(load_catalog(conn))
+
+
+def test_valid_sql_passes_unchanged(conn, validator):
+    sql = "SELECT COUNT(*) FROM employees WHERE gender = '男'"
+    assert validator.preflight(conn, sql + ";") == sql
+    assert validator.stats()["passed"] == 1
+
+
+def test_repairs_column_alias(conn, validator):
+    """列名别名映射到实际列"""
+    sql = validator.preflight(conn, "SELECT dept, COUNT(*) FROM employees GROUP BY dept")
+    assert sql == "SELECT department, COUNT(*) FROM employees GROUP BY department"
+    assert validator.stats()["repair_kinds"] == {"column_alias": 1}
+
+
+def test_repairs_qualified_and_chinese_columns(conn, validator):
+    """带表别名的列和中文列名都能修复，字符串字面量保持不变"""
+    sql = validator.preflight(conn, "SELECT e.title, 姓名 FROM employees e WHERE e.title = 'title'")
+    assert sql == "SELECT e.position, name FROM employees e WHERE e.position = 'title'"
+    assert validator.stats()["repair_kinds"] == {"column_alias": 2}
+
+
+def test_repairs_table_alias(conn, validator):
+    sql = validator.preflight(conn, "SELECT name FROM staff")
+    assert sql == "SELECT name FROM employees"
+
+
+def test_repairs_full_width_punctuation(conn, validator):
+    """全角标点和全角引号替换为半角，字面量中的全角标点不变"""
+    sql = validator.preflight(conn, "SELECT name，age FROM employees WHERE department = ‘研发部（一）’；")
+    assert sql == "SELECT name,age FROM employees WHERE department = '研发部（一）'"
+    assert validator.stats()["repair_kinds"] == {"punctuation": 1}
+
+
+def test_unknown_column_is_rejected(conn, validator):
+    """无法映射的列交给大模型修复"""
+    with pytest.raises(SQLValidationError, match="no such column"):
+        validator.preflight(conn, "SELECT salary FROM employees")
+    assert validator.stats()["rejected"] == 1
@@ -0,0 +1,69 @@
+"""
+有界LRU缓存测试：按访问顺序淘汰，超过存活时间失效
+"""
+import pytest
+
+from app.utils import ttl_cache
+from app.utils.ttl_cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控的时钟"""
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_evicts_least_recently_used(clock):
+    """超过上限时淘汰最久未访问的条目，读取会刷新访问顺序"""
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_overwrite_does_not_evict(clock):
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 10)
+    assert cache.get("a") == 10 and cache.get("b") == 2
+    assert cache.stats()["evictions"] == 0
+
+
+def test_entries_expire_after_ttl(clock):
+    """超过存活时间的条目读取时失效并被删除"""
+    cache = TTLCache(max_entries=10, ttl_seconds=60)
+    cache.set("a", 1)
+    clock[0] += 59
+    assert cache.get("a") == 1
+
+    clock[0] += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+
+
+def test_items_skip_expired_and_keep_restored_expiry(clock):
+    """从持久化文件恢复的条目沿用原过期时间，items只返回未过期的条目"""
+    cache = TTLCache(max_entries=10, ttl_seconds=60)
+    cache.set("old", 1, expires_at=clock[0] + 5)
+    cache.set("new", 2)
+    clock[0] += 10
+    assert [(key, value) for key, value, _ in cache.items()] == [("new", 2)]
+    assert cache.get("old") is None
+
+
+def test_non_positive_ttl_never_expires(clock):
+    cache = TTLCache(max_entries=10, ttl_seconds=0)
+    cache.set("a", 1)
+    clock[0] += 10 ** 9
+    assert cache.get("a") == 1